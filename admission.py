@@ -0,0 +1,170 @@
+"""
+Admission control for the endpoints that call paid upstream APIs (/ask, /generate-image).
+
+Every request reserves tokens from two token buckets kept in the shared cache, so the limits
+hold across all worker processes:
+
+- a per-client bucket (CLIENT_RATE per second, CLIENT_BURST deep): one client cannot take
+  more than its share, however fast it sends
+- a global bucket (GLOBAL_RATE, GLOBAL_BURST): the upstream quota of the whole server
+
+A request whose reservation is due within ADMISSION_MAX_WAIT seconds waits for it, as long as
+fewer than ADMISSION_QUEUE_SIZE requests of this process are already waiting. Anything else is
+answered at once with 429 and a Retry-After header, without touching the model.
+
+A rejected bucket cannot admit anything before its debt is paid off (tokens only refill with
+time), so each process remembers that moment and turns away further requests for the same
+bucket without a round trip to the shared cache. A flooding client is thus rejected for the
+cost of a dictionary lookup.
+"""
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+
+from shared_cache import shared_cache
+
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', '1') != '0'
+
+CLIENT_RATE = float(os.getenv('CLIENT_RATE', '0.5'))
+CLIENT_BURST = float(os.getenv('CLIENT_BURST', '5'))
+GLOBAL_RATE = float(os.getenv('GLOBAL_RATE', '10'))
+GLOBAL_BURST = float(os.getenv('GLOBAL_BURST', '20'))
+
+# An image generation counts as this many questions
+IMAGE_REQUEST_COST = float(os.getenv('IMAGE_REQUEST_COST', '5'))
+
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', '5'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '64'))
+
+# Clients are told apart by their address, or by this request header when set
+# (e.g. X-Forwarded-For behind a trusted proxy, or an API client id)
+ADMISSION_CLIENT_HEADER = os.getenv('ADMISSION_CLIENT_HEADER', '')
+
+_cooldowns = {}  # bucket key -> time.time() before which its reservations cannot fit
+_cooldowns_lock = threading.Lock()
+MAX_COOLDOWNS = 10000
+
+_stats_lock = threading.Lock()
+_stats = {
+    "admitted": 0,
+    "fast_rejections": 0,
+    "queued": 0,
+    "rejected_client": 0,
+    "rejected_global": 0,
+    "rejected_queue_full": 0,
+    "waiting": 0,
+    "max_waiting": 0,
+    "wait_seconds": 0.0
+}
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def client_id():
+    if ADMISSION_CLIENT_HEADER:
+        value = request.headers.get(ADMISSION_CLIENT_HEADER, '').split(',')[0].strip()
+        if value:
+            return value
+    return request.remote_addr or 'unknown'
+
+def _cooldown_remaining(keys):
+    """Longest remaining cooldown of these buckets and the bucket it belongs to."""
+    now = time.time()
+    with _cooldowns_lock:
+        return max(((_cooldowns.get(key, 0) - now, key) for key in keys), key=lambda item: item[0])
+
+def _set_cooldown(key, seconds):
+    now = time.time()
+    with _cooldowns_lock:
+        if len(_cooldowns) >= MAX_COOLDOWNS:
+            for stale in [k for k, until in _cooldowns.items() if until <= now]:
+                del _cooldowns[stale]
+        _cooldowns[key] = max(_cooldowns.get(key, 0), now + seconds)
+
+def _reason(key):
+    return "client" if key.startswith("client:") else "global"
+
+def admit(client, cost=1.0):
+    """Wait for this request's turn, or raise Rejected when it cannot be served soon enough."""
+    client_key = f"client:{client}"
+    remaining, key = _cooldown_remaining([client_key, "global"])
+    if remaining > 0:
+        reason = _reason(key)
+        with _stats_lock:
+            _stats["fast_rejections"] += 1
+            _stats[f"rejected_{reason}"] += 1
+        raise Rejected(reason, max(1, math.ceil(remaining)))
+
+    with _stats_lock:
+        queue_full = _stats["waiting"] >= ADMISSION_QUEUE_SIZE
+    # With a full queue only requests that need no waiting get in
+    max_wait = 0.0 if queue_full else ADMISSION_MAX_WAIT
+
+    admitted, wait, limiting_key = shared_cache.take_tokens(
+        [(client_key, CLIENT_RATE, CLIENT_BURST), ("global", GLOBAL_RATE, GLOBAL_BURST)],
+        cost=cost, max_wait=max_wait
+    )
+
+    if not admitted:
+        if queue_full and wait <= ADMISSION_MAX_WAIT:
+            reason = "queue_full"
+        else:
+            reason = _reason(limiting_key)
+            _set_cooldown(limiting_key, wait)
+        with _stats_lock:
+            _stats[f"rejected_{reason}"] += 1
+        raise Rejected(reason, max(1, math.ceil(wait)))
+
+    if wait > 0:
+        with _stats_lock:
+            _stats["queued"] += 1
+            _stats["waiting"] += 1
+            _stats["max_waiting"] = max(_stats["max_waiting"], _stats["waiting"])
+            _stats["wait_seconds"] += wait
+        try:
+            time.sleep(wait)
+        finally:
+            with _stats_lock:
+                _stats["waiting"] -= 1
+
+    with _stats_lock:
+        _stats["admitted"] += 1
+
+def admission_controlled(cost=1.0):
+    """Route decorator: admit the request through the token buckets or answer 429."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if ADMISSION_CONTROL:
+                try:
+                    admit(client_id(), cost)
+                except Rejected as e:
+                    message = ("Too many requests from this client" if e.reason == "client"
+                               else "The server is busy, try again shortly")
+                    response = jsonify({"error": message, "reason": e.reason, "retry_after": e.retry_after})
+                    response.headers['Retry-After'] = str(e.retry_after)
+                    return response, 429
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_admission_stats():
+    with _stats_lock:
+        stats = dict(_stats, wait_seconds=round(_stats["wait_seconds"], 3))
+    return dict(
+        stats,
+        enabled=ADMISSION_CONTROL,
+        client_rate=CLIENT_RATE,
+        client_burst=CLIENT_BURST,
+        global_rate=GLOBAL_RATE,
+        global_burst=GLOBAL_BURST,
+        max_wait=ADMISSION_MAX_WAIT,
+        queue_size=ADMISSION_QUEUE_SIZE
+    )
@@ -0,0 +1,249 @@
+"""
+Off-peak pre-warming of the answer cache with standard per-slide explanations.
+
+After a presentation is ingested (and every PREWARM_INTERVAL seconds for the whole library),
+each slide gets the answer to "Explain this slide." and, on slides with math content, to
+"Walk me through the formulas on this slide." generated ahead of time. Questions a student
+types that mean the same (e.g. "can you explain this page?") are mapped onto these templates
+by /ask, so the first student on a slide is answered from the cache instead of waiting on the
+model.
+
+The work never competes with students: a model call is only made once this process has had
+no interactive request for PREWARM_QUIET_SECONDS, and at most PREWARM_CALLS_PER_HOUR calls are
+made across all worker processes (a token bucket in the shared cache). Workers claim each
+slide in the shared cache, so no slide is generated twice.
+"""
+import os
+import re
+import threading
+import time
+
+from shared_cache import shared_cache
+from work_scheduler import scheduler
+
+PREWARM = os.getenv('PREWARM', '1') != '0'
+PREWARM_FORMULAS = os.getenv('PREWARM_FORMULAS', '1') != '0'
+
+# Model calls per hour spent on pre-warming, shared by all worker processes
+PREWARM_CALLS_PER_HOUR = float(os.getenv('PREWARM_CALLS_PER_HOUR', '200'))
+
+# Seconds without interactive requests before a pre-warm call is made
+PREWARM_QUIET_SECONDS = float(os.getenv('PREWARM_QUIET_SECONDS', '10'))
+
+# Seconds between scans of the whole library for slides that are not pre-warmed
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', '1800'))
+
+# Pre-warmed answers are tied to the deck version, so they can be kept longer than asked ones
+PREWARM_TTL = int(os.getenv('PREWARM_TTL', str(7 * 24 * 3600)))
+
+# Seconds a claimed slide stays reserved for the worker generating it
+PREWARM_CLAIM_TTL = 300
+
+EXPLAIN_QUESTION = "Explain this slide."
+FORMULAS_QUESTION = "Walk me through the formulas on this slide."
+
+# Phrasings (after normalize_question) that ask for one of the standard answers
+TEMPLATE_ALIASES = {
+    EXPLAIN_QUESTION: [
+        "explain this slide", "explain slide", "explain this", "explain", "explain this slide to",
+        "explain what this slide says", "explain what this slide shows", "explain this slide in detail",
+        "what does this slide mean", "what does this slide show", "what does this slide say",
+        "what is this slide about", "what is on this slide", "summarize this slide", "summarise this slide",
+        "help understand this slide", "i don t understand this slide"
+    ],
+    FORMULAS_QUESTION: [
+        "walk through the formulas on this slide", "walk through the formula on this slide",
+        "explain the formula", "explain the formulas", "explain this formula", "explain these formulas",
+        "explain the formula on this slide", "explain the formulas on this slide",
+        "explain the math on this slide", "explain the math", "what do the formulas mean",
+        "what does this formula mean", "what do the formulas on this slide mean"
+    ]
+}
+
+_FILLER_WORDS = {"please", "can", "could", "would", "you", "me", "us", "the", "a", "quickly", "briefly"}
+_SYNONYMS = {"page": "slide", "pages": "slides", "equation": "formula", "equations": "formulas",
+             "maths": "math", "mathematics": "math", "formulae": "formulas"}
+
+def normalize_question(question):
+    words = re.sub(r"[^\w\s]", " ", (question or "").lower()).split()
+    return " ".join(_SYNONYMS.get(word, word) for word in words if word not in _FILLER_WORDS)
+
+_TEMPLATES = {normalize_question(alias): question
+              for question, aliases in TEMPLATE_ALIASES.items() for alias in aliases + [question]}
+
+def template_question(question):
+    """The standard question this one asks for (about the selected slide), or None."""
+    return _TEMPLATES.get(normalize_question(question))
+
+def slide_templates(slide):
+    questions = [EXPLAIN_QUESTION]
+    if PREWARM_FORMULAS and slide.get("has_math_content"):
+        questions.append(FORMULAS_QUESTION)
+    return questions
+
+class AnswerPrewarmer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = []  # presentations waiting to be pre-warmed, in order
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stats = {
+            "generated": 0,
+            "already_cached": 0,
+            "claimed_elsewhere": 0,
+            "failed": 0,
+            "budget_waits": 0,
+            "idle_wait_seconds": 0.0,
+            "generation_seconds": 0.0,
+            "template_requests": 0,
+            "template_hits": 0
+        }
+
+    def start(self):
+        """Start the background thread of this process (once; again after a fork)."""
+        if not PREWARM or (self._pid == os.getpid() and self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="answer-prewarm", daemon=True)
+            self._thread.start()
+
+    def schedule(self, filename):
+        """Queue a presentation (e.g. right after ingest)."""
+        if not PREWARM:
+            return
+        with self._lock:
+            if filename not in self._queue:
+                self._queue.append(filename)
+        self.start()
+        self._wakeup.set()
+
+    def record_lookup(self, hit):
+        """Count an /ask that matched a template, and whether the answer was waiting in the cache."""
+        if threading.current_thread() is self._thread:
+            return  # the pre-warming itself
+        with self._lock:
+            self._stats["template_requests"] += 1
+            self._stats["template_hits"] += bool(hit)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _run(self):
+        next_scan = time.time() + PREWARM_QUIET_SECONDS
+        while True:
+            if time.time() >= next_scan:
+                self._scan_library()
+                next_scan = time.time() + PREWARM_INTERVAL
+            with self._lock:
+                filename = self._queue.pop(0) if self._queue else None
+            if filename is None:
+                self._wakeup.wait(max(0.0, next_scan - time.time()))
+                self._wakeup.clear()
+                continue
+            try:
+                self.prewarm_presentation(filename)
+            except Exception as e:
+                print(f"Pre-warming {filename} failed: {e}")
+
+    def _scan_library(self):
+        from app import UPLOAD_FOLDER
+
+        for name in sorted(os.listdir(UPLOAD_FOLDER)):
+            if name.endswith('_slides.json'):
+                with self._lock:
+                    filename = name[:-len('_slides.json')]
+                    if filename not in self._queue:
+                        self._queue.append(filename)
+
+    def _wait_until_quiet(self):
+        started = time.time()
+        while scheduler.idle_seconds() < PREWARM_QUIET_SECONDS:
+            time.sleep(max(0.5, PREWARM_QUIET_SECONDS - scheduler.idle_seconds()))
+        self._count("idle_wait_seconds", time.time() - started)
+
+    def _take_budget(self):
+        """Wait for a call from the shared hourly budget."""
+        rate = PREWARM_CALLS_PER_HOUR / 3600
+        while True:
+            admitted, wait, _ = shared_cache.take_tokens([("prewarm", rate, PREWARM_CALLS_PER_HOUR)])
+            if admitted:
+                time.sleep(wait)
+                return
+            self._count("budget_waits")
+            time.sleep(min(wait, 60))
+
+    def prewarm_presentation(self, filename):
+        """Generate the missing standard answers of one presentation; returns the number generated."""
+        from app import load_question_deck, deck_presentation, deck_answer_key, answer_from_deck
+
+        deck = load_question_deck(filename)
+        if deck is None:
+            return 0
+        generated = 0
+        for slide in deck_presentation(deck).get("slides", []):
+            for question in slide_templates(slide):
+                key = deck_answer_key(deck, question, slide["slide_number"], True)
+                if shared_cache.get("answers", key) is not None:
+                    self._count("already_cached")
+                    continue
+                if not shared_cache.claim("prewarm_claims", key, ttl=PREWARM_CLAIM_TTL):
+                    self._count("claimed_elsewhere")
+                    continue
+                self._wait_until_quiet()
+                self._take_budget()
+                started = time.perf_counter()
+                answer, cached = answer_from_deck(deck, question, slide["slide_number"], True, ttl=PREWARM_TTL)
+                if answer.startswith("Error:"):
+                    self._count("failed")
+                    shared_cache.delete("prewarm_claims", key)
+                elif not cached:
+                    generated += 1
+                    self._count("generated")
+                    self._count("generation_seconds", time.perf_counter() - started)
+        self.record_coverage(filename, deck)
+        if generated:
+            print(f"Pre-warmed {generated} answers for {filename}")
+        return generated
+
+    def record_coverage(self, filename, deck=None):
+        """Store how many of the presentation's standard answers are cached (for /metrics)."""
+        from app import load_question_deck, deck_presentation, deck_answer_key
+
+        deck = deck or load_question_deck(filename)
+        if deck is None:
+            shared_cache.delete("prewarm_coverage", filename)
+            return
+        total = covered = 0
+        for slide in deck_presentation(deck).get("slides", []):
+            for question in slide_templates(slide):
+                total += 1
+                covered += shared_cache.get("answers", deck_answer_key(deck, question, slide["slide_number"], True)) is not None
+        shared_cache.set("prewarm_coverage", filename, {"answers": total, "cached": covered})
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            queued = list(self._queue)
+        coverage = shared_cache.values("prewarm_coverage")
+        total = sum(entry["answers"] for entry in coverage)
+        covered = sum(entry["cached"] for entry in coverage)
+        avg_generation = stats["generation_seconds"] / stats["generated"] if stats["generated"] else 0.0
+        return dict(
+            stats,
+            enabled=PREWARM,
+            queued=queued,
+            idle_wait_seconds=round(stats["idle_wait_seconds"], 1),
+            generation_seconds=round(stats["generation_seconds"], 1),
+            coverage={"presentations": len(coverage), "answers": total, "cached": covered,
+                      "percent": round(100 * covered / total, 1) if total else 0.0},
+            hit_rate=round(stats["template_hits"] / stats["template_requests"], 3) if stats["template_requests"] else 0.0,
+            # Model latency a hit avoided, estimated from the pre-warm calls of this process
+            saved_seconds=round(stats["template_hits"] * avg_generation, 1)
+        )
+
+prewarmer = AnswerPrewarmer()
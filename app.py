@@ -1,1042 +1,1651 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
-from pptx import Presentation
-from dotenv import load_dotenv
-from google import genai
-import subprocess
-import base64
-import os
-import json
-import time
-import requests
-import re
-from pdf_processor import extract_text_from_pdf, save_extracted_pdf_text, save_enhanced_pdf_extraction, detect_math_content
-import fitz  # PyMuPDF for more advanced PDF processing
-
-# Load environment variables
-load_dotenv()
-
-app = Flask(__name__)
-UPLOAD_FOLDER = 'slides'
-ORIGINAL_FILES_FOLDER = 'original_files'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(ORIGINAL_FILES_FOLDER, exist_ok=True)
-
-# Configure Gemini AI
-os.environ["API_KEY"] = os.getenv("API_KEY")  # Ensure API_KEY is set in your .env file
-client = genai.Client(api_key=os.environ["API_KEY"])
-
-model = "gemini-2.0-flash"
-
-# Stability AI API
-STABILITY_API_KEY = os.getenv('STABILITY_API_KEY')
-if not STABILITY_API_KEY:
-    print("Warning: Missing STABILITY_API_KEY in .env - image generation will not work")
-
-def extract_text_from_pptx(file_path):
-    prs = Presentation(file_path)
-    slides = []
-
-    for idx, slide in enumerate(prs.slides, start=1):
-        slide_data = {
-            "slide_number": idx,
-            "title": "",
-            "content": [],
-            "notes": "",
-            "text": ""
-        }
-        
-        # First pass: extract the title if it exists
-        for shape in slide.shapes:
-            try:
-                if hasattr(shape, 'text') and shape.text.strip():
-                    if hasattr(shape, 'is_placeholder') and shape.is_placeholder:
-                        if shape.placeholder_format.type == 1:  # Title placeholder
-                            slide_data["title"] = shape.text.strip()
-                            break  # Found the title, exit the loop
-            except AttributeError:
-                continue
-        
-        # Second pass: extract all content including the title
-        for shape in slide.shapes:
-            try:
-                if hasattr(shape, 'text') and shape.text.strip():
-                    # Add all text content
-                    slide_data["content"].append(shape.text.strip())
-            except AttributeError:
-                if hasattr(shape, 'text') and shape.text.strip():
-                    slide_data["content"].append(shape.text.strip())
-        
-        # Get slide notes if they exist
-        try:
-            if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text.strip():
-                slide_data["notes"] = slide.notes_slide.notes_text_frame.text.strip()
-        except AttributeError:
-            pass
-
-        # Combine all text with title at the beginning
-        slide_data["text"] = (
-            (slide_data["title"] + "\n" if slide_data["title"] else "") +
-            "\n".join(slide_data["content"])
-        ).strip()
-
-        slides.append(slide_data)
-
-    return slides
-
-def convert_ppt_to_pptx(ppt_path):
-    try:
-        # Full path to soffice.exe (change this if needed)
-        soffice_path = r"C:\Program Files\LibreOffice\program\soffice.exe"
-        
-        # Run the command and print the output for debugging
-        result = subprocess.run([
-            soffice_path, '--headless', '--convert-to', 'pptx',
-            ppt_path, '--outdir', os.path.dirname(ppt_path)
-        ], check=True, capture_output=True, text=True)
-        
-        # Print the output for debugging
-        print("Conversion output:", result.stdout)
-        print("Conversion error:", result.stderr)
-        
-        pptx_path = ppt_path.rsplit('.', 1)[0] + '.pptx'
-        
-        if os.path.exists(pptx_path):
-            return pptx_path
-        return None
-    except Exception as e:
-        print("Conversion failed:", e)
-        return None
-
-def save_extracted_text(slide_data, filename):
-    # Create a JSON object that contains all slides
-    presentation_data = {
-        "filename": filename,
-        "total_slides": len(slide_data),
-        "extraction_time": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "slides": slide_data
-    }
-    
-    # Save to a single JSON file
-    with open(f'slides/{filename}_slides.json', 'w', encoding='utf-8') as f:
-        json.dump(presentation_data, f, indent=2)
-
-# Helper function to process slide references
-def process_slide_references(text):
-    # Process multiple patterns for slide ranges with different formats
-    
-    # Pattern: "Slides X-Y" (like "Slides 8-18" or "Slides 10-13")
-    text = re.sub(
-        r'Slides (\d+)-(\d+)', 
-        r'<a href="#slide-range" data-range="\1-\2">Slides \1-\2</a>', 
-        text
-    )
-    
-    # Pattern for Pages instead of Slides
-    text = re.sub(
-        r'Pages (\d+)-(\d+)', 
-        r'<a href="#slide-range" data-range="\1-\2">Pages \1-\2</a>', 
-        text
-    )
-    
-    # Pattern: "Slide X to Y" (handle another possible format)
-    text = re.sub(
-        r'Slide (\d+) to (\d+)', 
-        r'<a href="#slide-range" data-range="\1-\2">Slides \1 to \2</a>', 
-        text
-    )
-    
-    # Pattern: "Page X to Y"
-    text = re.sub(
-        r'Page (\d+) to (\d+)', 
-        r'<a href="#slide-range" data-range="\1-\2">Pages \1 to \2</a>', 
-        text
-    )
-    
-    # Pattern: "Slides X and Y" (not a range, but individual slides)
-    text = re.sub(
-        r'Slides (\d+) and (\d+)(?!\d)', 
-        r'<a href="#slide-\1">Slide \1</a> and <a href="#slide-\2">Slide \2</a>', 
-        text
-    )
-    
-    # Pattern: "Pages X and Y"
-    text = re.sub(
-        r'Pages (\d+) and (\d+)(?!\d)', 
-        r'<a href="#slide-\1">Page \1</a> and <a href="#slide-\2">Page \2</a>', 
-        text
-    )
-    
-    # Handle capitalization variations like "slide" instead of "Slide"
-    text = re.sub(
-        r'slide (\d+)', 
-        r'<a href="#slide-\1">Slide \1</a>', 
-        text,
-        flags=re.IGNORECASE
-    )
-    
-    # Handle "page" instead of "Page"
-    text = re.sub(
-        r'page (\d+)', 
-        r'<a href="#slide-\1">Page \1</a>', 
-        text,
-        flags=re.IGNORECASE
-    )
-
-    # Process individual slide references - must come last
-    text = re.sub(
-        r'Slide (\d+)', 
-        r'<a href="#slide-\1">Slide \1</a>', 
-        text
-    )
-    
-    # Process individual page references
-    text = re.sub(
-        r'Page (\d+)', 
-        r'<a href="#slide-\1">Page \1</a>', 
-        text
-    )
-    
-    return text
-        
-# Update the call_gemini function to include visual elements from PDFs
-def call_gemini(question, context, slide_number=None, include_visual_elements=True):
-    try:
-        slides = context.get("slides", [])
-        has_visual_references = False
-        visual_elements_context = ""
-        image_data_to_include = []
-
-        if slide_number is not None:
-            # If a specific slide is selected, only use that slide's content
-            slide_data = next((slide for slide in slides if slide["slide_number"] == slide_number), None)
-            if slide_data:
-                context_text = slide_data["text"]
-                
-                # Check if this is from an enhanced PDF with visual elements
-                if include_visual_elements and context.get("images"):
-                    # Get images for this page/slide
-                    page_images = [img for img in context.get("images", []) if img["page"] == slide_number]
-                    
-                    if page_images:
-                        has_visual_references = True
-                        visual_elements_context = "\nVisual Elements on this page:\n"
-                        
-                        # Create detailed descriptions of each image
-                        for i, image in enumerate(page_images):
-                            image_desc = f"Image {i+1}: "
-                            if "width" in image and "height" in image:
-                                image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
-                            image_desc += f"Located on page {slide_number}. "
-                            
-                            # Store image data for direct inclusion
-                            image_data_to_include.append({
-                                "image_number": i+1,
-                                "data_uri": image.get("data_uri", ""),
-                                "description": image_desc
-                            })
-                            
-                            visual_elements_context += f"- {image_desc}\n"
-                
-                # Also check for formulas
-                if include_visual_elements and context.get("formulas"):
-                    page_formulas = [f for f in context.get("formulas", []) if f["page"] == slide_number]
-                    if page_formulas:
-                        has_visual_references = True
-                        if not visual_elements_context:
-                            visual_elements_context = "\nVisual Elements on this page:\n"
-                        
-                        visual_elements_context += "Mathematical formulas:\n"
-                        for i, formula in enumerate(page_formulas):
-                            visual_elements_context += f"- Formula {i+1}: {formula['text']}\n"
-                
-                scope_notice = f"Answer based on content from Slide/Page {slide_number}:"
-            else:
-                context_text = ""
-                scope_notice = f"No content found for Slide/Page {slide_number}."
-        else:
-            # If no specific slide is selected, use all slides' content
-            context_text = "\n\n".join([f"Slide/Page {slide['slide_number']}:\n{slide['text']}" for slide in slides])
-            
-            # Add summary of visual elements for the whole document
-            if include_visual_elements and (context.get("formulas") or context.get("images")):
-                has_visual_references = True
-                visual_elements_context = "\nVisual Elements Summary:\n"
-                
-                if context.get("formulas"):
-                    formula_pages = set(f["page"] for f in context.get("formulas", []))
-                    visual_elements_context += f"- Mathematical formulas found on pages: {', '.join(map(str, sorted(formula_pages)))}\n"
-                
-                if context.get("images"):
-                    image_pages = set(img["page"] for img in context.get("images", []))
-                    total_images = len(context.get("images", []))
-                    visual_elements_context += f"- Total of {total_images} images found, distributed on pages: {', '.join(map(str, sorted(image_pages)))}\n"
-                    
-                    # Add details for each image
-                    for i, image in enumerate(context.get("images", [])[:5]):  # Limit to first 5 images
-                        image_desc = f"Image {i+1}: "
-                        if "width" in image and "height" in image:
-                            image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
-                        image_desc += f"Located on page {image.get('page', 'unknown')}. "
-                        
-                        # Store image data for direct inclusion
-                        image_data_to_include.append({
-                            "image_number": i+1,
-                            "data_uri": image.get("data_uri", ""),
-                            "description": image_desc
-                        })
-                        
-                        visual_elements_context += f"- {image_desc}\n"
-                    
-            scope_notice = "Answer based on content from all slides/pages:"
-
-        # Combine the context with visual elements
-        full_context = context_text
-        if has_visual_references:
-            full_context += visual_elements_context
-
-        # Prepare the multimodal content
-        prompt_parts = [
-            f"""As an AI tutor, please answer this question based on the slide/PDF content:
-
-{scope_notice}
-{full_context}
-
-Question: {question}
-
-Important formatting guidelines:
-1. Do not use asterisks (*) for emphasis. Use HTML tags like <strong> or <em> instead.
-2. When referencing individual slides or pages, use the format "Slide X" or "Page X".
-3. When referencing a range of slides or pages, use the format "Slides X-Y" or "Pages X-Y".
-4. Format any lists as proper HTML lists with <ul> and <li> tags.
-5. Present your answer in clear, well-formatted paragraphs with proper spacing.
-6. When referencing visual elements like formulas or images, be specific about their location.
-7. If the question is about a formula, image, or other visual element, explicitly reference it in your answer."""
-        ]
-        
-        # Include image data directly in the request
-        for img_data in image_data_to_include:
-            if img_data["data_uri"]:
-                # Create multimodal content with both text and image
-                # Format: prompt text, then image data
-                prompt_parts.append({
-                    "inlineData": {
-                        "mimeType": "image/jpeg" if img_data["data_uri"].startswith("data:image/jpeg") else "image/png",
-                        "data": img_data["data_uri"].split(',')[1]  # Extract base64 data
-                    }
-                })
-                prompt_parts.append(f"This is {img_data['description']} Please analyze this image for the answer.")
-        
-        # Check if we have any image data
-        has_images = len(image_data_to_include) > 0
-        
-        # Use different model for image analysis if needed
-        selected_model = "gemini-1.5-pro" if has_images else model
-        
-        print(f"Using model: {selected_model}, Request has images: {has_images}")
-        
-        # Call appropriate Gemini API based on content
-        if has_images:
-            # Use multimodal generation for image content
-            response = client.models.generate_content(
-                model=selected_model,
-                contents=prompt_parts
-            )
-        else:
-            # Use text-only generation
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt_parts[0]  # Just the text prompt
-            )
-
-        processed_text = response.text
-        
-        # Replace any remaining asterisks for emphasis
-        processed_text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_text)
-        processed_text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', processed_text)
-        
-        # Process links to slides and pages
-        processed_text = process_slide_references(processed_text)
-        
-        return processed_text
-
-    except Exception as e:
-        print(f"Gemini API error: {str(e)}")
-        return f"Error: Failed to get response from Gemini. {str(e)}"
-
-# Update the ask_question route in app.py to handle presentation-specific queries with image support for math content
-@app.route('/ask', methods=['POST'])
-def ask_question():
-    data = request.json
-    question = data.get("question")
-    slide_num = data.get("slide_number")  # This can be None if no specific slide is selected
-    filename = data.get("filename")
-    include_visual = data.get("include_visual_elements", True)  # Default to including visual elements
-
-    try:
-        # First check for enhanced PDF data
-        enhanced_file_path = f'slides/{filename}_enhanced.json'
-        standard_file_path = f'slides/{filename}_slides.json'
-        
-        print(f"Processing question about '{filename}', slide: {slide_num}, include_visual: {include_visual}")
-        print(f"Looking for enhanced data at: {enhanced_file_path}")
-        
-        if os.path.exists(enhanced_file_path):
-            # Use enhanced PDF data with visual elements
-            with open(enhanced_file_path, 'r', encoding='utf-8') as f:
-                presentation_data = json.load(f)
-            
-            # Check if we have math content on specific slides
-            math_pages = []
-            if "slides" in presentation_data:
-                math_pages = [slide["slide_number"] for slide in presentation_data["slides"] 
-                             if slide.get("has_math_content", False)]
-                
-            print(f"Detected math content on pages: {math_pages}")
-                
-            # Determine if we need to include page images in the query
-            include_page_images = False
-            page_images_to_include = []
-            
-            if include_visual:
-                if slide_num is not None:
-                    # Check if the specific slide has math content
-                    slide_data = next((slide for slide in presentation_data.get("slides", []) 
-                                     if slide["slide_number"] == slide_num), None)
-                    if slide_data and slide_data.get("has_math_content", False) and slide_data.get("page_image"):
-                        include_page_images = True
-                        page_images_to_include.append({
-                            "page": slide_num,
-                            "image": slide_data["page_image"],
-                            "description": f"Full page {slide_num} containing mathematical content"
-                        })
-                else:
-                    # If searching all slides, include all math-containing pages (up to a reasonable limit)
-                    for slide in presentation_data.get("slides", []):
-                        if slide.get("has_math_content", False) and slide.get("page_image"):
-                            include_page_images = True
-                            # Limit to first 5 pages with math to keep request size reasonable
-                            if len(page_images_to_include) < 5:
-                                page_images_to_include.append({
-                                    "page": slide["slide_number"],
-                                    "image": slide["page_image"],
-                                    "description": f"Full page {slide['slide_number']} containing mathematical content"
-                                })
-            
-            # Call Gemini with the enhanced PDF data, including page images if needed
-            response = call_gemini_with_math_support(question, presentation_data, slide_num, 
-                                                     include_visual, page_images_to_include)
-        elif os.path.exists(standard_file_path):
-            # Fall back to standard text-only data
-            print("Using standard text-only data")
-            with open(standard_file_path, 'r', encoding='utf-8') as f:
-                presentation_data = json.load(f)
-                
-            # Call Gemini with the presentation data (no page images in standard mode)
-            response = call_gemini(question, presentation_data, slide_num, False)
-        else:
-            return jsonify({"error": f"Presentation '{filename}' not found"}), 404
-
-        return jsonify({
-            "question": question,
-            "answer": response,
-            "source_presentation": filename,
-            "has_visual_elements": os.path.exists(enhanced_file_path)
-        })
-    except Exception as e:
-        print(f"Error processing question: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-# New function to handle Gemini calls with math content page images
-def call_gemini_with_math_support(question, context, slide_number=None, include_visual_elements=True, page_images=None):
-    try:
-        slides = context.get("slides", [])
-        has_visual_references = False
-        visual_elements_context = ""
-        image_data_to_include = []
-
-        if slide_number is not None:
-            # If a specific slide is selected, only use that slide's content
-            slide_data = next((slide for slide in slides if slide["slide_number"] == slide_number), None)
-            if slide_data:
-                context_text = slide_data["text"]
-                
-                # Check if this is a page with math content
-                if slide_data.get("has_math_content", False) and include_visual_elements:
-                    has_visual_references = True
-                    visual_elements_context = "\nThis page contains mathematical content that may not be accurately represented as text.\n"
-                
-                # Check if this is from an enhanced PDF with visual elements
-                if include_visual_elements and context.get("images"):
-                    # Get images for this page/slide
-                    page_images = [img for img in context.get("images", []) if img["page"] == slide_number]
-                    
-                    if page_images:
-                        has_visual_references = True
-                        if not visual_elements_context:
-                            visual_elements_context = "\nVisual Elements on this page:\n"
-                        
-                        visual_elements_context += f"- {len(page_images)} images on page {slide_number}\n"
-                        
-                        # Store image data for direct inclusion (limit to first 3 for performance)
-                        for i, image in enumerate(page_images[:3]):
-                            image_desc = f"Image {i+1}: "
-                            if "width" in image and "height" in image:
-                                image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
-                            image_desc += f"Located on page {slide_number}. "
-                            
-                            # Store image data for direct inclusion
-                            image_data_to_include.append({
-                                "image_number": i+1,
-                                "data_uri": image.get("data_uri", ""),
-                                "description": image_desc
-                            })
-                
-                # Also check for formulas
-                if include_visual_elements and context.get("formulas"):
-                    page_formulas = [f for f in context.get("formulas", []) if f["page"] == slide_number]
-                    if page_formulas:
-                        has_visual_references = True
-                        if not visual_elements_context:
-                            visual_elements_context = "\nVisual Elements on this page:\n"
-                        
-                        visual_elements_context += f"- {len(page_formulas)} mathematical formulas detected on page {slide_number}\n"
-                
-                scope_notice = f"Answer based on content from Slide/Page {slide_number}:"
-            else:
-                context_text = ""
-                scope_notice = f"No content found for Slide/Page {slide_number}."
-        else:
-            # If no specific slide is selected, use all slides' content
-            context_text = "\n\n".join([f"Slide/Page {slide['slide_number']}:\n{slide['text']}" for slide in slides])
-            
-            # Add summary of visual elements for the whole document
-            if include_visual_elements:
-                # Check for pages with math content
-                math_pages = [slide["slide_number"] for slide in slides if slide.get("has_math_content", False)]
-                
-                if math_pages:
-                    has_visual_references = True
-                    visual_elements_context = "\nMathematical Content:\n"
-                    visual_elements_context += f"- Mathematical notation detected on pages: {', '.join(map(str, sorted(math_pages)))}\n"
-                
-                # Add info about other visual elements
-                if context.get("formulas") or context.get("images"):
-                    has_visual_references = True
-                    if not visual_elements_context:
-                        visual_elements_context = "\nVisual Elements Summary:\n"
-                    
-                    if context.get("formulas"):
-                        formula_pages = set(f["page"] for f in context.get("formulas", []))
-                        visual_elements_context += f"- Mathematical formulas found on pages: {', '.join(map(str, sorted(formula_pages)))}\n"
-                    
-                    if context.get("images"):
-                        image_pages = set(img["page"] for img in context.get("images", []))
-                        total_images = len(context.get("images", []))
-                        visual_elements_context += f"- Total of {total_images} images found, distributed on pages: {', '.join(map(str, sorted(image_pages)))}\n"
-            
-            scope_notice = "Answer based on content from all slides/pages:"
-
-        # Combine the context with visual elements
-        full_context = context_text
-        if has_visual_references:
-            full_context += visual_elements_context
-
-        # Prepare the multimodal content
-        prompt_parts = [
-            f"""As an AI tutor, please answer this question based on the slide/PDF content:
-
-{scope_notice}
-{full_context}
-
-Question: {question}
-
-Important notes:
-1. Some pages contain mathematical notation and formulas that might not be accurately represented as text.
-2. I will provide images of pages with mathematical content to help you understand the notation correctly.
-3. Please analyze both the text and the page images to provide an accurate answer.
-
-Important formatting guidelines:
-1. Do not use asterisks (*) for emphasis. Use HTML tags like <strong> or <em> instead.
-2. When referencing individual slides or pages, use the format "Slide X" or "Page X".
-3. When referencing a range of slides or pages, use the format "Slides X-Y" or "Pages X-Y".
-4. Format any lists as proper HTML lists with <ul> and <li> tags.
-5. Present your answer in clear, well-formatted paragraphs with proper spacing.
-6. When referencing mathematical formulas, describe them accurately based on the page images."""
-        ]
-        
-        # If we have specific page images for math content, prioritize those
-        if page_images:
-            for img_data in page_images:
-                if "image" in img_data and img_data["image"]:
-                    # Determine image MIME type
-                    mime_type = "image/png"  # Default
-                    if img_data["image"].startswith("data:image/jpeg"):
-                        mime_type = "image/jpeg"
-                    elif img_data["image"].startswith("data:image/png"):
-                        mime_type = "image/png"
-                        
-                    # Extract base64 data
-                    base64_data = img_data["image"].split(',')[1] if ',' in img_data["image"] else img_data["image"]
-                    
-                    # Add the image to prompt parts
-                    prompt_parts.append({
-                        "inlineData": {
-                            "mimeType": mime_type,
-                            "data": base64_data
-                        }
-                    })
-                    prompt_parts.append(f"This is page {img_data['page']} containing mathematical content. Please analyze the mathematical notation in this image.")
-        
-        # Include other images if needed and we haven't already added too many
-        elif len(image_data_to_include) > 0:
-            for img_data in image_data_to_include[:3]:  # Limit to 3 images
-                if img_data["data_uri"]:
-                    # Create multimodal content with both text and image
-                    # Format: prompt text, then image data
-                    prompt_parts.append({
-                        "inlineData": {
-                            "mimeType": "image/jpeg" if img_data["data_uri"].startswith("data:image/jpeg") else "image/png",
-                            "data": img_data["data_uri"].split(',')[1]  # Extract base64 data
-                        }
-                    })
-                    prompt_parts.append(f"This is {img_data['description']} Please analyze this image for the answer.")
-        
-        # Check if we have any image data
-        has_images = len(page_images) > 0 or len(image_data_to_include) > 0
-        
-        # Use different model for image analysis if needed
-        selected_model = "gemini-1.5-pro" if has_images else model
-        
-        print(f"Using model: {selected_model}, Request has images: {has_images}")
-        
-        # Call appropriate Gemini API based on content
-        if has_images:
-            # Use multimodal generation for image content
-            response = client.models.generate_content(
-                model=selected_model,
-                contents=prompt_parts
-            )
-        else:
-            # Use text-only generation
-            response = client.models.generate_content(
-                model=model,
-                contents=prompt_parts[0]  # Just the text prompt
-            )
-
-        processed_text = response.text
-        
-        # Replace any remaining asterisks for emphasis
-        processed_text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_text)
-        processed_text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', processed_text)
-        
-        # Process links to slides and pages
-        processed_text = process_slide_references(processed_text)
-        
-        return processed_text
-
-    except Exception as e:
-        print(f"Gemini API error: {str(e)}")
-        return f"Error: Failed to get response from Gemini. {str(e)}"
-
-def analyze_math_content_in_pdf(file_path):
-    """
-    Utility function to analyze PDF pages for mathematical content.
-    Helps diagnose false positives and negatives in math content detection.
-    """
-    try:
-        # Open the PDF with PyMuPDF
-        doc = fitz.open(file_path)
-        results = []
-        
-        print(f"Analyzing {file_path} for math content...")
-        print(f"Total pages: {len(doc)}")
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            page_text = page.get_text()
-            
-            # Try different detection methods
-            main_detection = detect_math_content(page_text)
-            
-            # Count math symbols
-            math_symbols = r'[=+\-*/^√∫∑∏πλθ]'
-            symbol_count = len(re.findall(math_symbols, page_text))
-            
-            # Look for Greek letters separately
-            greek_letters = r'[αβγδεζηθικλμνξοπρστυφχψω]'
-            greek_count = len(re.findall(greek_letters, page_text))
-            
-            # Look for equation patterns
-            eq_patterns = r'[a-zA-Z]\s*=\s*[a-zA-Z0-9]'
-            equation_count = len(re.findall(eq_patterns, page_text))
-            
-            # Check for specific formula patterns like λ = 2d Sin θ
-            specific_formulas = any(re.search(r'λ\s*=\s*2d\s*Sin', page_text, re.IGNORECASE))
-            
-            # Get the first few lines to check if it's a title page
-            first_lines = '\n'.join(page_text.split('\n')[:5])
-            is_title_page = bool(re.match(r'^Chapter|^\d+\.\d+\s+[A-Z]', first_lines))
-            
-            # Examine blocks for potential formulas
-            blocks = page.get_text("dict")["blocks"]
-            block_math_count = 0
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        line_text = "".join([span["text"] for span in line["spans"]])
-                        if detect_math_content(line_text):
-                            block_math_count += 1
-            
-            # Compile the results
-            page_result = {
-                "page_number": page_num + 1,
-                "math_detected": main_detection,
-                "symbol_count": symbol_count,
-                "greek_letter_count": greek_count,
-                "equation_count": equation_count,
-                "specific_formulas_found": specific_formulas,
-                "is_title_page": is_title_page,
-                "block_math_count": block_math_count,
-                "first_lines": first_lines,
-                "likely_has_math": (symbol_count > 3) or (greek_count > 0) or (equation_count > 0) or specific_formulas or (block_math_count > 1)
-            }
-            
-            results.append(page_result)
-            
-            # Print a summary
-            print(f"\nPage {page_num + 1}:")
-            print(f"  Math detected: {main_detection}")
-            print(f"  Symbol count: {symbol_count}")
-            print(f"  Greek letters: {greek_count}")
-            print(f"  Equations: {equation_count}")
-            print(f"  Block math count: {block_math_count}")
-            print(f"  First lines: {first_lines[:100]}...")
-            print(f"  CONCLUSION: {'MATH CONTENT' if page_result['likely_has_math'] else 'NO MATH CONTENT'}")
-        
-        return results
-    
-    except Exception as e:
-        print(f"Error analyzing math content: {str(e)}")
-        return []
-
-@app.route('/analyze-math/<path:filename>')
-def analyze_math(filename):
-    """API endpoint to analyze math content detection in a PDF file."""
-    try:
-        # Look for the file in original files folder
-        file_path = os.path.join(ORIGINAL_FILES_FOLDER, filename)
-        if not os.path.exists(file_path):
-            # Try with .pdf extension
-            file_path = os.path.join(ORIGINAL_FILES_FOLDER, f"{filename}.pdf")
-            if not os.path.exists(file_path):
-                return jsonify({"error": f"File not found: {filename}"}), 404
-        
-        # Use the math content analyzer from pdf_processor
-        from pdf_processor import analyze_math_content_in_pdf
-        results = analyze_math_content_in_pdf(file_path)
-        
-        return jsonify({
-            "filename": filename,
-            "total_pages": len(results),
-            "analysis": results
-        })
-    
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-# Add endpoint to reprocess PDFs with the improved detection
-@app.route('/reprocess-pdf/<path:filename>')
-def reprocess_pdf(filename):
-    """Reprocess a PDF file with improved math content detection."""
-    try:
-        # Verify the file exists
-        file_path = os.path.join(ORIGINAL_FILES_FOLDER, filename)
-        if not os.path.exists(file_path):
-            # Try with .pdf extension
-            file_path = os.path.join(ORIGINAL_FILES_FOLDER, f"{filename}.pdf")
-            if not os.path.exists(file_path):
-                return jsonify({"error": f"File not found: {filename}"}), 404
-        
-        # Get the base name without extension
-        basename = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # Import updated functions from pdf_processor
-        from pdf_processor import save_enhanced_pdf_extraction
-        
-        # Reprocess the PDF with enhanced detection
-        result = save_enhanced_pdf_extraction(file_path, basename)
-        
-        if result:
-            return jsonify({
-                "success": True,
-                "filename": basename,
-                "message": f"PDF reprocessed successfully with improved math detection",
-                "math_pages": result.get("math_content_pages", [])
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "filename": basename,
-                "message": "Failed to reprocess PDF"
-            })
-    
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
-
-# This will help pinpoint where the PDF loading is failing
-@app.route('/original-file/<path:filename>')
-def serve_original_file(filename):
-    """
-    Serve the original file from the original files folder.
-    Using path:filename to handle filenames with spaces.
-    """
-    print(f"Requested file: {filename}")
-    print(f"Looking in folder: {ORIGINAL_FILES_FOLDER}")
-    
-    # Check if file exists without extension (the extension might be added by the frontend)
-    base_path = os.path.join(ORIGINAL_FILES_FOLDER, filename)
-    
-    if os.path.exists(base_path):
-        print(f"File found at: {base_path}")
-        return send_file(base_path)
-    
-    # Try with different extension combinations
-    if '.' not in filename:
-        pdf_path = f"{base_path}.pdf"
-        if os.path.exists(pdf_path):
-            print(f"File found at: {pdf_path}")
-            return send_file(pdf_path)
-    
-    # List available files for debugging
-    available_files = os.listdir(ORIGINAL_FILES_FOLDER)
-    print(f"Available files in {ORIGINAL_FILES_FOLDER}: {available_files}")
-    
-    return jsonify({"error": "File not found", "requested": filename}), 404
-
-# Add a route to get visual elements from a PDF
-@app.route('/pdf-visual-elements/<filename>/<int:page>')
-def get_pdf_visual_elements(filename, page):
-    enhanced_file_path = f'slides/{filename}_enhanced.json'
-    
-    if not os.path.exists(enhanced_file_path):
-        return jsonify({"error": "Enhanced PDF data not found"}), 404
-        
-    try:
-        with open(enhanced_file_path, 'r', encoding='utf-8') as f:
-            pdf_data = json.load(f)
-            
-        # Extract formulas and images for the specified page
-        formulas = [f for f in pdf_data.get("formulas", []) if f["page"] == page]
-        images = [img for img in pdf_data.get("images", []) if img["page"] == page]
-        
-        return jsonify({
-            "filename": filename,
-            "page": page,
-            "formulas": formulas,
-            "images": images
-        })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-# Modify the upload route in app.py to ensure files are saved properly and paths are correctly tracked
-@app.route('/upload', methods=['POST'])
-def upload_slide():
-    try:
-        # Accept multiple files
-        uploaded_files = request.files.getlist('files[]')
-        
-        if not uploaded_files:
-            return jsonify({"error": "No files uploaded"}), 400
-        
-        presentations = []
-        
-        # Create folders if they don't exist
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        os.makedirs(ORIGINAL_FILES_FOLDER, exist_ok=True)
-        
-        print(f"Upload folder: {os.path.abspath(UPLOAD_FOLDER)}")
-        print(f"Original files folder: {os.path.abspath(ORIGINAL_FILES_FOLDER)}")
-
-        for file in uploaded_files:
-            if file.filename == '':
-                continue  # Skip empty file inputs
-
-            # Verify file extension - now include PDF
-            if not file.filename.lower().endswith(('.ppt', '.pptx', '.pdf')):
-                continue  # Skip invalid files
-                
-            print(f"Processing uploaded file: {file.filename}")
-
-            # Save original file in the originals folder
-            original_file_path = os.path.join(ORIGINAL_FILES_FOLDER, file.filename)
-            file.save(original_file_path)
-            print(f"Saved original file to: {original_file_path}")
-            
-            # Make sure the file exists where we expect it
-            if not os.path.exists(original_file_path):
-                print(f"WARNING: File not found at expected path: {original_file_path}")
-            else:
-                print(f"Confirmed file exists at: {original_file_path}")
-                print(f"File size: {os.path.getsize(original_file_path)} bytes")
-            
-            # Also save in the slides folder for backward compatibility
-            slides_file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-            with open(original_file_path, 'rb') as f_src:
-                with open(slides_file_path, 'wb') as f_dst:
-                    f_dst.write(f_src.read())
-            print(f"Copied file to slides folder: {slides_file_path}")
-
-            # Process based on file type
-            if file.filename.lower().endswith('.pdf'):
-                # Process PDF file with both standard and enhanced extraction
-                slides = extract_text_from_pdf(original_file_path)
-                if not slides:
-                    continue  # Skip if extraction fails
-                    
-                # Save basic extracted text to JSON for backward compatibility
-                filename = file.filename.rsplit('.', 1)[0]
-                save_extracted_pdf_text(slides, filename)
-                print(f"Saved basic PDF extraction for: {filename}")
-                
-                # Save enhanced PDF extraction with visual elements
-                enhanced_data = save_enhanced_pdf_extraction(original_file_path, filename)
-                print(f"Saved enhanced PDF extraction: {enhanced_data is not None}")
-                
-                # If enhanced extraction was successful, use its slides (which contain more details)
-                if enhanced_data and enhanced_data.get("slides"):
-                    slides = enhanced_data.get("slides")
-                
-            elif file.filename.lower().endswith('.ppt'):
-                # Convert .ppt to .pptx if needed
-                converted_path = convert_ppt_to_pptx(original_file_path)
-                if not converted_path:
-                    continue  # Skip if conversion fails
-                
-                # Extract text from PowerPoint
-                slides = extract_text_from_pptx(converted_path)
-                
-                # Save extracted text to JSON
-                save_extracted_text(slides, file.filename.rsplit('.', 1)[0])
-                
-            else:  # .pptx file
-                # Extract text from PowerPoint
-                slides = extract_text_from_pptx(original_file_path)
-                
-                # Save extracted text to JSON
-                save_extracted_text(slides, file.filename.rsplit('.', 1)[0])
-
-            # Store this presentation's data
-            presentation_data = {
-                "filename": file.filename,  # Keep the full filename with extension
-                "basename": file.filename.rsplit('.', 1)[0],  # Store the base name without extension
-                "slides": slides,
-                "file_type": file.filename.split('.')[-1].lower(),
-                "original_path": original_file_path,
-                "has_enhanced_data": file.filename.lower().endswith('.pdf')  # Only PDFs have enhanced data currently
-            }
-            
-            presentations.append(presentation_data)
-
-        if not presentations:
-            return jsonify({"error": "No valid presentations uploaded"}), 400
-
-        return jsonify({"presentations": presentations})
-        
-    except Exception as e:
-        print(f"Error in upload_slide: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
-    
-@app.route('/generate-image', methods=['POST'])
-def generate_image():
-    """Generate images using Stability AI API."""
-    # Get Stability AI API key from environment
-    STABILITY_API_KEY = os.getenv('STABILITY_API_KEY')
-    
-    if not STABILITY_API_KEY:
-        return jsonify({"error": "Stability AI API key not configured. Set STABILITY_API_KEY in .env file."}), 500
-        
-    try:
-        data = request.get_json()
-        prompt = data.get("prompt")
-
-        if not prompt:
-            return jsonify({"error": "Prompt is required"}), 400
-
-        # Add detailed logging
-        print(f"Sending request to Stability AI API with prompt: {prompt[:50]}...")
-        
-        # Call the Stability AI API with the correct endpoint and format
-        try:
-            response = requests.post(
-                "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
-                headers={
-                    "Authorization": f"Bearer {STABILITY_API_KEY}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                },
-                json={
-                    "text_prompts": [
-                        {
-                            "text": prompt,
-                            "weight": 1
-                        }
-                    ],
-                    "cfg_scale": 7,
-                    "height": 1024,
-                    "width": 1024,
-                    "samples": 1,
-                    "steps": 30
-                },
-                timeout=60  # Add a timeout
-            )
-            
-            # Log the response status
-            print(f"Stability AI API Response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_detail = response.json() if response.headers.get('content-type') == 'application/json' else response.text
-                print(f"Error response: {error_detail}")
-                return jsonify({
-                    "error": "Failed to generate image", 
-                    "details": error_detail,
-                    "status_code": response.status_code
-                }), 500
-            
-            # Parse the JSON response and get the base64 image data
-            response_data = response.json()
-            if "artifacts" in response_data and len(response_data["artifacts"]) > 0:
-                img_data = response_data["artifacts"][0]["base64"]
-                return jsonify({
-                    "prompt": prompt,
-                    "image_base64": f"data:image/png;base64,{img_data}"
-                })
-            else:
-                return jsonify({"error": "No image generated in response"}), 500
-            
-        except requests.RequestException as e:
-            print(f"Request exception: {str(e)}")
-            return jsonify({"error": f"Request failed: {str(e)}"}), 500
-
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
-
-@app.route('/static/<path:path>')
-def send_static(path):
-    return send_from_directory('static', path)
-
-@app.route('/')
-def index():
-    return send_from_directory('templates', 'index.html')
-
-if __name__ == '__main__':
-    app.run(debug=True)
+import time
+_app_import_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_file, g
+from werkzeug.security import safe_join
+from dotenv import load_dotenv
+import subprocess
+import base64
+import os
+import json
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from pdf_processor import extract_text_from_pdf, save_extracted_pdf_text, save_enhanced_pdf_extraction
+from pdf_processor import should_stream_pdf, save_streaming_pdf_extraction, images_on_page, image_page_numbers
+from asset_store import ASSET_FOLDER, resolve_data_uri, asset_url, asset_path
+from shared_cache import shared_cache
+from llm_client import generate_content, outbound_call, fake_image_base64, get_llm_stats, MODEL_BACKEND
+from ocr_engine import get_ocr_stats
+from deck_summaries import load_deck_summaries, build_summary_context, schedule_deck_summaries
+from library_index import library_index
+from slide_dedup import slide_dedup
+from slide_vectors import slide_vectors
+from admission import admission_controlled, get_admission_stats, IMAGE_REQUEST_COST
+from work_scheduler import scheduler
+from answer_prewarm import prewarmer, template_question
+from question_batch import run_batch, validate_batch_items, BATCH_CONCURRENCY, BATCH_REQUEST_COST
+import math_report
+import profiler
+from profiler import stage
+from response_layer import (finalize_response, send_cached_file, file_digest, remember_digest, precompress_file,
+                            get_response_stats)
+from output_writer import write_json, read_json, presentation_lock, presentation_name, presentation_writer
+from upload_store import store_upload, commit_upload, hash_file, link_or_copy, reusable_extraction, record_extraction, clone_extraction
+from preview_service import document_info, tile_path, thumbnail_path, sprite_path
+from chunked_upload import UploadError, start_upload, upload_status, write_chunk, finish_upload, discard_session
+from lazy_import import lazy_module, record_app_import, get_startup_report
+
+# Heavy libraries are imported on first use so that starting a worker stays fast
+fitz = lazy_module('fitz')  # PyMuPDF for more advanced PDF processing
+pptx = lazy_module('pptx')
+requests = lazy_module('requests')
+
+# Load environment variables
+load_dotenv()
+
+# /static is served by send_static (with fingerprinting and validators), not by Flask's default route
+app = Flask(__name__, static_folder=None)
+STATIC_FOLDER = os.path.join(app.root_path, 'static')
+TEMPLATE_FOLDER = os.path.join(app.root_path, 'templates')
+UPLOAD_FOLDER = 'slides'
+ORIGINAL_FILES_FOLDER = 'original_files'
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(ORIGINAL_FILES_FOLDER, exist_ok=True)
+
+# Configure Gemini AI (the client itself is created by llm_client on first use)
+if not os.getenv("API_KEY") and MODEL_BACKEND != 'fake':
+    print("Warning: Missing API_KEY in .env - questions will fail until it is set")
+
+model = "gemini-2.0-flash"
+
+# Number of slides retrieved from the whole course library for a library-scope question
+LIBRARY_CONTEXT_SLIDES = int(os.getenv('LIBRARY_CONTEXT_SLIDES', '8'))
+
+# Most similar slides of the same deck added as background to a question about one slide
+RELATED_CONTEXT_SLIDES = int(os.getenv('RELATED_CONTEXT_SLIDES', '2'))
+RELATED_CONTEXT_CHARS = 600
+
+# Related slides listed with an answer about one slide
+RELATED_SLIDES_SHOWN = int(os.getenv('RELATED_SLIDES_SHOWN', '5'))
+
+# Stability AI API
+STABILITY_API_KEY = os.getenv('STABILITY_API_KEY')
+if not STABILITY_API_KEY:
+    print("Warning: Missing STABILITY_API_KEY in .env - image generation will not work")
+
+# Parsed presentations kept per process and validated against the file on every use.
+# The production server warms this before forking so every worker starts with it filled.
+PRESENTATION_CACHE_SIZE = int(os.getenv('PRESENTATION_CACHE_SIZE', '32'))
+_presentation_cache = OrderedDict()
+_presentation_cache_lock = threading.Lock()
+
+# Rendered previews are keyed by the file version on the server; browsers may reuse them briefly
+PREVIEW_MAX_AGE = int(os.getenv('PREVIEW_MAX_AGE', '300'))
+
+# Answers are shared between worker processes through the SQLite cache
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(24 * 3600)))
+
+# Requests a user is waiting on; background work yields to them (see work_scheduler)
+INTERACTIVE_ENDPOINTS = {
+    'ask_question', 'search_library', 'list_duplicates', 'related_slides', 'get_pdf_visual_elements',
+    'preview_info', 'preview_tile', 'preview_thumbnail', 'preview_sprite', 'generate_image'
+}
+
+@app.before_request
+def begin_interactive_request():
+    if request.endpoint in INTERACTIVE_ENDPOINTS:
+        scheduler.begin_interactive()
+
+@app.before_request
+def start_background_services():
+    # Threads do not survive the fork of a preloading server, so each worker starts its own
+    prewarmer.start()
+    profiler.sampler.start()
+
+@app.before_request
+def begin_request_profile():
+    profiler.mark_busy()
+    if profiler.requested(request.headers, request.args):
+        g.profile = profiler.RequestProfile().start()
+
+@app.after_request
+def attach_request_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+        info = {"method": request.method, "path": request.full_path.rstrip('?'), "endpoint": request.endpoint,
+                "status": response.status_code}
+        # Streamed bodies are generated after this hook, so the profile ends when the response is closed
+        response.call_on_close(lambda: profile.finish(**info))
+    return response
+
+@app.teardown_request
+def end_interactive_request(exc):
+    if request.endpoint in INTERACTIVE_ENDPOINTS:
+        scheduler.end_interactive()
+    profiler.mark_idle()
+    profile = g.pop('profile', None)
+    if profile is not None:  # the request failed before a response was made
+        profile.finish(method=request.method, path=request.path, endpoint=request.endpoint, status=500)
+
+# Compression, ETags and 304s for everything built in memory (see response_layer)
+app.after_request(finalize_response)
+
+def file_version(path):
+    """Version stamp of an extraction output, changing whenever the file is rewritten."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def load_presentation_file(path):
+    """Load a _slides.json or _enhanced.json file through the per-process presentation cache."""
+    version = file_version(path)
+    with _presentation_cache_lock:
+        entry = _presentation_cache.get(path)
+        if entry and entry[0] == version:
+            _presentation_cache.move_to_end(path)
+            return entry[1]
+    
+    # Under the shared lock, so the version stored is the version of the data read
+    with presentation_lock(presentation_name(path)):
+        version = file_version(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    
+    with _presentation_cache_lock:
+        _presentation_cache[path] = (version, data)
+        _presentation_cache.move_to_end(path)
+        while len(_presentation_cache) > PRESENTATION_CACHE_SIZE:
+            _presentation_cache.popitem(last=False)
+    return data
+
+def warm_presentation_cache():
+    """Load the extracted presentations up front (enhanced data first, as /ask prefers it)."""
+    names = sorted(os.listdir(UPLOAD_FOLDER))
+    paths = [os.path.join(UPLOAD_FOLDER, n) for n in names if n.endswith('_enhanced.json')]
+    paths += [os.path.join(UPLOAD_FOLDER, n) for n in names if n.endswith('_slides.json')]
+    
+    loaded = 0
+    for path in paths[:PRESENTATION_CACHE_SIZE]:
+        try:
+            load_presentation_file(path)
+            loaded += 1
+        except (OSError, ValueError) as e:
+            print(f"Could not warm cache with {path}: {e}")
+    print(f"Warmed presentation cache with {loaded} files")
+    return loaded
+
+def answer_cache_key(data_path, slide_num, question, include_visual):
+    """
+    Fingerprint of a question against one version of a presentation.
+    A question about one slide of a text-only deck is keyed by the slide's canonical
+    near-duplicate instead, so the same slide in another lecture shares its answer.
+    """
+    if slide_num is not None and data_path.endswith('_slides.json'):
+        filename = os.path.basename(data_path)[:-len('_slides.json')]
+        canonical = slide_dedup.canonical(filename, slide_num)
+        version = slide_dedup.version(canonical[0])
+        if version:
+            raw = json.dumps(["slide", list(canonical), version, slide_num, question.strip(), bool(include_visual)])
+            return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    raw = json.dumps([data_path, file_version(data_path), slide_num, question.strip(), bool(include_visual)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def extract_text_from_pptx(file_path):
+    prs = pptx.Presentation(file_path)
+    slides = []
+
+    for idx, slide in enumerate(prs.slides, start=1):
+        slide_data = {
+            "slide_number": idx,
+            "title": "",
+            "content": [],
+            "notes": "",
+            "text": ""
+        }
+        
+        # First pass: extract the title if it exists
+        for shape in slide.shapes:
+            try:
+                if hasattr(shape, 'text') and shape.text.strip():
+                    if hasattr(shape, 'is_placeholder') and shape.is_placeholder:
+                        if shape.placeholder_format.type == 1:  # Title placeholder
+                            slide_data["title"] = shape.text.strip()
+                            break  # Found the title, exit the loop
+            except AttributeError:
+                continue
+        
+        # Second pass: extract all content including the title
+        for shape in slide.shapes:
+            try:
+                if hasattr(shape, 'text') and shape.text.strip():
+                    # Add all text content
+                    slide_data["content"].append(shape.text.strip())
+            except AttributeError:
+                if hasattr(shape, 'text') and shape.text.strip():
+                    slide_data["content"].append(shape.text.strip())
+        
+        # Get slide notes if they exist
+        try:
+            if slide.has_notes_slide and slide.notes_slide.notes_text_frame.text.strip():
+                slide_data["notes"] = slide.notes_slide.notes_text_frame.text.strip()
+        except AttributeError:
+            pass
+
+        # Combine all text with title at the beginning
+        slide_data["text"] = (
+            (slide_data["title"] + "\n" if slide_data["title"] else "") +
+            "\n".join(slide_data["content"])
+        ).strip()
+
+        slides.append(slide_data)
+
+    return slides
+
+def convert_ppt_to_pptx(ppt_path):
+    try:
+        # Full path to soffice.exe (change this if needed)
+        soffice_path = r"C:\Program Files\LibreOffice\program\soffice.exe"
+        
+        # Run the command and print the output for debugging
+        result = subprocess.run([
+            soffice_path, '--headless', '--convert-to', 'pptx',
+            ppt_path, '--outdir', os.path.dirname(ppt_path)
+        ], check=True, capture_output=True, text=True)
+        
+        # Print the output for debugging
+        print("Conversion output:", result.stdout)
+        print("Conversion error:", result.stderr)
+        
+        pptx_path = ppt_path.rsplit('.', 1)[0] + '.pptx'
+        
+        if os.path.exists(pptx_path):
+            return pptx_path
+        return None
+    except Exception as e:
+        print("Conversion failed:", e)
+        return None
+
+def save_extracted_text(slide_data, filename):
+    # Create a JSON object that contains all slides
+    presentation_data = {
+        "filename": filename,
+        "total_slides": len(slide_data),
+        "extraction_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "slides": slide_data
+    }
+    
+    # Save to a single JSON file
+    write_json(f'slides/{filename}_slides.json', presentation_data, filename)
+
+def whole_deck_context(context, question):
+    """
+    Context for a question about the whole presentation: the precomputed summary tree
+    (with drill-down into matching slides) once it exists, otherwise every slide's text.
+    """
+    slides = context.get("slides", [])
+    summaries = load_deck_summaries(context["filename"]) if context.get("filename") else None
+    if summaries:
+        print(f"Answering from the summary tree of {context['filename']}")
+        return build_summary_context(summaries, slides, question)
+    
+    # Slides repeating an earlier slide of the deck are only referenced, not sent again
+    repeats = slide_dedup.repeated_slides(context["filename"]) if context.get("filename") else {}
+    return "\n\n".join([
+        f"Slide/Page {slide['slide_number']}: same content as Slide/Page {repeats[slide['slide_number']]}"
+        if slide['slide_number'] in repeats else f"Slide/Page {slide['slide_number']}:\n{slide['text']}"
+        for slide in slides
+    ])
+
+# Helper function to process slide references
+def related_slides_context(context, slide_number):
+    """Background text from the slides of the deck most similar to the selected one."""
+    if not RELATED_CONTEXT_SLIDES or not context.get("filename"):
+        return ""
+    picks = slide_vectors.context_slides(context["filename"], slide_number, RELATED_CONTEXT_SLIDES)
+    slides = {slide["slide_number"]: slide for slide in context.get("slides", [])}
+    parts = []
+    for number in picks:
+        text = slides.get(number, {}).get("text", "").strip()
+        if text:
+            parts.append(f"Slide {number}: {text[:RELATED_CONTEXT_CHARS]}")
+    if not parts:
+        return ""
+    return ("\n\nRelated slides of this presentation (background only; answer about the selected slide):\n"
+            + "\n".join(parts))
+
+def process_slide_references(text):
+    # Process multiple patterns for slide ranges with different formats
+    
+    # Pattern: "Slides X-Y" (like "Slides 8-18" or "Slides 10-13")
+    text = re.sub(
+        r'Slides (\d+)-(\d+)', 
+        r'<a href="#slide-range" data-range="\1-\2">Slides \1-\2</a>', 
+        text
+    )
+    
+    # Pattern for Pages instead of Slides
+    text = re.sub(
+        r'Pages (\d+)-(\d+)', 
+        r'<a href="#slide-range" data-range="\1-\2">Pages \1-\2</a>', 
+        text
+    )
+    
+    # Pattern: "Slide X to Y" (handle another possible format)
+    text = re.sub(
+        r'Slide (\d+) to (\d+)', 
+        r'<a href="#slide-range" data-range="\1-\2">Slides \1 to \2</a>', 
+        text
+    )
+    
+    # Pattern: "Page X to Y"
+    text = re.sub(
+        r'Page (\d+) to (\d+)', 
+        r'<a href="#slide-range" data-range="\1-\2">Pages \1 to \2</a>', 
+        text
+    )
+    
+    # Pattern: "Slides X and Y" (not a range, but individual slides)
+    text = re.sub(
+        r'Slides (\d+) and (\d+)(?!\d)', 
+        r'<a href="#slide-\1">Slide \1</a> and <a href="#slide-\2">Slide \2</a>', 
+        text
+    )
+    
+    # Pattern: "Pages X and Y"
+    text = re.sub(
+        r'Pages (\d+) and (\d+)(?!\d)', 
+        r'<a href="#slide-\1">Page \1</a> and <a href="#slide-\2">Page \2</a>', 
+        text
+    )
+    
+    # Handle capitalization variations like "slide" instead of "Slide"
+    text = re.sub(
+        r'slide (\d+)', 
+        r'<a href="#slide-\1">Slide \1</a>', 
+        text,
+        flags=re.IGNORECASE
+    )
+    
+    # Handle "page" instead of "Page"
+    text = re.sub(
+        r'page (\d+)', 
+        r'<a href="#slide-\1">Page \1</a>', 
+        text,
+        flags=re.IGNORECASE
+    )
+
+    # Process individual slide references - must come last
+    text = re.sub(
+        r'Slide (\d+)', 
+        r'<a href="#slide-\1">Slide \1</a>', 
+        text
+    )
+    
+    # Process individual page references
+    text = re.sub(
+        r'Page (\d+)', 
+        r'<a href="#slide-\1">Page \1</a>', 
+        text
+    )
+    
+    return text
+        
+# Update the call_gemini function to include visual elements from PDFs
+def call_gemini(question, context, slide_number=None, include_visual_elements=True):
+    try:
+        with stage("build_prompt"):
+            slides = context.get("slides", [])
+            has_visual_references = False
+            visual_elements_context = ""
+            image_data_to_include = []
+
+            if slide_number is not None:
+                # If a specific slide is selected, only use that slide's content
+                slide_data = next((slide for slide in slides if slide["slide_number"] == slide_number), None)
+                if slide_data:
+                    context_text = slide_data["text"] + related_slides_context(context, slide_number)
+                
+                    # Check if this is from an enhanced PDF with visual elements
+                    if include_visual_elements and context.get("images"):
+                        # Get images for this page/slide
+                        page_images = images_on_page(context.get("images", []), slide_number)
+                    
+                        if page_images:
+                            has_visual_references = True
+                            visual_elements_context = "\nVisual Elements on this page:\n"
+                        
+                            # Create detailed descriptions of each image
+                            for i, image in enumerate(page_images):
+                                image_desc = f"Image {i+1}: "
+                                if "width" in image and "height" in image:
+                                    image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
+                                image_desc += f"Located on page {slide_number}. "
+                            
+                                # Store image data for direct inclusion
+                                image_data_to_include.append({
+                                    "image_number": i+1,
+                                    "data_uri": resolve_data_uri(image, "data_uri", "asset"),
+                                    "description": image_desc
+                                })
+                            
+                                visual_elements_context += f"- {image_desc}\n"
+                
+                    # Also check for formulas
+                    if include_visual_elements and context.get("formulas"):
+                        page_formulas = [f for f in context.get("formulas", []) if f["page"] == slide_number]
+                        if page_formulas:
+                            has_visual_references = True
+                            if not visual_elements_context:
+                                visual_elements_context = "\nVisual Elements on this page:\n"
+                        
+                            visual_elements_context += "Mathematical formulas:\n"
+                            for i, formula in enumerate(page_formulas):
+                                visual_elements_context += f"- Formula {i+1}: {formula['text']}\n"
+                
+                    scope_notice = f"Answer based on content from Slide/Page {slide_number}:"
+                else:
+                    context_text = ""
+                    scope_notice = f"No content found for Slide/Page {slide_number}."
+            else:
+                # If no specific slide is selected, use the whole deck
+                context_text = whole_deck_context(context, question)
+            
+                # Add summary of visual elements for the whole document
+                if include_visual_elements and (context.get("formulas") or context.get("images")):
+                    has_visual_references = True
+                    visual_elements_context = "\nVisual Elements Summary:\n"
+                
+                    if context.get("formulas"):
+                        formula_pages = set(f["page"] for f in context.get("formulas", []))
+                        visual_elements_context += f"- Mathematical formulas found on pages: {', '.join(map(str, sorted(formula_pages)))}\n"
+                
+                    if context.get("images"):
+                        image_pages = set(p for img in context.get("images", []) for p in image_page_numbers(img))
+                        total_images = len(context.get("images", []))
+                        visual_elements_context += f"- Total of {total_images} images found, distributed on pages: {', '.join(map(str, sorted(image_pages)))}\n"
+                    
+                        # Add details for each image
+                        for i, image in enumerate(context.get("images", [])[:5]):  # Limit to first 5 images
+                            image_desc = f"Image {i+1}: "
+                            if "width" in image and "height" in image:
+                                image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
+                            image_desc += f"Located on page {image.get('page', 'unknown')}. "
+                        
+                            # Store image data for direct inclusion
+                            image_data_to_include.append({
+                                "image_number": i+1,
+                                "data_uri": resolve_data_uri(image, "data_uri", "asset"),
+                                "description": image_desc
+                            })
+                        
+                            visual_elements_context += f"- {image_desc}\n"
+                    
+                scope_notice = "Answer based on content from all slides/pages:"
+
+            # Combine the context with visual elements
+            full_context = context_text
+            if has_visual_references:
+                full_context += visual_elements_context
+
+            # Prepare the multimodal content
+            prompt_parts = [
+                f"""As an AI tutor, please answer this question based on the slide/PDF content:
+
+{scope_notice}
+{full_context}
+
+Question: {question}
+
+Important formatting guidelines:
+1. Do not use asterisks (*) for emphasis. Use HTML tags like <strong> or <em> instead.
+2. When referencing individual slides or pages, use the format "Slide X" or "Page X".
+3. When referencing a range of slides or pages, use the format "Slides X-Y" or "Pages X-Y".
+4. Format any lists as proper HTML lists with <ul> and <li> tags.
+5. Present your answer in clear, well-formatted paragraphs with proper spacing.
+6. When referencing visual elements like formulas or images, be specific about their location.
+7. If the question is about a formula, image, or other visual element, explicitly reference it in your answer."""
+            ]
+        
+            # Include image data directly in the request
+            for img_data in image_data_to_include:
+                if img_data["data_uri"]:
+                    # Create multimodal content with both text and image
+                    # Format: prompt text, then image data
+                    prompt_parts.append({
+                        "inlineData": {
+                            "mimeType": "image/jpeg" if img_data["data_uri"].startswith("data:image/jpeg") else "image/png",
+                            "data": img_data["data_uri"].split(',')[1]  # Extract base64 data
+                        }
+                    })
+                    prompt_parts.append(f"This is {img_data['description']} Please analyze this image for the answer.")
+        
+        # Check if we have any image data
+        has_images = len(image_data_to_include) > 0
+        
+        # Use different model for image analysis if needed
+        selected_model = "gemini-1.5-pro" if has_images else model
+        
+        print(f"Using model: {selected_model}, Request has images: {has_images}")
+        
+        # Call appropriate Gemini API based on content
+        if has_images:
+            # Use multimodal generation for image content
+            response = generate_content(selected_model, prompt_parts)
+        else:
+            # Use text-only generation
+            response = generate_content(model, prompt_parts[0])  # Just the text prompt
+
+        processed_text = response.text
+        
+        # Replace any remaining asterisks for emphasis
+        processed_text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_text)
+        processed_text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', processed_text)
+        
+        # Process links to slides and pages
+        processed_text = process_slide_references(processed_text)
+        
+        return processed_text
+
+    except Exception as e:
+        print(f"Gemini API error: {str(e)}")
+        return f"Error: Failed to get response from Gemini. {str(e)}"
+
+def also_in(hit):
+    """Where else a retrieved slide appears, for citing its near-duplicates in a prompt."""
+    duplicates = hit.get("duplicates") or []
+    if not duplicates:
+        return ""
+    places = [f"\"{d['filename']}\" Slide/Page {d['slide_number']}" for d in duplicates[:5]]
+    return " (also " + ", ".join(places) + (", ..." if len(duplicates) > 5 else "") + ")"
+
+def call_gemini_library(question, hits):
+    """Answer a question from slides retrieved across the whole course library."""
+    try:
+        with stage("build_prompt"):
+            context_text = "\n\n".join(
+                f"From \"{hit['filename']}\", Slide/Page {hit['slide_number']}{also_in(hit)}:\n{hit['text']}" for hit in hits
+            )
+            prompt = f"""As an AI tutor, please answer this question based on slides from several lectures of the course:
+
+Answer based on the most relevant slides/pages across all presentations:
+{context_text}
+
+Question: {question}
+
+Important formatting guidelines:
+1. Do not use asterisks (*) for emphasis. Use HTML tags like <strong> or <em> instead.
+2. Always say which presentation content comes from, e.g. "Lecture 09-IO, Slide 4".
+3. When comparing presentations, make clear which lecture covers which topic.
+4. Format any lists as proper HTML lists with <ul> and <li> tags.
+5. Present your answer in clear, well-formatted paragraphs with proper spacing."""
+        
+        response = generate_content(model, prompt)
+        
+        processed_text = response.text
+        processed_text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_text)
+        processed_text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', processed_text)
+        return process_slide_references(processed_text)
+    
+    except Exception as e:
+        print(f"Gemini API error: {str(e)}")
+        return f"Error: Failed to get response from Gemini. {str(e)}"
+
+@app.route('/search')
+def search_library():
+    """Ranked (presentation, slide) hits with snippets across every extracted presentation."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    
+    limit = min(int(request.args.get("limit", 10)), 100)
+    filenames = request.args.getlist("presentation") or None
+    
+    start = time.perf_counter()
+    # Over-fetch so that collapsing near-duplicate slides still leaves `limit` distinct hits
+    hits = slide_dedup.collapse(library_index.search(query, limit=limit * 2, filenames=filenames))[:limit]
+    took_ms = (time.perf_counter() - start) * 1000
+    
+    return jsonify({
+        "query": query,
+        "took_ms": round(took_ms, 2),
+        "results": [{k: v for k, v in hit.items() if k != "text"} for hit in hits]
+    })
+
+@app.route('/duplicates')
+def list_duplicates():
+    """Clusters of near-duplicate slides: a canonical slide with back-references to its copies."""
+    try:
+        filename = request.args.get("presentation")
+        clusters = slide_dedup.clusters(filename)
+        return jsonify({
+            "presentation": filename,
+            "clusters": clusters,
+            "stats": slide_dedup.stats()
+        })
+    except Exception as e:
+        print(f"Error listing duplicate slides: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def related_to(filename, slide_number, limit=RELATED_SLIDES_SHOWN):
+    """Related slides with copies of the same slide collapsed into one hit."""
+    return slide_dedup.collapse(slide_vectors.related(filename, slide_number, limit * 2))[:limit]
+
+@app.route('/related/<path:filename>/<int:slide_number>')
+def related_slides(filename, slide_number):
+    """Slides across the library most similar to one slide (precomputed neighbours)."""
+    try:
+        limit = min(int(request.args.get("limit", RELATED_SLIDES_SHOWN)), 50)
+        return jsonify({
+            "filename": filename,
+            "slide_number": slide_number,
+            "related": related_to(filename, slide_number, limit)
+        })
+    except Exception as e:
+        print(f"Error finding related slides: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def ask_library(question, filenames=None):
+    """Library-scope /ask: retrieve the best slides across decks, then call the model once."""
+    hits = library_index.search(question, limit=LIBRARY_CONTEXT_SLIDES * 2, filenames=filenames)
+    hits = slide_dedup.collapse(hits)[:LIBRARY_CONTEXT_SLIDES]
+    if not hits:
+        return jsonify({"error": "No slides in the library match this question"}), 404
+    
+    print(f"Library question answered from {len(hits)} slides in {len(set(h['filename'] for h in hits))} presentations")
+    return jsonify({
+        "question": question,
+        "answer": call_gemini_library(question, hits),
+        "scope": "library",
+        "sources": [{k: v for k, v in hit.items() if k not in ("text", "snippet")} for hit in hits],
+        "has_visual_elements": False
+    })
+
+# Update the ask_question route in app.py to handle presentation-specific queries with image support for math content
+def load_question_deck(filename):
+    """
+    What answering questions about a presentation needs, or None if it does not exist.
+    The parsed presentation and the page images of math slides are loaded on first use and
+    kept on the deck, so a batch of questions pays for them once.
+    """
+    enhanced_file_path = f'slides/{filename}_enhanced.json'
+    standard_file_path = f'slides/{filename}_slides.json'
+    print(f"Looking for enhanced data at: {enhanced_file_path}")
+    data_path = enhanced_file_path if os.path.exists(enhanced_file_path) else standard_file_path
+    if not os.path.exists(data_path):
+        return None
+    return {
+        "filename": filename,
+        "data_path": data_path,
+        "enhanced": data_path == enhanced_file_path,
+        "presentation": None,
+        "page_images": {},
+        "lock": threading.Lock()
+    }
+
+def deck_presentation(deck):
+    with deck["lock"]:
+        if deck["presentation"] is None:
+            deck["presentation"] = load_presentation_file(deck["data_path"])
+            if deck["enhanced"]:
+                math_pages = [slide["slide_number"] for slide in deck["presentation"].get("slides", [])
+                              if slide.get("has_math_content", False)]
+                print(f"Detected math content on pages: {math_pages}")
+        return deck["presentation"]
+
+def math_page_images(deck, slide_num):
+    """Full-page images sent along with a question: the selected math slide, or the first math pages."""
+    with deck["lock"]:
+        if slide_num in deck["page_images"]:
+            return deck["page_images"][slide_num]
+    page_images_to_include = []
+    slides = deck_presentation(deck).get("slides", [])
+    if slide_num is not None:
+        # Check if the specific slide has math content
+        slide_data = next((slide for slide in slides if slide["slide_number"] == slide_num), None)
+        page_image = resolve_data_uri(slide_data, "page_image", "page_image_asset") if slide_data else ""
+        if slide_data and slide_data.get("has_math_content", False) and page_image:
+            page_images_to_include.append({
+                "page": slide_num,
+                "image": page_image,
+                "description": f"Full page {slide_num} containing mathematical content"
+            })
+    else:
+        # If searching all slides, include all math-containing pages (up to a reasonable limit)
+        for slide in slides:
+            if slide.get("has_math_content", False) and (slide.get("page_image") or slide.get("page_image_asset")):
+                # Limit to first 5 pages with math to keep request size reasonable
+                if len(page_images_to_include) < 5:
+                    page_images_to_include.append({
+                        "page": slide["slide_number"],
+                        "image": resolve_data_uri(slide, "page_image", "page_image_asset"),
+                        "description": f"Full page {slide['slide_number']} containing mathematical content"
+                    })
+    with deck["lock"]:
+        deck["page_images"][slide_num] = page_images_to_include
+    return page_images_to_include
+
+def deck_answer_key(deck, question, slide_num, include_visual):
+    # Visual elements only exist in enhanced data, so the flag does not split text-only answers
+    return answer_cache_key(deck["data_path"], slide_num, question or "", include_visual and deck["enhanced"])
+
+def answer_from_deck(deck, question, slide_num=None, include_visual=True, ttl=ANSWER_CACHE_TTL):
+    """(answer, cached) for a question about a deck from load_question_deck; failed model calls start with "Error:"."""
+    # Standard questions about a slide ("explain this page") share the answer pre-warmed for them
+    template = template_question(question) if slide_num is not None else None
+    if template:
+        question = template
+    cache_key = deck_answer_key(deck, question, slide_num, include_visual)
+    cached_answer = shared_cache.get("answers", cache_key)
+    if template:
+        prewarmer.record_lookup(cached_answer is not None)
+    if cached_answer is not None:
+        print("Serving answer from shared cache")
+        return cached_answer, True
+
+    if deck["enhanced"]:
+        # Use enhanced PDF data with visual elements, including page images of math slides
+        page_images_to_include = math_page_images(deck, slide_num) if include_visual else []
+        response = call_gemini_with_math_support(question, deck_presentation(deck), slide_num,
+                                                 include_visual, page_images_to_include)
+    else:
+        # Fall back to standard text-only data (no page images in standard mode)
+        print("Using standard text-only data")
+        response = call_gemini(question, deck_presentation(deck), slide_num, False)
+
+    # Failed model calls come back as an "Error: ..." answer and are not cached
+    if not response.startswith("Error:"):
+        shared_cache.set("answers", cache_key, response, ttl=ttl)
+    return response, False
+
+@app.route('/ask', methods=['POST'])
+@admission_controlled()
+def ask_question():
+    data = request.json
+    question = data.get("question")
+    slide_num = data.get("slide_number")  # This can be None if no specific slide is selected
+    filename = data.get("filename")
+    include_visual = data.get("include_visual_elements", True)  # Default to including visual elements
+    
+    # "scope": "library" searches every presentation (optionally limited to "filenames")
+    if data.get("scope") == "library":
+        return ask_library(question, data.get("filenames"))
+
+    try:
+        print(f"Processing question about '{filename}', slide: {slide_num}, include_visual: {include_visual}")
+        deck = load_question_deck(filename)
+        if deck is None:
+            return jsonify({"error": f"Presentation '{filename}' not found"}), 404
+
+        response, cached = answer_from_deck(deck, question, slide_num, include_visual)
+        result = {
+            "question": question,
+            "answer": response,
+            "source_presentation": filename,
+            "has_visual_elements": deck["enhanced"],
+            "related_slides": related_to(filename, slide_num) if slide_num else []
+        }
+        if cached:
+            result["cached"] = True
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error processing question: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/ask-batch', methods=['POST'])
+@admission_controlled(cost=BATCH_REQUEST_COST)
+def ask_batch():
+    """
+    Answer a set of questions about one presentation, e.g. to pre-generate an exam review.
+    Body: {"filename", "items": [{"question", "slide_number"?, "include_visual_elements"?}], "concurrency"?}.
+    Streams NDJSON: one line per item as it completes (answer or error, latency_ms), then a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename")
+    try:
+        items = validate_batch_items(data.get("items"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    deck = load_question_deck(filename)
+    if deck is None:
+        return jsonify({"error": f"Presentation '{filename}' not found"}), 404
+    concurrency = min(BATCH_CONCURRENCY, max(1, int(data.get("concurrency") or BATCH_CONCURRENCY)))
+    print(f"Answering {len(items)} questions about '{filename}', {concurrency} at a time")
+
+    def answer(item):
+        return answer_from_deck(deck, item["question"], item.get("slide_number"),
+                                item.get("include_visual_elements", True))
+
+    def generate():
+        for line in run_batch(items, answer, concurrency):
+            yield json.dumps(line) + "\n"
+
+    return app.response_class(generate(), mimetype='application/x-ndjson')
+
+# New function to handle Gemini calls with math content page images
+def call_gemini_with_math_support(question, context, slide_number=None, include_visual_elements=True, page_images=None):
+    try:
+        with stage("build_prompt"):
+            slides = context.get("slides", [])
+            has_visual_references = False
+            visual_elements_context = ""
+            image_data_to_include = []
+
+            if slide_number is not None:
+                # If a specific slide is selected, only use that slide's content
+                slide_data = next((slide for slide in slides if slide["slide_number"] == slide_number), None)
+                if slide_data:
+                    context_text = slide_data["text"] + related_slides_context(context, slide_number)
+                
+                    # Check if this is a page with math content
+                    if slide_data.get("has_math_content", False) and include_visual_elements:
+                        has_visual_references = True
+                        visual_elements_context = "\nThis page contains mathematical content that may not be accurately represented as text.\n"
+                
+                    # Check if this is from an enhanced PDF with visual elements
+                    if include_visual_elements and context.get("images"):
+                        # Get images for this page/slide
+                        page_images = images_on_page(context.get("images", []), slide_number)
+                    
+                        if page_images:
+                            has_visual_references = True
+                            if not visual_elements_context:
+                                visual_elements_context = "\nVisual Elements on this page:\n"
+                        
+                            visual_elements_context += f"- {len(page_images)} images on page {slide_number}\n"
+                        
+                            # Store image data for direct inclusion (limit to first 3 for performance)
+                            for i, image in enumerate(page_images[:3]):
+                                image_desc = f"Image {i+1}: "
+                                if "width" in image and "height" in image:
+                                    image_desc += f"Dimensions: {image['width']}x{image['height']}px. "
+                                image_desc += f"Located on page {slide_number}. "
+                            
+                                # Store image data for direct inclusion
+                                image_data_to_include.append({
+                                    "image_number": i+1,
+                                    "data_uri": resolve_data_uri(image, "data_uri", "asset"),
+                                    "description": image_desc
+                                })
+                
+                    # Also check for formulas
+                    if include_visual_elements and context.get("formulas"):
+                        page_formulas = [f for f in context.get("formulas", []) if f["page"] == slide_number]
+                        if page_formulas:
+                            has_visual_references = True
+                            if not visual_elements_context:
+                                visual_elements_context = "\nVisual Elements on this page:\n"
+                        
+                            visual_elements_context += f"- {len(page_formulas)} mathematical formulas detected on page {slide_number}\n"
+                
+                    scope_notice = f"Answer based on content from Slide/Page {slide_number}:"
+                else:
+                    context_text = ""
+                    scope_notice = f"No content found for Slide/Page {slide_number}."
+            else:
+                # If no specific slide is selected, use the whole deck
+                context_text = whole_deck_context(context, question)
+            
+                # Add summary of visual elements for the whole document
+                if include_visual_elements:
+                    # Check for pages with math content
+                    math_pages = [slide["slide_number"] for slide in slides if slide.get("has_math_content", False)]
+                
+                    if math_pages:
+                        has_visual_references = True
+                        visual_elements_context = "\nMathematical Content:\n"
+                        visual_elements_context += f"- Mathematical notation detected on pages: {', '.join(map(str, sorted(math_pages)))}\n"
+                
+                    # Add info about other visual elements
+                    if context.get("formulas") or context.get("images"):
+                        has_visual_references = True
+                        if not visual_elements_context:
+                            visual_elements_context = "\nVisual Elements Summary:\n"
+                    
+                        if context.get("formulas"):
+                            formula_pages = set(f["page"] for f in context.get("formulas", []))
+                            visual_elements_context += f"- Mathematical formulas found on pages: {', '.join(map(str, sorted(formula_pages)))}\n"
+                    
+                        if context.get("images"):
+                            image_pages = set(p for img in context.get("images", []) for p in image_page_numbers(img))
+                            total_images = len(context.get("images", []))
+                            visual_elements_context += f"- Total of {total_images} images found, distributed on pages: {', '.join(map(str, sorted(image_pages)))}\n"
+            
+                scope_notice = "Answer based on content from all slides/pages:"
+
+            # Combine the context with visual elements
+            full_context = context_text
+            if has_visual_references:
+                full_context += visual_elements_context
+
+            # Prepare the multimodal content
+            prompt_parts = [
+                f"""As an AI tutor, please answer this question based on the slide/PDF content:
+
+{scope_notice}
+{full_context}
+
+Question: {question}
+
+Important notes:
+1. Some pages contain mathematical notation and formulas that might not be accurately represented as text.
+2. I will provide images of pages with mathematical content to help you understand the notation correctly.
+3. Please analyze both the text and the page images to provide an accurate answer.
+
+Important formatting guidelines:
+1. Do not use asterisks (*) for emphasis. Use HTML tags like <strong> or <em> instead.
+2. When referencing individual slides or pages, use the format "Slide X" or "Page X".
+3. When referencing a range of slides or pages, use the format "Slides X-Y" or "Pages X-Y".
+4. Format any lists as proper HTML lists with <ul> and <li> tags.
+5. Present your answer in clear, well-formatted paragraphs with proper spacing.
+6. When referencing mathematical formulas, describe them accurately based on the page images."""
+            ]
+        
+            # If we have specific page images for math content, prioritize those
+            if page_images:
+                for img_data in page_images:
+                    if "image" in img_data and img_data["image"]:
+                        # Determine image MIME type
+                        mime_type = "image/png"  # Default
+                        if img_data["image"].startswith("data:image/jpeg"):
+                            mime_type = "image/jpeg"
+                        elif img_data["image"].startswith("data:image/png"):
+                            mime_type = "image/png"
+                        
+                        # Extract base64 data
+                        base64_data = img_data["image"].split(',')[1] if ',' in img_data["image"] else img_data["image"]
+                    
+                        # Add the image to prompt parts
+                        prompt_parts.append({
+                            "inlineData": {
+                                "mimeType": mime_type,
+                                "data": base64_data
+                            }
+                        })
+                        prompt_parts.append(f"This is page {img_data['page']} containing mathematical content. Please analyze the mathematical notation in this image.")
+        
+            # Include other images if needed and we haven't already added too many
+            elif len(image_data_to_include) > 0:
+                for img_data in image_data_to_include[:3]:  # Limit to 3 images
+                    if img_data["data_uri"]:
+                        # Create multimodal content with both text and image
+                        # Format: prompt text, then image data
+                        prompt_parts.append({
+                            "inlineData": {
+                                "mimeType": "image/jpeg" if img_data["data_uri"].startswith("data:image/jpeg") else "image/png",
+                                "data": img_data["data_uri"].split(',')[1]  # Extract base64 data
+                            }
+                        })
+                        prompt_parts.append(f"This is {img_data['description']} Please analyze this image for the answer.")
+        
+        # Check if we have any image data
+        has_images = len(page_images) > 0 or len(image_data_to_include) > 0
+        
+        # Use different model for image analysis if needed
+        selected_model = "gemini-1.5-pro" if has_images else model
+        
+        print(f"Using model: {selected_model}, Request has images: {has_images}")
+        
+        # Call appropriate Gemini API based on content
+        if has_images:
+            # Use multimodal generation for image content
+            response = generate_content(selected_model, prompt_parts)
+        else:
+            # Use text-only generation
+            response = generate_content(model, prompt_parts[0])  # Just the text prompt
+
+        processed_text = response.text
+        
+        # Replace any remaining asterisks for emphasis
+        processed_text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', processed_text)
+        processed_text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', processed_text)
+        
+        # Process links to slides and pages
+        processed_text = process_slide_references(processed_text)
+        
+        return processed_text
+
+    except Exception as e:
+        print(f"Gemini API error: {str(e)}")
+        return f"Error: Failed to get response from Gemini. {str(e)}"
+
+@app.route('/analyze-math/<path:filename>')
+def analyze_math(filename):
+    """
+    Math content detection report of a PDF, computed once per document and detector version.
+    ?summary=1 returns only the totals and the math pages; ?start=&limit= select a page range;
+    ?format=ndjson (or Accept: application/x-ndjson) streams the summary line, then one line per page.
+    """
+    try:
+        file_path = find_original_file(filename) or find_original_file(f"{filename}.pdf")
+        if not file_path:
+            return jsonify({"error": f"File not found: {filename}"}), 404
+
+        key, summary = math_report.get_report(file_path)
+        head = dict(math_report.summary_fields(summary), filename=filename)
+        if request.args.get('summary') in ('1', 'true'):
+            return jsonify(head)
+
+        first, end = math_report.page_range(summary, request.args.get('start', 1, type=int),
+                                            request.args.get('limit', type=int))
+        head.update(start=first, next_start=end if end <= summary["total_pages"] else None)
+        if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+            def generate():
+                yield json.dumps(head).encode('utf-8') + b'\n'
+                yield from math_report.iter_pages_raw(key, summary, first, end)
+            return app.response_class(generate(), mimetype='application/x-ndjson')
+
+        return jsonify(dict(head, analysis=math_report.read_pages(key, summary, first, end)))
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+# Add endpoint to reprocess PDFs with the improved detection
+@app.route('/reprocess-pdf/<path:filename>')
+def reprocess_pdf(filename):
+    """Reprocess a PDF file with improved math content detection."""
+    try:
+        # Verify the file exists
+        file_path = os.path.join(ORIGINAL_FILES_FOLDER, filename)
+        if not os.path.exists(file_path):
+            # Try with .pdf extension
+            file_path = os.path.join(ORIGINAL_FILES_FOLDER, f"{filename}.pdf")
+            if not os.path.exists(file_path):
+                return jsonify({"error": f"File not found: {filename}"}), 404
+        
+        # Get the base name without extension
+        basename = os.path.splitext(os.path.basename(file_path))[0]
+        
+        # Import updated functions from pdf_processor
+        from pdf_processor import save_enhanced_pdf_extraction
+        
+        # Reprocess the PDF with enhanced detection, streaming large documents page by page
+        extract = save_streaming_pdf_extraction if should_stream_pdf(file_path) else save_enhanced_pdf_extraction
+        with presentation_writer(basename):
+            result = scheduler.run('ingest', extract, file_path, basename)
+        
+        if result:
+            return jsonify({
+                "success": True,
+                "filename": basename,
+                "message": f"PDF reprocessed successfully with improved math detection",
+                "math_pages": result.get("math_content_pages", [])
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "filename": basename,
+                "message": "Failed to reprocess PDF"
+            })
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+# This will help pinpoint where the PDF loading is failing
+def find_original_file(filename):
+    """Path of an uploaded original in ORIGINAL_FILES_FOLDER (the frontend may leave out .pdf), or None."""
+    base_path = os.path.join(ORIGINAL_FILES_FOLDER, filename)
+    if os.path.isfile(base_path):
+        return base_path
+    if '.' not in filename and os.path.isfile(f"{base_path}.pdf"):
+        return f"{base_path}.pdf"
+    return None
+
+@app.route('/original-file/<path:filename>')
+def serve_original_file(filename):
+    """
+    Serve the original file from the original files folder.
+    Using path:filename to handle filenames with spaces.
+    Range requests are answered with 206 partial content, so PDF.js can fetch progressively;
+    whole-file requests get the variant compressed at ingest. A name can be uploaded again,
+    so browsers revalidate (cheaply, against the content-hash ETag).
+    """
+    print(f"Requested file: {filename}")
+    
+    file_path = find_original_file(filename)
+    if file_path:
+        print(f"File found at: {file_path}")
+        return send_cached_file(file_path)
+    
+    # List available files for debugging
+    available_files = os.listdir(ORIGINAL_FILES_FOLDER)
+    print(f"Available files in {ORIGINAL_FILES_FOLDER}: {available_files}")
+    
+    return jsonify({"error": "File not found", "requested": filename}), 404
+
+def send_preview(filename, render):
+    """Serve a preview rendered by preview_service for an uploaded PDF."""
+    pdf_path = find_original_file(filename)
+    if not pdf_path or not pdf_path.lower().endswith('.pdf'):
+        return jsonify({"error": "PDF not found", "requested": filename}), 404
+    try:
+        return send_file(os.path.abspath(render(pdf_path)), mimetype='image/png', conditional=True, max_age=PREVIEW_MAX_AGE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        print(f"Error rendering preview for {filename}: {str(e)}")
+        return jsonify({"error": f"Error rendering preview: {str(e)}"}), 500
+
+@app.route('/preview/<filename>/info')
+def preview_info(filename):
+    """Page count, page sizes and tile/sprite layout of a PDF for the viewer."""
+    pdf_path = find_original_file(filename)
+    if not pdf_path or not pdf_path.lower().endswith('.pdf'):
+        return jsonify({"error": "PDF not found", "requested": filename}), 404
+    try:
+        return jsonify(document_info(pdf_path))
+    except Exception as e:
+        print(f"Error reading preview info for {filename}: {str(e)}")
+        return jsonify({"error": f"Error reading PDF: {str(e)}"}), 500
+
+@app.route('/preview/<filename>/<int:page>/tile')
+def preview_tile(filename, page):
+    """One square of a page at ?scale=, column ?col= and row ?row=."""
+    scale = request.args.get('scale', 1.5, type=float)
+    col = request.args.get('col', 0, type=int)
+    row = request.args.get('row', 0, type=int)
+    return send_preview(filename, lambda path: tile_path(path, page, scale, col, row))
+
+@app.route('/preview/<filename>/<int:page>/thumbnail')
+def preview_thumbnail(filename, page):
+    return send_preview(filename, lambda path: thumbnail_path(path, page))
+
+@app.route('/preview/<filename>/sprite/<int:sheet>')
+def preview_sprite(filename, sheet):
+    """Thumbnails of a block of pages in one image; the layout is described by /info."""
+    return send_preview(filename, lambda path: sprite_path(path, sheet))
+
+# Add a route to get visual elements from a PDF
+@app.route('/pdf-visual-elements/<filename>/<int:page>')
+def get_pdf_visual_elements(filename, page):
+    enhanced_file_path = f'slides/{filename}_enhanced.json'
+    
+    if not os.path.exists(enhanced_file_path):
+        return jsonify({"error": "Enhanced PDF data not found"}), 404
+        
+    try:
+        version = file_version(enhanced_file_path)
+        cache_key = f"{filename}:{page}:{version}"
+        cached = shared_cache.get("visual-elements", cache_key)
+        if cached is not None:
+            return jsonify(cached)
+        
+        pdf_data = load_presentation_file(enhanced_file_path)
+            
+        # Extract formulas and images for the specified page (copies, the presentation is cached)
+        formulas = [dict(f) for f in pdf_data.get("formulas", []) if f["page"] == page]
+        images = [dict(img) for img in images_on_page(pdf_data.get("images", []), page)]
+        
+        # Images (and streamed formula crops) live in the asset store; point the viewer at them
+        for formula in formulas:
+            if not formula.get("image") and formula.get("image_asset"):
+                formula["image"] = asset_url(formula["image_asset"])
+        for image in images:
+            if not image.get("data_uri") and image.get("asset"):
+                image["data_uri"] = asset_url(image["asset"])
+            
+            # Deduplicated images list every placement; report the ones on this page
+            placements = [o for o in image.get("occurrences", []) if o["page"] == page]
+            if placements:
+                image["page"] = page
+                image["positions"] = [o["position"] for o in placements if "position" in o]
+                if image["positions"]:
+                    image["position"] = image["positions"][0]
+        
+        result = {
+            "filename": filename,
+            "page": page,
+            "formulas": formulas,
+            "images": images
+        }
+        shared_cache.set("visual-elements", cache_key, result)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Modify the upload route in app.py to ensure files are saved properly and paths are correctly tracked
+def extract_upload(file_path, filename, basename):
+    """Extract an uploaded file and save its JSON; returns the slides. Runs as a scheduler job."""
+    if filename.lower().endswith('.pdf') and should_stream_pdf(file_path):
+        # Large PDFs are processed page by page and written to disk as they go
+        summary = save_streaming_pdf_extraction(file_path, basename)
+        if not summary:
+            return None
+        print(f"Saved streaming PDF extraction: {summary['total_pages']} pages")
+        
+        slides = read_json(f'slides/{basename}_slides.json', basename)["slides"]
+        
+    elif filename.lower().endswith('.pdf'):
+        # Process PDF file with both standard and enhanced extraction
+        slides = extract_text_from_pdf(file_path)
+        if not slides:
+            return None
+            
+        # Save basic extracted text to JSON for backward compatibility
+        save_extracted_pdf_text(slides, basename)
+        print(f"Saved basic PDF extraction for: {basename}")
+        
+        # Save enhanced PDF extraction with visual elements
+        enhanced_data = save_enhanced_pdf_extraction(file_path, basename)
+        print(f"Saved enhanced PDF extraction: {enhanced_data is not None}")
+        
+        # If enhanced extraction was successful, use its slides (which contain more details)
+        if enhanced_data and enhanced_data.get("slides"):
+            slides = enhanced_data.get("slides")
+        
+    elif filename.lower().endswith('.ppt'):
+        # Convert .ppt to .pptx if needed
+        with stage("convert_ppt"):
+            converted_path = convert_ppt_to_pptx(file_path)
+        if not converted_path:
+            return None
+        
+        # Extract text from PowerPoint
+        with stage("extract_pptx"):
+            slides = extract_text_from_pptx(converted_path)
+        
+        # Save extracted text to JSON
+        save_extracted_text(slides, basename)
+        
+    else:  # .pptx file
+        # Extract text from PowerPoint
+        with stage("extract_pptx"):
+            slides = extract_text_from_pptx(file_path)
+        
+        # Save extracted text to JSON
+        save_extracted_text(slides, basename)
+
+    return slides
+
+def process_stored_upload(filename, stored):
+    """Extract (or reuse the extraction of) an upload already stored by upload_store; returns the presentation."""
+    original_file_path = stored["path"]
+    
+    basename = filename.rsplit('.', 1)[0]
+
+    # Uploads of the same filename are processed one at a time, so their outputs never interleave
+    with presentation_writer(basename):
+        # The slides folder keeps a hardlink to the same bytes for backward compatibility
+        slides_file_path = os.path.join(UPLOAD_FOLDER, filename)
+        link_method = link_or_copy(original_file_path, slides_file_path)
+        print(f"Linked file into slides folder ({link_method}): {slides_file_path}")
+
+        reuse_from = reusable_extraction(stored["sha256"])
+
+        # Process based on file type
+        if reuse_from:
+            # The same bytes were extracted before: reuse that output instead of extracting again
+            clone_extraction(reuse_from, basename)
+            print(f"Reusing extraction of {reuse_from} for identical upload {filename}")
+            enhanced_path = f'slides/{basename}_enhanced.json'
+            data_path = enhanced_path if os.path.exists(enhanced_path) else f'slides/{basename}_slides.json'
+            slides = read_json(data_path, basename)["slides"]
+        
+        else:
+            # CPU-heavy extraction runs in the background pool, behind interactive requests
+            slides = scheduler.run('ingest', extract_upload, original_file_path, filename, basename)
+            if not slides:
+                return None  # Skip if extraction fails
+
+        record_extraction(stored["sha256"], basename)
+
+    # The original never changes under its hash: compress it once for /original-file
+    remember_digest(original_file_path, stored["sha256"])
+    scheduler.submit('ingest', precompress_file, original_file_path, stored["sha256"])
+
+    # Summaries for whole-deck questions are built in the background
+    if not (reuse_from and load_deck_summaries(basename)):
+        schedule_deck_summaries(basename)
+    library_index.update_presentation(basename)
+    slide_dedup.update_presentation(basename)
+    slide_vectors.update_presentation(basename)
+    prewarmer.schedule(basename)
+
+    # Store this presentation's data
+    presentation_data = {
+        "filename": filename,  # Keep the full filename with extension
+        "basename": basename,  # Store the base name without extension
+        "slides": slides,
+        "file_type": filename.split('.')[-1].lower(),
+        "original_path": original_file_path,
+        "sha256": stored["sha256"],
+        "reused_extraction": bool(reuse_from),
+        "has_enhanced_data": filename.lower().endswith('.pdf')  # Only PDFs have enhanced data currently
+    }
+    return presentation_data
+
+@app.route('/upload', methods=['POST'])
+def upload_slide():
+    try:
+        # Accept multiple files
+        uploaded_files = request.files.getlist('files[]')
+        
+        if not uploaded_files:
+            return jsonify({"error": "No files uploaded"}), 400
+        
+        presentations = []
+        
+        # Create folders if they don't exist
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(ORIGINAL_FILES_FOLDER, exist_ok=True)
+        
+        print(f"Upload folder: {os.path.abspath(UPLOAD_FOLDER)}")
+        print(f"Original files folder: {os.path.abspath(ORIGINAL_FILES_FOLDER)}")
+
+        for file in uploaded_files:
+            if file.filename == '':
+                continue  # Skip empty file inputs
+
+            # Verify file extension - now include PDF
+            if not file.filename.lower().endswith(('.ppt', '.pptx', '.pdf')):
+                continue  # Skip invalid files
+                
+            print(f"Processing uploaded file: {file.filename}")
+
+            # Stream the upload into the originals folder once, hashing it on the way
+            stored = store_upload(file.stream, file.filename, ORIGINAL_FILES_FOLDER)
+            original_file_path = stored["path"]
+            print(f"Saved original file to: {original_file_path} ({stored['size']} bytes, sha256 {stored['sha256'][:12]})")
+            if stored["duplicate_of"]:
+                print(f"Identical to already stored file: {stored['duplicate_of']}")
+            
+            presentation_data = process_stored_upload(file.filename, stored)
+            if presentation_data:
+                presentations.append(presentation_data)
+
+        if not presentations:
+            return jsonify({"error": "No valid presentations uploaded"}), 400
+
+        return jsonify({"presentations": presentations})
+        
+    except Exception as e:
+        print(f"Error in upload_slide: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+    
+def upload_error_response(e):
+    body = dict(e.details, error=str(e))
+    response = jsonify(body)
+    response.status_code = e.status
+    if "retry_after" in e.details:
+        response.headers["Retry-After"] = str(e.details["retry_after"])
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def start_chunked_upload():
+    """Open a resumable upload session: {"filename", "size"}."""
+    try:
+        data = request.get_json() or {}
+        return jsonify(start_upload(data.get("filename"), data.get("size"))), 201
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Bytes received so far; a client resumes by sending the chunk at this offset."""
+    try:
+        return jsonify(upload_status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Receive one raw chunk at ?offset=N, verified against the X-Chunk-SHA256 header."""
+    try:
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            return jsonify({"error": "offset is required"}), 400
+        return jsonify(write_chunk(upload_id, offset, request.stream, request.content_length,
+                                   request.headers.get("X-Chunk-SHA256")))
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"Error writing chunk of upload {upload_id}: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Store the assembled file and extract it, answering like /upload."""
+    try:
+        session, part = finish_upload(upload_id)
+        expected = (request.get_json(silent=True) or {}).get("sha256")
+        digest = hash_file(part)
+        if expected and expected.lower() != digest:
+            discard_session(upload_id)
+            return jsonify({"error": "File checksum mismatch, upload it again"}), 422
+
+        os.makedirs(ORIGINAL_FILES_FOLDER, exist_ok=True)
+        stored = commit_upload(part, session["filename"], digest, session["size"], ORIGINAL_FILES_FOLDER)
+        discard_session(upload_id)
+        print(f"Completed chunked upload {upload_id}: {stored['path']} ({stored['size']} bytes)")
+
+        presentation_data = process_stored_upload(session["filename"], stored)
+        if not presentation_data:
+            return jsonify({"error": "No valid presentations uploaded"}), 400
+        return jsonify({"presentations": [presentation_data]})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"Error completing upload {upload_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/generate-image', methods=['POST'])
+@admission_controlled(cost=IMAGE_REQUEST_COST)
+def generate_image():
+    """Generate images using Stability AI API."""
+    # Get Stability AI API key from environment
+    STABILITY_API_KEY = os.getenv('STABILITY_API_KEY')
+    
+    if MODEL_BACKEND == 'fake':
+        # Offline load testing: skip the Stability API entirely
+        prompt = (request.get_json() or {}).get("prompt")
+        if not prompt:
+            return jsonify({"error": "Prompt is required"}), 400
+        with outbound_call():
+            img_data = fake_image_base64()
+        return jsonify({
+            "prompt": prompt,
+            "image_base64": f"data:image/png;base64,{img_data}"
+        })
+    
+    if not STABILITY_API_KEY:
+        return jsonify({"error": "Stability AI API key not configured. Set STABILITY_API_KEY in .env file."}), 500
+        
+    try:
+        data = request.get_json()
+        prompt = data.get("prompt")
+
+        if not prompt:
+            return jsonify({"error": "Prompt is required"}), 400
+
+        # Add detailed logging
+        print(f"Sending request to Stability AI API with prompt: {prompt[:50]}...")
+        
+        # Call the Stability AI API with the correct endpoint and format
+        try:
+            # Counts against the same outbound concurrency limit as the model calls
+            with outbound_call():
+                response = requests.post(
+                    "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+                    headers={
+                        "Authorization": f"Bearer {STABILITY_API_KEY}",
+                        "Content-Type": "application/json",
+                        "Accept": "application/json"
+                    },
+                    json={
+                        "text_prompts": [
+                            {
+                                "text": prompt,
+                                "weight": 1
+                            }
+                        ],
+                        "cfg_scale": 7,
+                        "height": 1024,
+                        "width": 1024,
+                        "samples": 1,
+                        "steps": 30
+                    },
+                    timeout=60  # Add a timeout
+                )
+            
+            # Log the response status
+            print(f"Stability AI API Response status: {response.status_code}")
+            
+            if response.status_code != 200:
+                error_detail = response.json() if response.headers.get('content-type') == 'application/json' else response.text
+                print(f"Error response: {error_detail}")
+                return jsonify({
+                    "error": "Failed to generate image", 
+                    "details": error_detail,
+                    "status_code": response.status_code
+                }), 500
+            
+            # Parse the JSON response and get the base64 image data
+            response_data = response.json()
+            if "artifacts" in response_data and len(response_data["artifacts"]) > 0:
+                img_data = response_data["artifacts"][0]["base64"]
+                return jsonify({
+                    "prompt": prompt,
+                    "image_base64": f"data:image/png;base64,{img_data}"
+                })
+            else:
+                return jsonify({"error": "No image generated in response"}), 500
+            
+        except requests.RequestException as e:
+            print(f"Request exception: {str(e)}")
+            return jsonify({"error": f"Request failed: {str(e)}"}), 500
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/metrics')
+def metrics():
+    """Counters of this worker process: model calls (incl. coalesced requests), admission, work queues, OCR and caches."""
+    return jsonify({
+        "pid": os.getpid(),
+        "llm": get_llm_stats(),
+        "ocr": get_ocr_stats(),
+        "shared_cache": shared_cache.stats(),
+        "slide_dedup": slide_dedup.stats(),
+        "slide_vectors": slide_vectors.stats(),
+        "admission": get_admission_stats(),
+        "scheduler": scheduler.stats(),
+        "responses": get_response_stats(),
+        "prewarm": prewarmer.stats(),
+        "profiler": profiler.sampler.stats(),
+        "startup": get_startup_report()
+    })
+
+def profile_response(counts, name, title):
+    """Samples as collapsed stacks (?format=collapsed, the default) or an SVG flame graph (?format=svg)."""
+    if request.args.get('format') == 'svg':
+        return app.response_class(profiler.flamegraph_svg(counts, title), mimetype='image/svg+xml',
+                                  headers={'Content-Disposition': f'inline; filename="{name}.svg"'})
+    return app.response_class(profiler.collapsed_text(counts), mimetype='text/plain',
+                              headers={'Content-Disposition': f'attachment; filename="{name}.folded"'})
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def profiler_settings():
+    """State of the always-on sampler and the stored request profiles; POST {"enabled": ..., "interval": ...} switches it."""
+    if not profiler.authorized(request.headers, request.args):
+        return jsonify({"error": "Profiler token required"}), 403
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            if "enabled" not in data:
+                return jsonify({"error": "enabled is required"}), 400
+            setting = profiler.set_sampling(data["enabled"], data.get("interval"))
+            print(f"Profiler sampler {'enabled' if setting['enabled'] else 'disabled'}")
+        return jsonify({
+            "sampler": profiler.sampler.stats(),
+            "setting": shared_cache.get("profiler", "sampler"),
+            "poll_seconds": profiler.PROFILER_POLL,
+            "requests": profiler.list_request_profiles()
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/profiler/samples', methods=['GET', 'DELETE'])
+def profiler_samples():
+    """The always-on samples of all worker and pool processes (DELETE drops them)."""
+    if not profiler.authorized(request.headers, request.args):
+        return jsonify({"error": "Profiler token required"}), 403
+    try:
+        if request.method == 'DELETE':
+            profiler.reset_samples()
+            return jsonify({"success": True})
+        counts, stages, processes = profiler.merged_samples()
+        if request.args.get('format') == 'json':
+            return jsonify({"processes": processes, "samples": sum(counts.values()),
+                            "stages": {name: round(seconds, 3) for name, seconds in stages.most_common()}})
+        return profile_response(counts, "samples", f"Always-on samples of {processes} processes")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/profiler/requests/<profile_id>')
+def profiler_request(profile_id):
+    """One request profile: ?format=json (timings per stage), collapsed or svg."""
+    if not profiler.authorized(request.headers, request.args):
+        return jsonify({"error": "Profiler token required"}), 403
+    profile = profiler.load_request_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get('format') == 'json':
+        return jsonify({k: v for k, v in profile.items() if k != "counts"})
+    title = f"{profile.get('method', '')} {profile.get('path', '')} ({profile['seconds']}s)"
+    return profile_response(profile["counts"], f"profile-{profile_id}", title)
+
+@app.route('/assets/<path:path>')
+def send_asset(path):
+    """Serve page renders, formula crops and images from the asset store (named by content hash, so never stale)."""
+    try:
+        full_path = asset_path(path)
+    except ValueError:
+        return jsonify({"error": "Asset not found"}), 404
+    if not os.path.isfile(full_path):
+        return jsonify({"error": "Asset not found"}), 404
+    digest = os.path.basename(full_path).split('.', 1)[0]
+    return send_cached_file(full_path, immutable=True, digest=digest)
+
+def static_fingerprint(path):
+    """Short content hash appended to static URLs (?v=...), so they can be cached for good."""
+    return file_digest(path)[:12]
+
+@app.route('/static/<path:path>')
+def send_static(path):
+    full_path = safe_join(STATIC_FOLDER, path)
+    if not full_path or not os.path.isfile(full_path):
+        return jsonify({"error": "File not found"}), 404
+    # Only the URL naming the current content is immutable; a bare or outdated one must revalidate
+    return send_cached_file(full_path, immutable=request.args.get('v') == static_fingerprint(full_path))
+
+def fingerprint_static_urls(html):
+    def fingerprint(match):
+        path = safe_join(STATIC_FOLDER, match.group(2))
+        if not path or not os.path.isfile(path):
+            return match.group(0)
+        return f'{match.group(1)}/static/{match.group(2)}?v={static_fingerprint(path)}{match.group(3)}'
+    return re.sub(r'((?:src|href)=")/static/([^"?#]+)(")', fingerprint, html)
+
+@app.route('/')
+def index():
+    with open(os.path.join(TEMPLATE_FOLDER, 'index.html'), 'r', encoding='utf-8') as f:
+        return fingerprint_static_urls(f.read())
+
+record_app_import(time.perf_counter() - _app_import_started)
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,75 @@
+import base64
+import hashlib
+import os
+
+# Extracted page renders, formula crops and embedded images are written here once
+# and referenced from the JSON outputs by their relative path
+ASSET_FOLDER = os.path.join('slides', 'assets')
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "bmp": "image/bmp",
+    "tif": "image/tiff",
+    "tiff": "image/tiff",
+    "jpx": "image/jp2",
+    "jp2": "image/jp2",
+}
+
+def content_hash(data):
+    """Return the hex digest used to address asset bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def save_asset(data, ext):
+    """Write bytes to the asset store (once per content hash) and return the relative asset path."""
+    digest = content_hash(data)
+    ext = (ext or "bin").lower()
+    relative_path = f"{digest[:2]}/{digest}.{ext}"
+    full_path = os.path.join(ASSET_FOLDER, relative_path)
+
+    if not os.path.exists(full_path):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Write to a temporary name first so a concurrent reader never sees a partial file
+        tmp_path = f"{full_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    return relative_path
+
+def asset_path(relative_path):
+    """Return the on-disk path of an asset, refusing paths that escape the asset folder."""
+    full_path = os.path.normpath(os.path.join(ASSET_FOLDER, relative_path))
+    if not full_path.startswith(os.path.normpath(ASSET_FOLDER) + os.sep):
+        raise ValueError(f"Invalid asset path: {relative_path}")
+    return full_path
+
+def asset_mime_type(relative_path):
+    ext = relative_path.rsplit('.', 1)[-1].lower()
+    return MIME_TYPES.get(ext, "application/octet-stream")
+
+def asset_data_uri(relative_path):
+    """Load an asset from disk and encode it as a data URI for prompts."""
+    with open(asset_path(relative_path), 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('utf-8')
+    return f"data:{asset_mime_type(relative_path)};base64,{encoded}"
+
+def resolve_data_uri(record, inline_key, asset_key):
+    """
+    Return the image of a slide/formula/image record as a data URI.
+    Older extractions store the base64 inline; streamed ones only keep the asset path.
+    """
+    if record.get(inline_key):
+        return record[inline_key]
+    if record.get(asset_key):
+        try:
+            return asset_data_uri(record[asset_key])
+        except (OSError, ValueError) as e:
+            print(f"Error loading asset {record[asset_key]}: {e}")
+    return ""
+
+def asset_url(relative_path):
+    """URL under which the Flask app serves an asset."""
+    return f"/assets/{relative_path}"
@@ -0,0 +1,858 @@
+"""
+Benchmarks for the slide assistant.
+
+Usage:
+    python benchmark.py extraction --pages 50 200 800
+    python benchmark.py extraction --source "original_files/3.0 Chapter 3  Introduction XRD - All.pdf"
+    python benchmark.py server --workers 1 2 4 --concurrency 16
+    python benchmark.py ask --latency 2 --concurrency 200
+    python benchmark.py burst --students 30 --rounds 5
+    python benchmark.py coldstart --runs 5
+    python benchmark.py math
+    python benchmark.py admission --polite 20 --abusive 4
+    python benchmark.py scheduler --concurrency 8
+    python benchmark.py wire --pages 10
+    python benchmark.py prewarm --latency 0.5
+    python benchmark.py outputs --rounds 10
+
+Every benchmark runs in a scratch working directory so the real slides/ folder is never touched.
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_PDF = os.path.join(REPO_DIR, 'original_files', '3.0 Chapter 3  Introduction XRD - All.pdf')
+MATH_LABELS = os.path.join(REPO_DIR, 'math_labels.json')
+
+def build_synthetic_pdf(source_pdf, pages, out_path):
+    """Repeat the pages of a real PDF until the document has the requested page count."""
+    import fitz
+
+    src = fitz.open(source_pdf)
+    out = fitz.open()
+    while len(out) < pages:
+        last_page = min(len(src), pages - len(out)) - 1
+        out.insert_pdf(src, from_page=0, to_page=last_page)
+    out.save(out_path)
+    return out_path
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_in_child(args, workdir):
+    """Run a benchmark worker in a fresh process so peak RSS is measured per run."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, 'benchmark.py')] + args,
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith('{'):
+            return json.loads(line)
+    raise RuntimeError(f"Benchmark worker failed:\n{result.stderr[-2000:]}")
+
+def extraction_worker(pdf_path, mode):
+    """Child-process side of the extraction benchmark."""
+    import tracemalloc
+    import contextlib
+    import io
+
+    os.makedirs('slides', exist_ok=True)
+    import pdf_processor
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    # The extractors print per-page diagnostics; keep them out of the measurement output
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'stream':
+            pdf_processor.save_streaming_pdf_extraction(pdf_path, 'bench')
+        else:
+            pdf_processor.save_extracted_pdf_text(pdf_processor.extract_text_from_pdf(pdf_path), 'bench')
+            pdf_processor.save_enhanced_pdf_extraction(pdf_path, 'bench')
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+
+    print(json.dumps({
+        "mode": mode,
+        "seconds": round(elapsed, 2),
+        "python_peak_mb": round(traced_peak / (1024 * 1024), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }))
+
+def bench_extraction(args):
+    """Compare peak memory and time of in-memory vs streaming PDF extraction as page count grows."""
+    print(f"{'pages':>6} {'mode':>8} {'seconds':>8} {'py peak MB':>11} {'RSS peak MB':>12}")
+    for pages in args.pages:
+        workdir = tempfile.mkdtemp(prefix='slide-bench-')
+        try:
+            pdf_path = build_synthetic_pdf(args.source, pages, os.path.join(workdir, 'bench.pdf'))
+            for mode in args.modes:
+                stats = run_in_child(['_extraction-worker', pdf_path, mode], workdir)
+                print(f"{pages:>6} {mode:>8} {stats['seconds']:>8} {stats['python_peak_mb']:>11} {stats['peak_rss_mb']:>12}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def prepare_server_workdir(source_pdf):
+    """Scratch working directory with the repo's extracted decks plus one enhanced PDF extraction."""
+    workdir = tempfile.mkdtemp(prefix='slide-bench-')
+    os.makedirs(os.path.join(workdir, 'slides'))
+    os.makedirs(os.path.join(workdir, 'original_files'))
+    for name in os.listdir(os.path.join(REPO_DIR, 'slides')):
+        if name.endswith('.json'):
+            shutil.copy(os.path.join(REPO_DIR, 'slides', name), os.path.join(workdir, 'slides', name))
+
+    run_in_child(['_enhanced-worker', source_pdf], workdir)
+    return workdir
+
+def enhanced_worker(pdf_path):
+    """Child-process side of prepare_server_workdir: extract one PDF as 'bench'."""
+    import contextlib
+    import io
+    import pdf_processor
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = pdf_processor.save_streaming_pdf_extraction(pdf_path, 'bench')
+    print(json.dumps({"total_pages": summary["total_pages"]}))
+
+def start_server(workdir, port, workers, threads, extra_env=None, extra_args=None):
+    """Start serve.py in the scratch directory and wait until it answers."""
+    # Load tests come from one address; only the admission benchmark turns the limits on
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, SHARED_CACHE_PATH=os.path.join(workdir, 'cache.db'),
+               ADMISSION_CONTROL='0')
+    env.update(extra_env or {})
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'serve.py'), '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads)] + (extra_args or []),
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not start")
+
+def load_test(make_request, concurrency, duration):
+    """Call make_request(worker_index, i) from several threads for a fixed time; return stats."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker(worker_index):
+        i = 0
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                make_request(worker_index, i)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            i += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else None
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99)
+    }
+
+def bench_server(args):
+    """Throughput of /pdf-visual-elements under the production server as the worker count grows."""
+    workdir = prepare_server_workdir(args.source)
+    try:
+        print(f"{'workers':>8} {'threads':>8} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for workers in args.workers:
+            port = args.port
+            proc = start_server(workdir, port, workers, args.threads)
+            try:
+                def request_page(worker_index, i):
+                    page = (worker_index + i) % 30 + 1
+                    urllib.request.urlopen(f'http://127.0.0.1:{port}/pdf-visual-elements/bench/{page}', timeout=30).read()
+
+                stats = load_test(request_page, args.concurrency, args.duration)
+                print(f"{workers:>8} {args.threads:>8} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def post_json(url, payload, timeout=120):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                 headers={'Content-Type': 'application/json'})
+    return json.loads(urllib.request.urlopen(req, timeout=timeout).read())
+
+def bench_ask(args):
+    """/ask throughput against a fake model with fixed latency: threaded workers vs the async (gevent) server."""
+    workdir = prepare_server_workdir(args.source)
+    fake_env = {
+        "MODEL_BACKEND": "fake",
+        "FAKE_MODEL_LATENCY": str(args.latency),
+        "FAKE_MODEL_JITTER": "0",
+        "MODEL_CONCURRENCY": str(args.model_concurrency)
+    }
+    modes = [("threaded", []), ("async", ['--async'])]
+    try:
+        print(f"model latency {args.latency}s, {args.concurrency} concurrent clients, 1 worker process")
+        print(f"{'mode':>9} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for mode, extra_args in modes:
+            proc = start_server(workdir, args.port, 1, args.threads, fake_env, extra_args)
+            try:
+                def ask(worker_index, i):
+                    # Unique questions so the shared answer cache never short-circuits the model
+                    post_json(f'http://127.0.0.1:{args.port}/ask', {
+                        "question": f"benchmark question {mode} {worker_index} {i}",
+                        "slide_number": i % 30 + 1,
+                        "filename": "bench"
+                    })
+
+                stats = load_test(ask, args.concurrency, args.duration)
+                print(f"{mode:>9} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_burst(args):
+    """Classroom bursts: many students ask the same question at once, with and without request coalescing."""
+    workdir = prepare_server_workdir(args.source)
+    try:
+        print(f"{args.students} students x {args.rounds} rounds, fake model latency {args.latency}s")
+        print(f"{'coalescing':>10} {'upstream calls':>15} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for enabled in ('0', '1'):
+            env = {
+                "MODEL_BACKEND": "fake",
+                "FAKE_MODEL_LATENCY": str(args.latency),
+                "FAKE_MODEL_JITTER": "0",
+                "MODEL_CONCURRENCY": str(args.model_concurrency),
+                "COALESCE_REQUESTS": enabled
+            }
+            proc = start_server(workdir, args.port, 1, 8, env, ['--async'])
+            try:
+                latencies = []
+                for round_number in range(args.rounds):
+                    barrier = threading.Barrier(args.students)
+                    question = f"explain this slide ({enabled}/{round_number})"
+
+                    def student():
+                        barrier.wait()
+                        start = time.perf_counter()
+                        post_json(f'http://127.0.0.1:{args.port}/ask',
+                                  {"question": question, "slide_number": 12, "filename": "bench"})
+                        latencies.append(time.perf_counter() - start)
+
+                    threads = [threading.Thread(target=student) for _ in range(args.students)]
+                    for t in threads:
+                        t.start()
+                    for t in threads:
+                        t.join()
+
+                metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{args.port}/metrics').read())
+                latencies.sort()
+                p50 = round(latencies[len(latencies) // 2] * 1000, 1)
+                p99 = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1)
+                label = "on" if enabled == '1' else "off"
+                print(f"{label:>10} {metrics['llm']['calls']:>15} {p50:>8} {p99:>8} {round(latencies[-1] * 1000, 1):>8}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def admission_client(port, client, tag, stop_at, interval, results, lock):
+    """
+    One load-generator connection of a client: asks questions every interval seconds (0 = flat out).
+    tag makes its questions unique, so neither coalescing nor the answer cache short-circuits them.
+    """
+    i = 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        req = urllib.request.Request(
+            f'http://127.0.0.1:{port}/ask',
+            data=json.dumps({"question": f"{tag} question {i}", "slide_number": i % 30 + 1,
+                             "filename": "bench"}).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-Client-Id': client}
+        )
+        try:
+            urllib.request.urlopen(req, timeout=60).read()
+            outcome = "ok"
+        except urllib.error.HTTPError as e:
+            outcome = "rejected" if e.code == 429 else "error"
+        except OSError:
+            outcome = "error"
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((outcome, elapsed))
+        i += 1
+        if interval:
+            time.sleep(max(0.0, interval - elapsed))
+
+def bench_admission(args):
+    """Polite students next to clients flooding /ask, with admission control off and on."""
+    workdir = prepare_server_workdir(args.source)
+    try:
+        print(f"{args.polite} polite clients at {args.polite_rate}/s, {args.abusive} abusive clients x "
+              f"{args.abusive_concurrency} connections, model latency {args.latency}s, "
+              f"{args.model_concurrency} upstream slots")
+        print(f"{'admission':>9} {'polite ok/s':>11} {'polite ok%':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'abusive ok/s':>12} {'abusive 429':>11} {'upstream calls':>14}")
+        for enabled in ('0', '1'):
+            env = {
+                "MODEL_BACKEND": "fake",
+                "FAKE_MODEL_LATENCY": str(args.latency),
+                "FAKE_MODEL_JITTER": "0",
+                "MODEL_CONCURRENCY": str(args.model_concurrency),
+                "ADMISSION_CONTROL": enabled,
+                "ADMISSION_CLIENT_HEADER": "X-Client-Id",
+                "CLIENT_RATE": str(args.client_rate),
+                "CLIENT_BURST": str(args.client_burst),
+                "GLOBAL_RATE": str(args.global_rate),
+                "GLOBAL_BURST": str(args.global_rate * 2)
+            }
+            proc = start_server(workdir, args.port, 1, 8, env, ['--async'])
+            try:
+                polite, abusive = [], []
+                lock = threading.Lock()
+                stop_at = time.time() + args.duration
+                threads = [threading.Thread(target=admission_client,
+                                            args=(args.port, f"student-{n}", f"student-{n} {enabled}", stop_at,
+                                                  1 / args.polite_rate, polite, lock))
+                           for n in range(args.polite)]
+                threads += [threading.Thread(target=admission_client,
+                                             args=(args.port, f"abuser-{n % args.abusive}", f"abuser-{n} {enabled}",
+                                                   stop_at, 0, abusive, lock))
+                            for n in range(args.abusive * args.abusive_concurrency)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+                metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{args.port}/metrics').read())
+                ok_latencies = sorted(elapsed for outcome, elapsed in polite if outcome == "ok")
+                def percentile(p):
+                    return round(ok_latencies[min(len(ok_latencies) - 1, int(len(ok_latencies) * p))] * 1000, 1) if ok_latencies else None
+                polite_ok = len(ok_latencies)
+                abusive_ok = sum(1 for outcome, _ in abusive if outcome == "ok")
+                abusive_rejected = sum(1 for outcome, _ in abusive if outcome == "rejected")
+                label = "on" if enabled == '1' else "off"
+                print(f"{label:>9} {polite_ok / args.duration:>11.1f} {100 * polite_ok / max(1, len(polite)):>10.1f} "
+                      f"{percentile(0.5):>8} {percentile(0.99):>8} {abusive_ok / args.duration:>12.1f} "
+                      f"{abusive_rejected:>11} {metrics['llm']['calls']:>14}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def reprocess_loop(port, stop_at, results):
+    """Keep the server re-extracting the benchmark PDF, as a teacher uploading a textbook would."""
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/reprocess-pdf/bench', timeout=600).read()
+            results.append(time.perf_counter() - started)
+        except OSError:
+            pass
+
+def bench_scheduler(args):
+    """/ask and /search latency while the server re-extracts a PDF, with the work scheduler off and on."""
+    workdir = prepare_server_workdir(args.source)
+    shutil.copy(args.source, os.path.join(workdir, 'original_files', 'bench.pdf'))
+    try:
+        print(f"{args.concurrency} clients asking and searching, model latency {args.latency}s, "
+              f"1 worker process, extraction running throughout")
+        print(f"{'scheduler':>9} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'extractions':>11} "
+              f"{'extract s':>9} {'ingest wait ms':>14}")
+        for enabled in ('0', '1'):
+            env = {
+                "MODEL_BACKEND": "fake",
+                "FAKE_MODEL_LATENCY": str(args.latency),
+                "FAKE_MODEL_JITTER": "0",
+                "WORK_SCHEDULER": enabled
+            }
+            proc = start_server(workdir, args.port, 1, args.threads, env)
+            try:
+                extractions = []
+                background = threading.Thread(target=reprocess_loop,
+                                              args=(args.port, time.time() + args.duration, extractions))
+                background.start()
+
+                def interact(worker_index, i):
+                    if i % 2:
+                        urllib.request.urlopen(f'http://127.0.0.1:{args.port}/search?q=bragg+diffraction+{i}',
+                                               timeout=60).read()
+                    else:
+                        post_json(f'http://127.0.0.1:{args.port}/ask', {
+                            "question": f"scheduler question {enabled} {worker_index} {i}",
+                            "slide_number": i % 30 + 1,
+                            "filename": "bench"
+                        })
+
+                stats = load_test(interact, args.concurrency, args.duration)
+                background.join()
+                metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{args.port}/metrics').read())
+                ingest = metrics["scheduler"]["classes"]["ingest"]
+                label = "on" if enabled == '1' else "off"
+                mean_extract = round(sum(extractions) / len(extractions), 1) if extractions else None
+                print(f"{label:>9} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7} "
+                      f"{len(extractions):>11} {mean_extract!s:>9} {ingest['avg_wait_ms']:>14}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+class WireClient:
+    """
+    Browser-like client counting response body bytes. With caching on it sends Accept-Encoding,
+    revalidates with If-None-Match and does not request what it holds as immutable.
+    """
+
+    def __init__(self, port, caching):
+        self.port = port
+        self.caching = caching
+        self.cache = {}  # url -> (etag, immutable)
+        self.bytes = 0
+        self.requests = 0
+        self.not_modified = 0
+
+    def request(self, method, url, body=None, headers=None):
+        headers = dict(headers or {})
+        cached = self.cache.get(url) if method == 'GET' and self.caching else None
+        if cached and cached[1]:
+            return None  # fresh in the browser cache, no request at all
+        if self.caching:
+            headers['Accept-Encoding'] = 'br, gzip'
+            if cached and cached[0]:
+                headers['If-None-Match'] = cached[0]
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=600)
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        self.requests += 1
+        self.bytes += len(data)
+        if response.status == 304:
+            self.not_modified += 1
+            return None
+        if method == 'GET' and response.getheader('ETag'):
+            self.cache[url] = (response.getheader('ETag'), 'immutable' in (response.getheader('Cache-Control') or ''))
+        encoding = response.getheader('Content-Encoding')
+        if encoding == 'br':
+            import brotli
+            data = brotli.decompress(data)
+        elif encoding == 'gzip':
+            import gzip
+            data = gzip.decompress(data)
+        return data
+
+    def get_json(self, url):
+        data = self.request('GET', url)
+        return json.loads(data) if data else None
+
+def wire_session(client, pdf_name, pages, questions, upload_path=None):
+    """One student session: upload (first visit only), page, scripts, the PDF, visual elements, questions."""
+    import re
+
+    if upload_path:
+        boundary = uuid.uuid4().hex
+        with open(upload_path, 'rb') as f:
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="files[]"; filename="{pdf_name}.pdf"\r\n'
+                    f'Content-Type: application/pdf\r\n\r\n').encode('utf-8') + f.read() + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        client.request('POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    html = client.request('GET', '/')
+    static_urls = re.findall(r'(?:src|href)="(/static/[^"]+)"', html.decode('utf-8')) if html else \
+        [url for url in client.cache if url.startswith('/static/')]
+    for url in dict.fromkeys(static_urls):
+        client.request('GET', url)
+    client.request('GET', f'/original-file/{pdf_name}.pdf')
+
+    for page in range(1, pages + 1):
+        elements = client.get_json(f'/pdf-visual-elements/{pdf_name}/{page}')
+        assets = [url for url in client.cache if url.startswith('/assets/')] if elements is None else \
+            [item.get(key) for item in elements.get("formulas", []) + elements.get("images", [])
+             for key in ("image", "data_uri")]
+        for url in assets:
+            if url and url.startswith('/assets/'):
+                client.request('GET', url)
+    client.request('GET', f'/analyze-math/{pdf_name}')
+    for i in range(questions):
+        client.request('POST', '/ask', json.dumps({"question": f"What does slide {i + 1} show?",
+                                                   "slide_number": i + 1, "filename": pdf_name}).encode('utf-8'),
+                       {'Content-Type': 'application/json'})
+
+def bench_wire(args):
+    """Bytes on the wire for a first and a repeat visit, without and with compression and validators."""
+    print(f"session: upload, page, scripts, original PDF, {args.pages} pages of visual elements, "
+          f"math analysis, {args.questions} questions; repeat visit without the upload")
+    print(f"{'layer':>6} {'first KB':>9} {'repeat KB':>10} {'requests':>9} {'304s':>5}")
+    results = {}
+    for layer in ('off', 'on'):
+        workdir = tempfile.mkdtemp(prefix='slide-bench-')
+        os.makedirs(os.path.join(workdir, 'slides'))
+        os.makedirs(os.path.join(workdir, 'original_files'))
+        env = {"MODEL_BACKEND": "fake", "FAKE_MODEL_LATENCY": "0", "RESPONSE_COMPRESSION": '1' if layer == 'on' else '0'}
+        proc = start_server(workdir, args.port, 1, 4, env)
+        try:
+            client = WireClient(args.port, caching=layer == 'on')
+            wire_session(client, 'bench', args.pages, args.questions, upload_path=args.source)
+            first = client.bytes
+            time.sleep(args.settle)  # let the background precompression of the upload finish
+            wire_session(client, 'bench', args.pages, args.questions)
+            results[layer] = (first, client.bytes - first)
+            print(f"{layer:>6} {first / 1024:>9.0f} {(client.bytes - first) / 1024:>10.0f} {client.requests:>9} "
+                  f"{client.not_modified:>5}")
+        finally:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+    before, after = sum(results['off']), sum(results['on'])
+    print(f"per session: {before / 1024:.0f} KB -> {after / 1024:.0f} KB ({100 * (1 - after / before):.0f}% less)")
+
+def bench_prewarm(args):
+    """Latency of the first "explain this page" on every page, without and with pre-warmed answers."""
+    workdir = tempfile.mkdtemp(prefix='slide-bench-')
+    os.makedirs(os.path.join(workdir, 'slides'))
+    os.makedirs(os.path.join(workdir, 'original_files'))
+    pages = run_in_child(['_enhanced-worker', args.source], workdir)["total_pages"]
+    base_env = {
+        "MODEL_BACKEND": "fake",
+        "FAKE_MODEL_LATENCY": str(args.latency),
+        "FAKE_MODEL_JITTER": "0",
+        "PREWARM_QUIET_SECONDS": "1",
+        "PREWARM_INTERVAL": "3600"
+    }
+    try:
+        print(f"model latency {args.latency}s, {pages} pages, first question on every page")
+        print(f"{'prewarm':>8} {'warm-up s':>9} {'coverage %':>10} {'mean ms':>8} {'p99 ms':>7} {'hit rate':>8} {'saved s':>8}")
+        for enabled in ('0', '1'):
+            cache_db = os.path.join(workdir, 'cache.db')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(cache_db + suffix):
+                    os.remove(cache_db + suffix)
+            proc = start_server(workdir, args.port, 1, 4, dict(base_env, PREWARM=enabled))
+            try:
+                started = time.time()
+                metrics = {}
+                while enabled == '1' and time.time() - started < args.timeout:
+                    metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{args.port}/metrics').read())
+                    if metrics["prewarm"]["coverage"]["percent"] >= 100:
+                        break
+                    time.sleep(1)
+                warmup = time.time() - started if enabled == '1' else 0.0
+
+                latencies = []
+                for page in range(1, pages + 1):
+                    asked = time.perf_counter()
+                    post_json(f'http://127.0.0.1:{args.port}/ask', {
+                        "question": "Can you explain this page?",
+                        "slide_number": page,
+                        "filename": "bench",
+                        "include_visual_elements": True
+                    })
+                    latencies.append(time.perf_counter() - asked)
+                latencies.sort()
+                metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{args.port}/metrics').read())["prewarm"]
+                label = "on" if enabled == '1' else "off"
+                print(f"{label:>8} {warmup:>9.1f} {metrics['coverage']['percent']:>10} "
+                      f"{1000 * sum(latencies) / len(latencies):>8.1f} {1000 * latencies[int(len(latencies) * 0.99)]:>7.1f} "
+                      f"{metrics['hit_rate']:>8} {metrics['saved_seconds']:>8}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+HEAVY_MODULES = ['fitz', 'PyPDF2', 'pptx', 'requests']
+
+def import_app_seconds(workdir, eager):
+    """Wall time of `import app` in a fresh interpreter, optionally importing the heavy modules first."""
+    preload = f"import lazy_import; lazy_import.preload(*{HEAVY_MODULES!r}); " if eager else ""
+    code = (f"import sys, time; sys.path.insert(0, {REPO_DIR!r}); t = time.perf_counter(); "
+            f"{preload}import app; print(time.perf_counter() - t)")
+    out = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def import_breakdown(workdir, top):
+    """Slowest top-level imports of app according to `python -X importtime`."""
+    code = f"import sys; sys.path.insert(0, {REPO_DIR!r}); import app"
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, raw_name = line.split('|')
+        # app itself is indented by one space in the tree, its direct imports by three
+        if raw_name.startswith('   ') and not raw_name.startswith('    '):
+            rows.append((int(cumulative) / 1e6, raw_name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def write_indented(path, data):
+    """How extraction outputs were written before output_writer: in place, indented."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+def count_torn_reads(path, data, write, seconds):
+    """Rewrite path for `seconds` while another thread keeps reading it; returns (reads, failed reads)."""
+    done = threading.Event()
+    counts = [0, 0]
+
+    def reader():
+        while not done.is_set():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+            except (OSError, ValueError):
+                counts[1] += 1
+            counts[0] += 1
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        write(path, data)
+    done.set()
+    thread.join()
+    return counts
+
+def bench_outputs(args):
+    """Write time, size and torn reads of extraction outputs: indented in-place writes vs output_writer."""
+    workdir = tempfile.mkdtemp(prefix='slide-bench-')
+    cwd = os.getcwd()
+    try:
+        os.makedirs(os.path.join(workdir, 'slides'))
+        run_in_child(['_enhanced-worker', args.source], workdir)
+        os.chdir(workdir)
+        from output_writer import write_json
+
+        print(f"{'file':>10} {'writer':>12} {'KB':>7} {'ms/write':>9} {'reads':>6} {'torn':>5}")
+        for suffix in ['_slides.json', '_enhanced.json']:
+            path = os.path.join('slides', f'bench{suffix}')
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for label, write in [('indent=2', write_indented), ('output_writer', write_json)]:
+                times = []
+                for _ in range(args.rounds):
+                    started = time.perf_counter()
+                    write(path, data)
+                    times.append(time.perf_counter() - started)
+                size_kb = os.path.getsize(path) / 1024
+                reads, torn = count_torn_reads(path, data, write, args.seconds)
+                print(f"{suffix[1:-5]:>10} {label:>12} {size_kb:>7.0f} {sorted(times)[len(times) // 2] * 1000:>9.1f} "
+                      f"{reads:>6} {torn:>5}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_coldstart(args):
+    """Time to import the app in a fresh process, with heavy imports deferred vs. eager."""
+    workdir = tempfile.mkdtemp(prefix='coldstart-bench-')
+    try:
+        print(f"{'imports':>10} {'median s':>9} {'min s':>7} {'max s':>7}")
+        for mode in ['deferred', 'eager']:
+            times = sorted(import_app_seconds(workdir, mode == 'eager') for _ in range(args.runs))
+            print(f"{mode:>10} {times[len(times) // 2]:>9.3f} {times[0]:>7.3f} {times[-1]:>7.3f}")
+
+        print("\nSlowest direct imports of app (deferred):")
+        for seconds, name in import_breakdown(workdir, args.top):
+            print(f"  {seconds:>7.3f}s  {name}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def detect_labelled_pages(labels, detector):
+    """Run one math detector over the labelled pages; returns per-page results and timing."""
+    import contextlib
+    import io
+    import fitz
+    import pdf_processor
+    from math_detector import classify_page
+
+    results = []
+    seconds = 0.0
+    for name, pages in labels.items():
+        doc = fitz.open(os.path.join(REPO_DIR, 'original_files', name))
+        try:
+            for expected, numbers in [(True, pages["math"]), (False, pages["no_math"])]:
+                for number in numbers:
+                    page = doc[number - 1]
+                    started = time.perf_counter()
+                    if detector == 'fonts':
+                        analysis = classify_page(page)
+                        detected, regions = analysis["has_math"], len(analysis["formulas"])
+                    else:
+                        # The text detector prints its reasoning for every page
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            detected = pdf_processor.detect_page_math_text(page, number - 1)
+                            regions = len(pdf_processor._text_formula_lines(page))
+                    seconds += time.perf_counter() - started
+                    results.append((name, number, expected, detected, regions))
+        finally:
+            doc.close()
+    return results, seconds
+
+def bench_math(args):
+    """Precision and recall of the text and font-aware math detectors on hand-labelled pages."""
+    with open(args.labels, 'r', encoding='utf-8') as f:
+        labels = json.load(f)["documents"]
+
+    print(f"{'detector':>9} {'precision':>9} {'recall':>7} {'pages':>6} {'math pages':>10} "
+          f"{'crops':>6} {'crops on non-math':>17} {'ms/page':>8}")
+    for detector in ['text', 'fonts']:
+        results, seconds = detect_labelled_pages(labels, detector)
+        tp = sum(1 for r in results if r[2] and r[3])
+        fp = sum(1 for r in results if not r[2] and r[3])
+        fn = sum(1 for r in results if r[2] and not r[3])
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        crops = sum(r[4] for r in results)
+        wasted = sum(r[4] for r in results if not r[2])
+        print(f"{detector:>9} {precision:>9.2f} {recall:>7.2f} {len(results):>6} {tp + fp:>10} "
+              f"{crops:>6} {wasted:>17} {seconds / len(results) * 1000:>8.1f}")
+        if args.verbose:
+            for name, number, expected, detected, _ in results:
+                if expected != detected:
+                    print(f"    {'missed' if expected else 'false positive'}: {name} page {number}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    extraction = subparsers.add_parser('extraction', help=bench_extraction.__doc__)
+    extraction.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF whose pages are repeated')
+    extraction.add_argument('--pages', type=int, nargs='+', default=[50, 200, 800])
+    extraction.add_argument('--modes', nargs='+', default=['memory', 'stream'], choices=['memory', 'stream'])
+    extraction.set_defaults(func=bench_extraction)
+
+    server = subparsers.add_parser('server', help=bench_server.__doc__)
+    server.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF extracted as the benchmark deck')
+    server.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    server.add_argument('--threads', type=int, default=4)
+    server.add_argument('--concurrency', type=int, default=16)
+    server.add_argument('--duration', type=float, default=10)
+    server.add_argument('--port', type=int, default=8765)
+    server.set_defaults(func=bench_server)
+
+    ask = subparsers.add_parser('ask', help=bench_ask.__doc__)
+    ask.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF extracted as the benchmark deck')
+    ask.add_argument('--latency', type=float, default=2.0, help='Fake model latency in seconds')
+    ask.add_argument('--concurrency', type=int, default=200)
+    ask.add_argument('--threads', type=int, default=8, help='Threads of the threaded worker')
+    ask.add_argument('--model-concurrency', type=int, default=500)
+    ask.add_argument('--duration', type=float, default=15)
+    ask.add_argument('--port', type=int, default=8766)
+    ask.set_defaults(func=bench_ask)
+
+    burst = subparsers.add_parser('burst', help=bench_burst.__doc__)
+    burst.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF extracted as the benchmark deck')
+    burst.add_argument('--students', type=int, default=30)
+    burst.add_argument('--rounds', type=int, default=5)
+    burst.add_argument('--latency', type=float, default=1.0, help='Fake model latency in seconds')
+    burst.add_argument('--model-concurrency', type=int, default=8,
+                       help='Outbound call limit; a burst larger than this queues without coalescing')
+    burst.add_argument('--port', type=int, default=8767)
+    burst.set_defaults(func=bench_burst)
+
+    coldstart = subparsers.add_parser('coldstart', help=bench_coldstart.__doc__)
+    coldstart.add_argument('--runs', type=int, default=5)
+    coldstart.add_argument('--top', type=int, default=10, help='Number of slowest imports listed')
+    coldstart.set_defaults(func=bench_coldstart)
+
+    math = subparsers.add_parser('math', help=bench_math.__doc__)
+    math.add_argument('--labels', default=MATH_LABELS, help='JSON file with labelled pages per PDF')
+    math.add_argument('--verbose', action='store_true', help='List the misclassified pages')
+    math.set_defaults(func=bench_math)
+
+    admission = subparsers.add_parser('admission', help=bench_admission.__doc__)
+    admission.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF extracted as the benchmark deck')
+    admission.add_argument('--polite', type=int, default=20, help='Clients asking at --polite-rate')
+    admission.add_argument('--polite-rate', type=float, default=0.5, help='Questions per second per polite client')
+    admission.add_argument('--abusive', type=int, default=4, help='Clients asking as fast as they can')
+    admission.add_argument('--abusive-concurrency', type=int, default=4,
+                           help='Connections per abusive client (the generator shares the CPU with the server)')
+    admission.add_argument('--latency', type=float, default=0.5, help='Fake model latency in seconds')
+    admission.add_argument('--model-concurrency', type=int, default=8, help='Outbound call limit (upstream capacity)')
+    admission.add_argument('--client-rate', type=float, default=1.0)
+    admission.add_argument('--client-burst', type=float, default=3)
+    admission.add_argument('--global-rate', type=float, default=16, help='Should match the upstream capacity')
+    admission.add_argument('--duration', type=float, default=20)
+    admission.add_argument('--port', type=int, default=8768)
+    admission.set_defaults(func=bench_admission)
+
+    scheduler = subparsers.add_parser('scheduler', help=bench_scheduler.__doc__)
+    scheduler.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF extracted over and over in the background')
+    scheduler.add_argument('--concurrency', type=int, default=8)
+    scheduler.add_argument('--threads', type=int, default=8)
+    scheduler.add_argument('--latency', type=float, default=0.2, help='Fake model latency in seconds')
+    scheduler.add_argument('--duration', type=float, default=30)
+    scheduler.add_argument('--port', type=int, default=8769)
+    scheduler.set_defaults(func=bench_scheduler)
+
+    wire = subparsers.add_parser('wire', help=bench_wire.__doc__)
+    wire.add_argument('--source', default=DEFAULT_SOURCE_PDF, help='PDF uploaded at the start of the session')
+    wire.add_argument('--pages', type=int, default=10)
+    wire.add_argument('--questions', type=int, default=3)
+    wire.add_argument('--settle', type=float, default=5, help='Seconds between the first and the repeat visit')
+    wire.add_argument('--port', type=int, default=8770)
+    wire.set_defaults(func=bench_wire)
+
+    prewarm = subparsers.add_parser('prewarm', help=bench_prewarm.__doc__)
+    prewarm.add_argument('--source', default=DEFAULT_SOURCE_PDF)
+    prewarm.add_argument('--latency', type=float, default=0.5, help='Fake model latency in seconds')
+    prewarm.add_argument('--timeout', type=float, default=300, help='Longest wait for pre-warming to finish')
+    prewarm.add_argument('--port', type=int, default=8771)
+    prewarm.set_defaults(func=bench_prewarm)
+
+    outputs = subparsers.add_parser('outputs', help=bench_outputs.__doc__)
+    outputs.add_argument('--source', default=DEFAULT_SOURCE_PDF)
+    outputs.add_argument('--rounds', type=int, default=10)
+    outputs.add_argument('--seconds', type=float, default=2, help='Duration of the concurrent read test')
+    outputs.set_defaults(func=bench_outputs)
+
+    enhanced = subparsers.add_parser('_enhanced-worker')
+    enhanced.add_argument('pdf_path')
+    enhanced.set_defaults(func=lambda a: enhanced_worker(a.pdf_path))
+
+    worker = subparsers.add_parser('_extraction-worker')
+    worker.add_argument('pdf_path')
+    worker.add_argument('mode')
+    worker.set_defaults(func=lambda a: extraction_worker(a.pdf_path, a.mode))
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
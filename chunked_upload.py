@@ -0,0 +1,163 @@
+"""
+Resumable chunked uploads.
+
+    POST /uploads                      {"filename", "size"}  -> session with upload_id, chunk_size, received
+    GET  /uploads/<id>                 -> how many bytes the server has (resume from there)
+    PUT  /uploads/<id>?offset=N        raw chunk body, X-Chunk-SHA256 header
+    POST /uploads/<id>/complete        -> the file is verified, stored and extracted
+
+Chunks are written straight from the request stream into a .part file at their offset, so
+the body is never spooled or held in memory. A chunk only counts once its checksum matched;
+anything written past the last verified offset is truncated away before the next chunk.
+Sessions live in the shared cache so every worker process can serve any chunk.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from shared_cache import shared_cache
+
+UPLOAD_PARTIAL_FOLDER = os.path.join('slides', '.uploads')
+
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', str(1024 * 1024 * 1024)))
+
+# Uploads that received a chunk within UPLOAD_IDLE_TIMEOUT seconds count as in progress;
+# at most MAX_ACTIVE_UPLOADS of them are allowed at once. Idle sessions stay resumable
+# until UPLOAD_SESSION_TTL.
+MAX_ACTIVE_UPLOADS = int(os.getenv('MAX_ACTIVE_UPLOADS', '8'))
+UPLOAD_IDLE_TIMEOUT = int(os.getenv('UPLOAD_IDLE_TIMEOUT', '120'))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))
+
+ALLOWED_EXTENSIONS = ('.ppt', '.pptx', '.pdf')
+
+_WRITE_BLOCK = 64 * 1024
+
+class UploadError(Exception):
+    """A rejected upload request; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+def part_path(upload_id):
+    return os.path.join(UPLOAD_PARTIAL_FOLDER, f'{upload_id}.part')
+
+def _public(session):
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "received": session["received"]
+    }
+
+def _save(session):
+    session["updated"] = time.time()
+    shared_cache.set("upload-sessions", session["upload_id"], session, ttl=UPLOAD_SESSION_TTL)
+
+def get_session(upload_id):
+    session = shared_cache.get("upload-sessions", upload_id)
+    if session is None:
+        raise UploadError(f"Unknown or expired upload '{upload_id}'", status=404)
+    return session
+
+def active_uploads():
+    cutoff = time.time() - UPLOAD_IDLE_TIMEOUT
+    return sum(1 for s in shared_cache.values("upload-sessions") if s.get("updated", 0) >= cutoff)
+
+def remove_stale_parts():
+    """Delete .part files whose session has expired."""
+    try:
+        names = os.listdir(UPLOAD_PARTIAL_FOLDER)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith('.part') and shared_cache.get("upload-sessions", name[:-len('.part')]) is None:
+            try:
+                os.remove(os.path.join(UPLOAD_PARTIAL_FOLDER, name))
+            except OSError:
+                pass
+
+def start_upload(filename, size):
+    filename = os.path.basename(filename or '')
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        raise UploadError("Only .ppt, .pptx and .pdf files can be uploaded")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("A positive file size is required")
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"File is larger than the {MAX_UPLOAD_SIZE} byte limit", status=413)
+    if active_uploads() >= MAX_ACTIVE_UPLOADS:
+        raise UploadError("Too many uploads in progress, try again shortly", status=429,
+                          retry_after=UPLOAD_IDLE_TIMEOUT // 4 or 1)
+
+    remove_stale_parts()
+    os.makedirs(UPLOAD_PARTIAL_FOLDER, exist_ok=True)
+    session = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": size,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "received": 0,
+        "created": time.time()
+    }
+    open(part_path(session["upload_id"]), 'wb').close()
+    _save(session)
+    print(f"Started chunked upload {session['upload_id']} for {filename} ({size} bytes)")
+    return _public(session)
+
+def upload_status(upload_id):
+    return _public(get_session(upload_id))
+
+def write_chunk(upload_id, offset, stream, length, checksum=None):
+    """Write one chunk read from stream at offset; returns the updated session."""
+    session = get_session(upload_id)
+    if offset != session["received"]:
+        raise UploadError("Chunk does not start at the next expected offset", status=409,
+                          received=session["received"])
+    if length is None or length <= 0:
+        raise UploadError("Chunk body with a Content-Length is required")
+    if length > session["chunk_size"] or offset + length > session["size"]:
+        raise UploadError("Chunk is larger than allowed", status=413)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(upload_id), 'r+b') as f:
+        f.truncate(offset)  # drop anything left over from an interrupted chunk
+        f.seek(offset)
+        try:
+            while written < length:
+                block = stream.read(min(_WRITE_BLOCK, length - written))
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                written += len(block)
+            if written != length:
+                raise UploadError(f"Chunk ended after {written} of {length} bytes", received=offset)
+            if checksum and digest.hexdigest() != checksum.lower():
+                raise UploadError("Chunk checksum mismatch", status=422, received=offset)
+        except BaseException:
+            f.truncate(offset)
+            raise
+
+    session["received"] = offset + written
+    _save(session)
+    return _public(session)
+
+def finish_upload(upload_id):
+    """Check that every byte arrived; returns (session, path of the assembled file)."""
+    session = get_session(upload_id)
+    path = part_path(upload_id)
+    if session["received"] != session["size"] or os.path.getsize(path) != session["size"]:
+        raise UploadError("Upload is incomplete", status=409, received=session["received"])
+    return session, path
+
+def discard_session(upload_id):
+    shared_cache.delete("upload-sessions", upload_id)
+    try:
+        os.remove(part_path(upload_id))
+    except OSError:
+        pass
@@ -0,0 +1,185 @@
+"""
+Hierarchical summaries of a presentation, built once after ingest:
+per-slide (extractive), per-section and whole-deck (written by the model).
+Whole-deck questions are answered from this tree plus the few raw slides that
+match the question, so the prompt no longer grows with the length of the deck.
+
+    python deck_summaries.py "Lecture 05-Arrays"      # build for an existing deck
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from llm_client import generate_content
+from output_writer import write_json
+
+UPLOAD_FOLDER = 'slides'
+
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gemini-2.0-flash')
+
+# Consecutive slides grouped into one section summary
+SUMMARY_SECTION_SIZE = int(os.getenv('SUMMARY_SECTION_SIZE', '8'))
+
+# How much of the tree a whole-deck question gets: best matching sections and raw slides
+SUMMARY_CONTEXT_SECTIONS = int(os.getenv('SUMMARY_CONTEXT_SECTIONS', '4'))
+SUMMARY_CONTEXT_SLIDES = int(os.getenv('SUMMARY_CONTEXT_SLIDES', '4'))
+
+SLIDE_SUMMARY_CHARS = 240
+
+_building = set()
+_building_lock = threading.Lock()
+
+def summaries_path(filename):
+    return os.path.join(UPLOAD_FOLDER, f'{filename}_summaries.json')
+
+def source_path(filename):
+    """The extraction output the summaries are built from (enhanced data when present)."""
+    enhanced = os.path.join(UPLOAD_FOLDER, f'{filename}_enhanced.json')
+    return enhanced if os.path.exists(enhanced) else os.path.join(UPLOAD_FOLDER, f'{filename}_slides.json')
+
+def source_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def summarize_slide(slide):
+    """Extractive one-liner for a slide: its title plus the first lines of content."""
+    title = (slide.get("title") or "").strip()
+    lines = [line.strip() for line in slide.get("text", "").split('\n') if line.strip()]
+    if lines and lines[0] == title:
+        lines = lines[1:]
+    summary = (title + ": " if title else "") + " / ".join(lines)
+    return summary[:SLIDE_SUMMARY_CHARS].rstrip() + ("..." if len(summary) > SLIDE_SUMMARY_CHARS else "")
+
+def _ask_model(prompt, generate_fn):
+    response = generate_fn(SUMMARY_MODEL, prompt)
+    return response.text.strip()
+
+def summarize_section(slides, generate_fn):
+    slide_text = "\n\n".join(f"Slide/Page {s['slide_number']}:\n{s['text']}" for s in slides)
+    return _ask_model(
+        "Summarize the following part of a lecture in at most 5 sentences. "
+        "Name the key concepts, definitions and formulas, and which slides cover them.\n\n"
+        f"{slide_text}",
+        generate_fn
+    )
+
+def summarize_deck(section_summaries, generate_fn):
+    overview = "\n".join(f"Slides {s['first_slide']}-{s['last_slide']}: {s['summary']}" for s in section_summaries)
+    return _ask_model(
+        "These are summaries of consecutive sections of one lecture. Write an overview of the whole "
+        "lecture in at most 8 sentences, keeping the order of topics and their slide numbers.\n\n"
+        f"{overview}",
+        generate_fn
+    )
+
+def build_deck_summaries(filename, generate_fn=generate_content):
+    """Build and persist the summary tree for one presentation. generate_fn can be a stub model."""
+    path = source_path(filename)
+    version = source_version(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        slides = json.load(f).get("slides", [])
+
+    start = time.time()
+    sections = []
+    for i in range(0, len(slides), SUMMARY_SECTION_SIZE):
+        chunk = slides[i:i + SUMMARY_SECTION_SIZE]
+        sections.append({
+            "first_slide": chunk[0]["slide_number"],
+            "last_slide": chunk[-1]["slide_number"],
+            "summary": summarize_section(chunk, generate_fn),
+            "slide_summaries": {str(s["slide_number"]): summarize_slide(s) for s in chunk}
+        })
+
+    summaries = {
+        "filename": filename,
+        "source_file": os.path.basename(path),
+        "source_version": version,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_slides": len(slides),
+        "deck_summary": summarize_deck(sections, generate_fn) if sections else "",
+        "sections": sections
+    }
+
+    write_json(summaries_path(filename), summaries, filename)
+
+    print(f"Built summaries for {filename}: {len(sections)} sections in {time.time() - start:.1f}s")
+    return summaries
+
+def schedule_deck_summaries(filename, generate_fn=generate_content):
+    """Build the summaries in a background thread (once at a time per presentation)."""
+    with _building_lock:
+        if filename in _building:
+            return False
+        _building.add(filename)
+
+    def run():
+        try:
+            build_deck_summaries(filename, generate_fn)
+        except Exception as e:
+            print(f"Error building summaries for {filename}: {e}")
+        finally:
+            with _building_lock:
+                _building.discard(filename)
+
+    threading.Thread(target=run, name=f"summaries-{filename}", daemon=True).start()
+    return True
+
+def load_deck_summaries(filename):
+    """Summaries for the presentation, or None when missing or built from an older extraction."""
+    try:
+        with open(summaries_path(filename), 'r', encoding='utf-8') as f:
+            summaries = json.load(f)
+        if summaries.get("source_version") != source_version(source_path(filename)):
+            return None
+        return summaries
+    except (OSError, ValueError):
+        return None
+
+def _terms(text):
+    return set(re.findall(r'[a-z0-9]{3,}', text.lower()))
+
+def _overlap(query_terms, text):
+    return len(query_terms & _terms(text))
+
+def build_summary_context(summaries, slides, question):
+    """
+    Prompt context for a whole-deck question: the deck overview, the sections closest to the
+    question, and the raw text of the best matching slides (drill-down).
+    """
+    query_terms = _terms(question)
+    sections = summaries.get("sections", [])
+
+    ranked_sections = sorted(
+        sections,
+        key=lambda s: _overlap(query_terms, s["summary"] + " " + " ".join(s["slide_summaries"].values())),
+        reverse=True
+    )[:SUMMARY_CONTEXT_SECTIONS]
+    ranked_sections.sort(key=lambda s: s["first_slide"])
+
+    scored_slides = [(_overlap(query_terms, s.get("text", "")), s) for s in slides]
+    scored_slides = sorted((item for item in scored_slides if item[0] > 0), key=lambda item: item[0], reverse=True)
+    ranked_slides = sorted((s for _, s in scored_slides[:SUMMARY_CONTEXT_SLIDES]), key=lambda s: s["slide_number"])
+
+    parts = [f"Overview of the whole presentation ({summaries.get('total_slides', len(slides))} slides/pages):",
+             summaries.get("deck_summary", "")]
+
+    if ranked_sections:
+        parts.append("\nSections most related to the question:")
+        for section in ranked_sections:
+            parts.append(f"Slides {section['first_slide']}-{section['last_slide']}: {section['summary']}")
+
+    if ranked_slides:
+        parts.append("\nMost relevant slides/pages in full:")
+        for slide in ranked_slides:
+            parts.append(f"Slide/Page {slide['slide_number']}:\n{slide['text']}")
+
+    return "\n".join(parts)
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    for name in sys.argv[1:]:
+        build_deck_summaries(name)
@@ -0,0 +1,309 @@
+"""
+Watch mode for the originals folder: keeps the extraction outputs in slides/ in step with
+the presentations in original_files/.
+
+    python folder_watcher.py              # watch until interrupted
+    python folder_watcher.py --once       # reconcile once and exit (e.g. from cron)
+    python folder_watcher.py --mode poll  # without inotify
+
+Changes are picked up with inotify where available (Linux), otherwise by polling the folder.
+A changed file is only extracted once it has been left alone for WATCH_DEBOUNCE seconds, so a
+copy in progress is never read half-written. Files are tracked by content hash in the shared
+cache: a touched or re-copied file with the same bytes is not extracted again, and a file that
+was already extracted under the same name (an upload through /upload) is only recorded.
+When a source disappears, its outputs in slides/ are removed.
+
+Memory does not grow with the library: the folder and the tracked state are streamed during
+a scan, and only files changed in the last few seconds are held in memory. With inotify the
+folder is scanned once at startup (and after an event queue overflow), never periodically.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from library_index import library_index
+from output_writer import presentation_writer
+from shared_cache import shared_cache
+from slide_dedup import slide_dedup
+from slide_vectors import slide_vectors
+from upload_store import (ORIGINAL_FILES_FOLDER, file_version, hash_file, register_original,
+                          remove_extraction, reusable_extraction)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.ppt', '.pptx')
+
+# auto (inotify if available, else polling), inotify or poll
+WATCH_MODE = os.getenv('WATCH_MODE', 'auto')
+
+# Seconds a file must stay unchanged before it is extracted
+WATCH_DEBOUNCE = float(os.getenv('WATCH_DEBOUNCE', '2'))
+
+# Seconds between scans of the folder when polling
+WATCH_POLL_INTERVAL = float(os.getenv('WATCH_POLL_INTERVAL', '10'))
+
+STATE_NAMESPACE = 'watched_sources'
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+class Inotify:
+    """Minimal inotify binding through libc (Linux only)."""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout):
+        """(mask, name) of the events arriving within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def is_source(name):
+    """Presentation files; hidden files, Office lock files and temporary files are not."""
+    return name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith(('.', '~$'))
+
+def _version(path):
+    try:
+        return file_version(path)
+    except OSError:
+        return None
+
+class FolderWatcher:
+    def __init__(self, folder=ORIGINAL_FILES_FOLDER, mode=WATCH_MODE, debounce=WATCH_DEBOUNCE,
+                 poll_interval=WATCH_POLL_INTERVAL):
+        self.folder = folder
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.pending = {}  # filename -> (due time, version when last seen; None if missing)
+        self.stats = {"extracted": 0, "recorded": 0, "unchanged": 0, "removed": 0, "failed": 0, "scans": 0}
+
+    def _is_conversion_output(self, name):
+        """The .pptx written next to a .ppt by convert_ppt_to_pptx is not a source of its own."""
+        stem, ext = os.path.splitext(name)
+        return ext.lower() == '.pptx' and os.path.exists(os.path.join(self.folder, f'{stem}.ppt'))
+
+    def schedule(self, name):
+        if not is_source(name) or self._is_conversion_output(name):
+            return
+        self.pending[name] = (time.time() + self.debounce, _version(os.path.join(self.folder, name)))
+
+    def scan(self):
+        """Queue new, modified and deleted files by comparing the folder with the tracked state."""
+        self.stats["scans"] += 1
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_source(entry.name) or self._is_conversion_output(entry.name):
+                    continue
+                state = shared_cache.get(STATE_NAMESPACE, entry.name)
+                stat = entry.stat()
+                if not state or state["version"] != f"{stat.st_mtime_ns}-{stat.st_size}":
+                    self.schedule(entry.name)
+
+        for name, _ in shared_cache.items(STATE_NAMESPACE):
+            if name not in self.pending and not os.path.exists(os.path.join(self.folder, name)):
+                self.pending[name] = (time.time() + self.debounce, None)
+
+    def process_due(self):
+        """Handle the pending files that have been left alone long enough; returns the count."""
+        now = time.time()
+        ready = []
+        for name, (due, version) in list(self.pending.items()):
+            if due > now:
+                continue
+            current = _version(os.path.join(self.folder, name))
+            if current != version:
+                self.pending[name] = (now + self.debounce, current)  # still being written
+                continue
+            del self.pending[name]
+            ready.append((name, current))
+
+        # New and modified files first, so a renamed file can reuse its old outputs before they go
+        for name, version in sorted(ready, key=lambda item: item[1] is None):
+            try:
+                if version is None:
+                    self.remove(name)
+                else:
+                    self.process(name)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Watcher: error handling {name}: {e}")
+        return len(ready)
+
+    def process(self, name):
+        path = os.path.join(self.folder, name)
+        version = file_version(path)
+        digest = hash_file(path)
+        if file_version(path) != version:
+            self.schedule(name)  # changed while it was being hashed
+            return
+
+        state = shared_cache.get(STATE_NAMESPACE, name)
+        if state and state["sha256"] == digest:
+            # Touched or copied over with identical bytes
+            state["version"] = version
+            shared_cache.set(STATE_NAMESPACE, name, state)
+            self.stats["unchanged"] += 1
+            return
+
+        basename = name.rsplit('.', 1)[0]
+        stored = register_original(path, digest)
+        failed = False
+        if reusable_extraction(digest) == basename:
+            print(f"Watcher: {name} is already extracted")
+            self.stats["recorded"] += 1
+        else:
+            from app import process_stored_upload
+
+            print(f"Watcher: extracting {name}")
+            started = time.perf_counter()
+            failed = process_stored_upload(name, stored) is None
+            if failed:
+                print(f"Watcher: extraction of {name} failed")
+                self.stats["failed"] += 1
+            else:
+                print(f"Watcher: extracted {name} in {time.perf_counter() - started:.1f}s")
+                self.stats["extracted"] += 1
+
+        # A failed file is retried once it changes again, not on every scan
+        shared_cache.set(STATE_NAMESPACE, name, {
+            "version": version, "sha256": digest, "basename": basename, "failed": failed
+        })
+
+    def remove(self, name):
+        state = shared_cache.get(STATE_NAMESPACE, name)
+        if not state:
+            return
+        basename = state["basename"]
+        if name.lower().endswith('.ppt'):
+            converted = os.path.join(self.folder, f'{basename}.pptx')
+            if os.path.exists(converted):
+                os.remove(converted)
+
+        # Another source with the same basename still owns the outputs
+        if any(os.path.exists(os.path.join(self.folder, f'{basename}{ext}')) for ext in SUPPORTED_EXTENSIONS):
+            print(f"Watcher: {name} was removed, keeping the outputs of another {basename} source")
+        else:
+            with presentation_writer(basename):
+                removed = remove_extraction(basename, name)
+            library_index.update_presentation(basename)
+            slide_dedup.update_presentation(basename)
+            slide_vectors.update_presentation(basename)
+            print(f"Watcher: {name} was removed, deleted {len(removed)} outputs")
+            self.stats["removed"] += 1
+        shared_cache.delete(STATE_NAMESPACE, name)
+
+    def _open_inotify(self):
+        if self.mode == 'poll':
+            return None
+        try:
+            return Inotify(self.folder)
+        except (OSError, AttributeError) as e:
+            if self.mode == 'inotify':
+                raise
+            print(f"inotify unavailable ({e}); polling every {self.poll_interval}s")
+            return None
+
+    def _timeout(self, limit):
+        if not self.pending:
+            return limit
+        return max(0.0, min(limit, min(due for due, _ in self.pending.values()) - time.time()))
+
+    def run_once(self):
+        """Scan and handle everything found, waiting out the debounce; for cron and tests."""
+        self.scan()
+        while self.pending:
+            time.sleep(self._timeout(self.debounce))
+            self.process_due()
+        return self.stats
+
+    def run(self):
+        os.makedirs(self.folder, exist_ok=True)
+        inotify = self._open_inotify()
+        print(f"Watching {os.path.abspath(self.folder)} ({'inotify' if inotify else 'polling'})")
+        self.scan()
+        next_scan = time.time() + self.poll_interval
+        try:
+            while True:
+                if inotify:
+                    for mask, name in inotify.read(self._timeout(60)):
+                        if mask & IN_Q_OVERFLOW:
+                            print("Watcher: inotify queue overflowed, rescanning")
+                            self.scan()
+                        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                            print("Watcher: the watched folder went away; polling from now on")
+                            inotify.close()
+                            inotify = None
+                            break
+                        elif name:
+                            self.schedule(name)
+                else:
+                    time.sleep(self._timeout(max(0.0, next_scan - time.time())))
+                    if time.time() >= next_scan:
+                        if os.path.isdir(self.folder):
+                            self.scan()
+                        next_scan = time.time() + self.poll_interval
+                self.process_due()
+        finally:
+            if inotify:
+                inotify.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folder', default=ORIGINAL_FILES_FOLDER)
+    parser.add_argument('--mode', default=WATCH_MODE, choices=['auto', 'inotify', 'poll'])
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE)
+    parser.add_argument('--poll-interval', type=float, default=WATCH_POLL_INTERVAL)
+    parser.add_argument('--once', action='store_true', help='Reconcile the folder once and exit')
+    args = parser.parse_args()
+
+    watcher = FolderWatcher(args.folder, args.mode, args.debounce, args.poll_interval)
+    if args.once:
+        print(watcher.run_once())
+        return
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print(f"Watcher stopped: {watcher.stats}")
+        sys.exit(0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Deferred imports for the heavy third-party modules (PyMuPDF, PyPDF2, python-pptx, requests).
+
+    fitz = lazy_module('fitz')
+    doc = fitz.open(path)        # the real import happens here, on first attribute access
+
+Importing app therefore no longer pays for PDF/PPTX libraries that a worker answering
+questions may never touch. How long each deferred import took is kept for /metrics.
+"""
+import importlib
+import sys
+import threading
+import time
+
+# Time spent importing app (its imports plus module-level setup), filled in by app.py
+_startup = {"app_import_seconds": None}
+
+_import_times = {}
+_lock = threading.RLock()
+
+class LazyModule:
+    """Module proxy that imports the real module the first time one of its attributes is used."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is not None:
+            return module
+        with _lock:
+            module = self.__dict__["_module"]
+            if module is None:
+                name = self.__dict__["_name"]
+                already_loaded = name in sys.modules
+                start = time.perf_counter()
+                module = importlib.import_module(name)
+                if not already_loaded:
+                    _import_times[name] = round(time.perf_counter() - start, 4)
+                self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+def lazy_module(name):
+    return LazyModule(name)
+
+def preload(*names):
+    """Import the given modules now, e.g. in the server master before workers are forked."""
+    for name in names:
+        lazy_module(name)._load()
+
+def record_app_import(seconds):
+    _startup["app_import_seconds"] = round(seconds, 4)
+
+def get_startup_report():
+    with _lock:
+        return {
+            "app_import_seconds": _startup["app_import_seconds"],
+            "deferred_imports": dict(_import_times)
+        }
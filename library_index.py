@@ -0,0 +1,223 @@
+"""
+Inverted index over every extracted presentation in slides/ (the *_slides.json files).
+Backs /search and the library-wide scope of /ask: ranked (presentation, slide) hits
+with snippets, scored with BM25.
+
+The index is persisted next to the shared cache and kept current incrementally:
+only presentations whose extraction file changed are re-tokenized.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+UPLOAD_FOLDER = 'slides'
+LIBRARY_INDEX_PATH = os.getenv('LIBRARY_INDEX_PATH', os.path.join('slides', '.cache', 'library_index.json'))
+
+# Directory rescans for changed decks happen at most this often (seconds)
+LIBRARY_REFRESH_INTERVAL = float(os.getenv('LIBRARY_REFRESH_INTERVAL', '5'))
+
+SNIPPET_CHARS = 200
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "but", "is", "are", "was", "were", "be", "in", "to", "of",
+    "for", "with", "on", "at", "from", "by", "about", "as", "what", "when", "where", "who",
+    "how", "why", "which", "this", "that", "these", "those", "it", "its", "can", "do", "does",
+    "vs", "between", "lecture", "slide", "slides", "page", "covered", "cover", "covers"
+}
+
+def tokenize(text):
+    return [t for t in re.findall(r'[a-z0-9]+', text.lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+def _stem(term):
+    """Very light plural folding so 'exceptions' finds 'exception'."""
+    if len(term) > 4 and term.endswith('ies'):
+        return term[:-3] + 'y'
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+        return term[:-1]
+    return term
+
+def index_terms(text):
+    return [_stem(t) for t in tokenize(text)]
+
+def _file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+class LibraryIndex:
+    def __init__(self, folder=UPLOAD_FOLDER, path=LIBRARY_INDEX_PATH):
+        self.folder = folder
+        self.path = path
+        self.documents = {}  # filename -> {"version", "slides": {slide_number: {"title", "text", "length"}}}
+        self.postings = {}   # term -> {filename: {slide_number: term frequency}}
+        self.total_length = 0
+        self.total_slides = 0
+        self._lock = threading.RLock()
+        self._last_refresh = 0
+        self._loaded = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.documents = data["documents"]
+            self.postings = data["postings"]
+        except (OSError, ValueError, KeyError):
+            self.documents, self.postings = {}, {}
+        self._recount()
+        self._loaded = True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"documents": self.documents, "postings": self.postings}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def _recount(self):
+        self.total_slides = sum(len(doc["slides"]) for doc in self.documents.values())
+        self.total_length = sum(s["length"] for doc in self.documents.values() for s in doc["slides"].values())
+
+    def _remove(self, filename):
+        doc = self.documents.pop(filename, None)
+        if not doc:
+            return
+        for term in doc.get("terms", []):
+            files = self.postings.get(term)
+            if files is not None:
+                files.pop(filename, None)
+                if not files:
+                    del self.postings[term]
+
+    def _add(self, filename, version, slides):
+        doc = {"version": version, "slides": {}, "terms": []}
+        doc_terms = set()
+        for slide in slides:
+            number = str(slide["slide_number"])
+            terms = index_terms(slide.get("text", ""))
+            doc["slides"][number] = {"title": slide.get("title", ""), "text": slide.get("text", ""), "length": len(terms)}
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {}).setdefault(filename, {})[number] = tf
+            doc_terms.update(counts)
+        doc["terms"] = sorted(doc_terms)
+        self.documents[filename] = doc
+
+    def update_presentation(self, filename):
+        """(Re)index one presentation from its _slides.json, or drop it if the file is gone."""
+        path = os.path.join(self.folder, f'{filename}_slides.json')
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._remove(filename)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._add(filename, _file_version(path), json.load(f).get("slides", []))
+            self._recount()
+            self._save()
+
+    def refresh(self, force=False):
+        """Pick up new, changed and deleted presentations; returns the number of decks reindexed."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if not force and time.time() - self._last_refresh < LIBRARY_REFRESH_INTERVAL:
+                return 0
+            self._last_refresh = time.time()
+
+            current = {}
+            for name in os.listdir(self.folder):
+                if name.endswith('_slides.json'):
+                    current[name[:-len('_slides.json')]] = _file_version(os.path.join(self.folder, name))
+
+            changed = [f for f, version in current.items()
+                       if self.documents.get(f, {}).get("version") != version]
+            removed = [f for f in self.documents if f not in current]
+
+            for filename in removed:
+                self._remove(filename)
+            for filename in changed:
+                self._remove(filename)
+                try:
+                    with open(os.path.join(self.folder, f'{filename}_slides.json'), 'r', encoding='utf-8') as f:
+                        self._add(filename, current[filename], json.load(f).get("slides", []))
+                except (OSError, ValueError) as e:
+                    print(f"Could not index {filename}: {e}")
+
+            if changed or removed:
+                self._recount()
+                self._save()
+                print(f"Library index: reindexed {len(changed)} presentations, removed {len(removed)}")
+            return len(changed)
+
+    def search(self, query, limit=10, filenames=None):
+        """Ranked (presentation, slide) hits for a free-text query."""
+        self.refresh()
+        query_terms = list(dict.fromkeys(index_terms(query)))
+        allowed = set(filenames) if filenames else None
+
+        with self._lock:
+            if not self.total_slides:
+                return []
+            avg_length = self.total_length / self.total_slides
+            scores = {}
+            for term in query_terms:
+                files = self.postings.get(term)
+                if not files:
+                    continue
+                df = sum(len(slide_tfs) for slide_tfs in files.values())
+                idf = math.log(1 + (self.total_slides - df + 0.5) / (df + 0.5))
+                for filename, slide_tfs in files.items():
+                    if allowed is not None and filename not in allowed:
+                        continue
+                    slides = self.documents[filename]["slides"]
+                    for number, tf in slide_tfs.items():
+                        length = slides[number]["length"]
+                        score = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+                        scores[(filename, number)] = scores.get((filename, number), 0) + score
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            hits = []
+            for (filename, number), score in ranked:
+                slide = self.documents[filename]["slides"][number]
+                hits.append({
+                    "filename": filename,
+                    "slide_number": int(number),
+                    "title": slide["title"],
+                    "score": round(score, 3),
+                    "snippet": make_snippet(slide["text"], query_terms),
+                    "text": slide["text"]
+                })
+            return hits
+
+    def stats(self):
+        with self._lock:
+            return {
+                "presentations": len(self.documents),
+                "slides": self.total_slides,
+                "terms": len(self.postings)
+            }
+
+def make_snippet(text, query_terms):
+    """The line of the slide that matches the most query terms, trimmed around the first match."""
+    best_line, best_hits = "", -1
+    for line in text.split('\n'):
+        hits = len(set(index_terms(line)) & set(query_terms))
+        if hits > best_hits:
+            best_line, best_hits = line.strip(), hits
+    if len(best_line) <= SNIPPET_CHARS:
+        return best_line
+    lowered = best_line.lower()
+    first = min((lowered.find(t) for t in query_terms if t in lowered), default=0)
+    start = max(0, first - SNIPPET_CHARS // 3)
+    return ("..." if start else "") + best_line[start:start + SNIPPET_CHARS].strip() + "..."
+
+library_index = LibraryIndex()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from profiler import stage
+from single_flight import SingleFlight
+
+# "gemini" talks to the real API, "fake" answers locally after FAKE_MODEL_LATENCY seconds
+# so the server can be load-tested offline
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'gemini').lower()
+FAKE_MODEL_LATENCY = float(os.getenv('FAKE_MODEL_LATENCY', '1.0'))
+FAKE_MODEL_JITTER = float(os.getenv('FAKE_MODEL_JITTER', '0.2'))
+
+# Upper bound on outbound model / image API calls in flight per process. Under the gevent
+# worker class each waiting request is a cheap greenlet, so this can be in the hundreds.
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', '64'))
+
+# Identical prompts arriving while one is already in flight (a whole class asking about the
+# same slide) share that single upstream call. Followers wait at most COALESCE_WAIT_TIMEOUT.
+COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', '1') != '0'
+COALESCE_WAIT_TIMEOUT = float(os.getenv('COALESCE_WAIT_TIMEOUT', '90'))
+
+_single_flight = SingleFlight()
+
+_client = None
+_client_lock = threading.Lock()
+_semaphore = None
+_semaphore_lock = threading.Lock()
+_stats_lock = threading.Lock()
+
+_stats = {
+    "calls": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "waited_for_slot": 0
+}
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModels:
+    """Stand-in for client.models with a configurable, sleep-based latency."""
+
+    def generate_content(self, model, contents):
+        time.sleep(max(0.0, FAKE_MODEL_LATENCY + random.uniform(-FAKE_MODEL_JITTER, FAKE_MODEL_JITTER)))
+        prompt = contents if isinstance(contents, str) else next((p for p in contents if isinstance(p, str)), "")
+        question = prompt.split("Question:", 1)[-1].split("\n", 1)[0].strip()
+        return FakeResponse(f"<p>Fake {model} answer to: {question}</p>")
+
+class FakeClient:
+    def __init__(self):
+        self.models = FakeModels()
+
+def get_client():
+    """The Gemini client (or the fake one), created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if MODEL_BACKEND == 'fake':
+                print(f"Using fake model backend ({FAKE_MODEL_LATENCY}s latency)")
+                _client = FakeClient()
+            else:
+                from google import genai
+                _client = genai.Client(api_key=os.getenv("API_KEY"))
+    return _client
+
+def _get_semaphore():
+    # Created lazily so that it is built after gevent has patched threading
+    global _semaphore
+    with _semaphore_lock:
+        if _semaphore is None:
+            _semaphore = threading.BoundedSemaphore(MODEL_CONCURRENCY)
+    return _semaphore
+
+class outbound_call:
+    """Context manager holding one of the MODEL_CONCURRENCY slots for an outbound API call."""
+
+    def __enter__(self):
+        semaphore = _get_semaphore()
+        if not semaphore.acquire(blocking=False):
+            with _stats_lock:
+                _stats["waited_for_slot"] += 1
+            semaphore.acquire()
+        with _stats_lock:
+            _stats["calls"] += 1
+            _stats["in_flight"] += 1
+            _stats["max_in_flight"] = max(_stats["max_in_flight"], _stats["in_flight"])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with _stats_lock:
+            _stats["in_flight"] -= 1
+            if exc_type is not None:
+                _stats["errors"] += 1
+        _get_semaphore().release()
+        return False
+
+def prompt_fingerprint(model, contents):
+    """Hash of everything sent upstream: model name, prompt text and inline image data."""
+    raw = json.dumps([model, contents], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _generate_upstream(model, contents):
+    with outbound_call():
+        return get_client().models.generate_content(model=model, contents=contents)
+
+def generate_content(model, contents):
+    """
+    Call client.models.generate_content within the outbound concurrency limit,
+    coalescing concurrent identical requests into one upstream call.
+    """
+    with stage("model_call"):
+        if not COALESCE_REQUESTS:
+            return _generate_upstream(model, contents)
+        return _single_flight.do(
+            prompt_fingerprint(model, contents),
+            lambda: _generate_upstream(model, contents),
+            timeout=COALESCE_WAIT_TIMEOUT
+        )
+
+def fake_image_base64():
+    """Placeholder image for the fake backend: a 1x1 PNG after the configured latency."""
+    time.sleep(max(0.0, FAKE_MODEL_LATENCY))
+    return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+
+def get_llm_stats():
+    return dict(
+        _stats,
+        backend=MODEL_BACKEND,
+        concurrency_limit=MODEL_CONCURRENCY,
+        coalescing=dict(_single_flight.stats, enabled=COALESCE_REQUESTS, in_flight=_single_flight.in_flight())
+    )
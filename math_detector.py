@@ -0,0 +1,255 @@
+"""
+Font-aware math detection for PDF pages.
+
+One get_text("dict") pass per page classifies every text span from its font metadata:
+
+- glyphs of math fonts (Symbol, MT Extra, Cambria Math, the TeX CMMI/CMSY/CMEX families, ...);
+  Symbol-encoded text comes out of PyMuPDF as private-use codepoints, which are mapped back
+  to the Greek letters and operators they draw
+- relation and operator signs in any font
+- superscripts and subscripts: smaller spans raised or lowered off the line's baseline
+  (ordinal suffixes such as the "st" of 1st are not counted)
+- single italic letters, the usual typesetting of variables
+
+Lines with a signal are merged with their neighbours into regions, because display formulas are
+often laid out as one span per line. A region is a formula when it has enough signals and at
+least one relation or operator; a Greek letter, italic word or subscripted name in prose is not.
+"""
+import os
+
+# Fonts whose glyphs are math symbols rather than prose
+MATH_FONT_MARKERS = ('symbol', 'math', 'mt-extra', 'mtextra', 'cmmi', 'cmsy', 'cmex',
+                     'msam', 'msbm', 'euclid', 'mathematicalpi', 'stixgeneral', 'esstix')
+
+# Fonts that use the Adobe Symbol encoding (byte -> glyph below)
+SYMBOL_ENCODED_MARKERS = ('symbol',)
+
+# Symbol encoding: Latin letter positions hold the Greek alphabet
+_SYMBOL_GREEK = dict(zip(
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'ΑΒΧΔΕΦΓΗΙϑΚΛΜΝΟΠΘΡΣΤΥςΩΞΨΖαβχδεφγηιϕκλμνοπθρστυϖωξψζ'))
+
+_SYMBOL_OPERATORS = {
+    0x3D: '=', 0x3C: '<', 0x3E: '>', 0x2B: '+', 0x2D: '−', 0x2F: '/', 0x2A: '∗',
+    0xA2: '′', 0xA3: '≤', 0xA5: '∞', 0xB1: '±', 0xB2: '″', 0xB3: '≥', 0xB4: '×',
+    0xB5: '∝', 0xB6: '∂', 0xB8: '÷', 0xB9: '≠', 0xBA: '≡', 0xBB: '≈', 0xC4: '⊗',
+    0xC5: '⊕', 0xC6: '∅', 0xC7: '∩', 0xC8: '∪', 0xC9: '⊃', 0xCA: '⊇', 0xCB: '⊄',
+    0xCC: '⊂', 0xCD: '⊆', 0xCE: '∈', 0xCF: '∉', 0xD0: '∠', 0xD1: '∇', 0xD5: '∏',
+    0xD6: '√', 0xD7: '⋅', 0xD9: '∧', 0xDA: '∨', 0xE5: '∑', 0xF2: '∫',
+}
+
+# Pieces of tall brackets, radicals and integrals that only occur in display formulas
+_SYMBOL_BRACKET_PIECES = set(range(0xE6, 0xF0)) | set(range(0xF3, 0xFF))
+BRACKET_PIECE = '⎸'
+
+RELATIONS = set('=≠≈≡≤≥<>≪≫∝∼≅⊂⊃⊆⊇∈∉∋⊄')
+OPERATORS = set('±∓×÷√∛∫∬∮∑∏∂∇∞∅∩∪⊗⊕⋅∧∨∀∃′″⎸')
+WEAK_OPERATORS = set('+−∗^')
+GREEK = set('ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩαβγδεζηθικλμνξοπρστυφχψωϑϕϖς')
+
+ORDINAL_SUFFIXES = {'st', 'nd', 'rd', 'th'}
+
+# Signal weights and the score a region needs to count as a formula
+WEIGHT_RELATION = 2.0
+WEIGHT_OPERATOR = 1.5
+WEIGHT_WEAK_OPERATOR = 0.5
+WEIGHT_GREEK = 1.0
+WEIGHT_SCRIPT = 1.0
+WEIGHT_VARIABLE = 1.0
+WEIGHT_MATH_FONT = 0.5
+MAX_SPAN_SCORE = 4.0
+FORMULA_MIN_SCORE = float(os.getenv('FORMULA_MIN_SCORE', '2.0'))
+
+# A span counts as a script when it is this much smaller than the line's main text...
+SCRIPT_SIZE_RATIO = 0.85
+# ...and raised/lowered by this fraction of the main size (or flagged superscript)
+SCRIPT_SHIFT_RATIO = 0.12
+
+# Lines closer than this fraction of their font size are merged into one region
+REGION_GAP_RATIO = 0.6
+
+SIGNALS = ('relations', 'operators', 'weak_operators', 'greek', 'scripts', 'variables', 'math_font')
+
+def is_math_font(font):
+    font = (font or '').lower()
+    return any(marker in font for marker in MATH_FONT_MARKERS)
+
+def decode_symbol_text(text):
+    """Map Symbol-encoded private-use codepoints (U+F020-U+F0FF) to the glyphs they draw."""
+    chars = []
+    for ch in text:
+        code = ord(ch)
+        if 0xF8E5 <= code <= 0xF8FE:  # Adobe's private-use codes for the same pieces
+            chars.append(BRACKET_PIECE)
+            continue
+        if 0xF020 <= code <= 0xF0FF:
+            code -= 0xF000
+        if code < 0x100:
+            byte_char = chr(code)
+            if byte_char in _SYMBOL_GREEK:
+                chars.append(_SYMBOL_GREEK[byte_char])
+                continue
+            if code in _SYMBOL_OPERATORS:
+                chars.append(_SYMBOL_OPERATORS[code])
+                continue
+            if code in _SYMBOL_BRACKET_PIECES:
+                chars.append(BRACKET_PIECE)
+                continue
+            chars.append(byte_char if code >= 0x20 else ' ')
+        else:
+            chars.append(ch)
+    return ''.join(chars)
+
+def _span_text(span):
+    text = span.get("text", "")
+    font = (span.get("font") or '').lower()
+    if any(marker in font for marker in SYMBOL_ENCODED_MARKERS):
+        return decode_symbol_text(text)
+    return text
+
+def _is_italic(span):
+    font = (span.get("font") or '').lower()
+    return bool(span.get("flags", 0) & 2) or 'italic' in font or font.endswith('-it')
+
+def _span_signals(span, text, line_size, line_baseline):
+    """Signal counts for one span."""
+    signals = dict.fromkeys(SIGNALS, 0)
+    stripped = text.strip()
+    if not stripped:
+        return signals
+
+    math_font = is_math_font(span.get("font"))
+    for ch in stripped:
+        if ch in RELATIONS:
+            signals["relations"] += 1
+        elif ch in OPERATORS:
+            signals["operators"] += 1
+        elif ch in GREEK:
+            signals["greek"] += 1
+        elif ch in WEAK_OPERATORS or (math_font and ch in '+-/'):
+            signals["weak_operators"] += 1
+    if math_font and any(not ch.isspace() for ch in stripped):
+        signals["math_font"] = 1
+
+    size = span.get("size", 0) or 0
+    if line_size and size and len(stripped) <= 6 and stripped.lower() not in ORDINAL_SUFFIXES:
+        shift = abs(span.get("origin", (0, line_baseline))[1] - line_baseline)
+        superscript = bool(span.get("flags", 0) & 1)
+        if size <= line_size * SCRIPT_SIZE_RATIO and (superscript or shift >= line_size * SCRIPT_SHIFT_RATIO):
+            signals["scripts"] = 1
+
+    if len(stripped) == 1 and stripped.isalpha() and stripped not in GREEK and _is_italic(span):
+        signals["variables"] = 1
+    return signals
+
+def _score(signals):
+    return (signals["relations"] * WEIGHT_RELATION
+            + signals["operators"] * WEIGHT_OPERATOR
+            + signals["weak_operators"] * WEIGHT_WEAK_OPERATOR
+            + signals["greek"] * WEIGHT_GREEK
+            + signals["scripts"] * WEIGHT_SCRIPT
+            + signals["variables"] * WEIGHT_VARIABLE
+            + signals["math_font"] * WEIGHT_MATH_FONT)
+
+def _line_candidate(line):
+    """Region candidate for a line with math signals, or None."""
+    spans = [span for span in line.get("spans", []) if span.get("text", "").strip()]
+    if not spans:
+        return None
+
+    main = max(spans, key=lambda span: span.get("size", 0))
+    line_size = main.get("size", 0)
+    line_baseline = main.get("origin", (0, 0))[1]
+
+    totals = dict.fromkeys(SIGNALS, 0)
+    score = 0.0
+    texts = []
+    for span in spans:
+        text = _span_text(span)
+        texts.append(text)
+        signals = _span_signals(span, text, line_size, line_baseline)
+        score += min(_score(signals), MAX_SPAN_SCORE)
+        for name in SIGNALS:
+            totals[name] += signals[name]
+
+    if score <= 0:
+        return None
+    return {
+        "bbox": list(line["bbox"]),
+        "size": line_size,
+        "text": ''.join(texts).strip(),
+        "score": score,
+        "signals": totals
+    }
+
+def _near(a, b):
+    gap = REGION_GAP_RATIO * max(a["size"], b["size"])
+    ax0, ay0, ax1, ay1 = a["bbox"]
+    bx0, by0, bx1, by1 = b["bbox"]
+    return ax0 - gap <= bx1 and bx0 - gap <= ax1 and ay0 - gap <= by1 and by0 - gap <= ay1
+
+def _merge(a, b):
+    a["bbox"] = [min(a["bbox"][0], b["bbox"][0]), min(a["bbox"][1], b["bbox"][1]),
+                 max(a["bbox"][2], b["bbox"][2]), max(a["bbox"][3], b["bbox"][3])]
+    a["size"] = max(a["size"], b["size"])
+    a["score"] += b["score"]
+    a["lines"].extend(b["lines"])
+    for name in SIGNALS:
+        a["signals"][name] += b["signals"][name]
+
+def _group_regions(candidates):
+    """Merge neighbouring candidate lines (within one block or across blocks) into regions."""
+    regions = []
+    for candidate in sorted(candidates, key=lambda c: (c["bbox"][1], c["bbox"][0])):
+        region = dict(candidate, bbox=list(candidate["bbox"]), signals=dict(candidate["signals"]),
+                      lines=[candidate])
+        # A new line may bridge several existing regions
+        merged = [r for r in regions if _near(r, region)]
+        for other in merged:
+            regions.remove(other)
+            _merge(other, region)
+            region = other
+        regions.append(region)
+    return regions
+
+def is_formula(region):
+    signals = region["signals"]
+    # A script next to an operator sign (x^-1, a+b2); a subscripted name alone is prose
+    structural = (signals["relations"] >= 1 or signals["operators"] >= 1
+                  or (signals["scripts"] >= 1 and signals["weak_operators"] >= 1))
+    return structural and region["score"] >= FORMULA_MIN_SCORE
+
+def classify_page(page):
+    """
+    Classify the text of one PyMuPDF page in a single get_text("dict") pass.
+    Returns {"has_math", "formulas": [{"bbox", "text", "score", "signals"}], "signals", "spans"}.
+    """
+    candidates = []
+    span_count = 0
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", ()):
+            span_count += len(line.get("spans", ()))
+            candidate = _line_candidate(line)
+            if candidate:
+                candidates.append(candidate)
+
+    formulas = []
+    totals = dict.fromkeys(SIGNALS, 0)
+    for region in _group_regions(candidates):
+        for name in SIGNALS:
+            totals[name] += region["signals"][name]
+        if is_formula(region):
+            lines = sorted(region["lines"], key=lambda c: (round(c["bbox"][1]), c["bbox"][0]))
+            formulas.append({
+                "bbox": region["bbox"],
+                "text": ' '.join(line["text"] for line in lines),
+                "score": round(region["score"], 2),
+                "signals": {name: value for name, value in region["signals"].items() if value}
+            })
+
+    return {
+        "has_math": bool(formulas),
+        "formulas": formulas,
+        "signals": totals,
+        "spans": span_count
+    }
@@ -0,0 +1,132 @@
+"""
+Persisted math-detection reports for /analyze-math (the math debugger).
+
+A report is computed once per document and detector version: it is keyed by the content hash
+of the PDF and by a fingerprint of detect_math_content, so re-uploading the same bytes reuses
+it and changing the detector invalidates it. Reports are stored under slides/.cache as NDJSON,
+one page per line, next to a small summary with the byte offset of every line: a page range is
+served by reading just those lines, and streamed as stored without being parsed.
+
+Analysis runs as an ingest job in the background pool; concurrent requests for a document that
+is being analyzed wait for the same job.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from lazy_import import lazy_module
+from pdf_processor import analyze_page_math_content, detect_math_content
+from response_layer import file_digest
+from work_scheduler import scheduler
+
+fitz = lazy_module('fitz')
+
+MATH_REPORTS_FOLDER = os.getenv('MATH_REPORTS_FOLDER', os.path.join('slides', '.cache', 'math_reports'))
+
+# Bump when the analysis itself changes; changes to detect_math_content are picked up on their own
+MATH_ANALYSIS_VERSION = 2
+
+# Pages of a report returned by one /analyze-math request when no limit is given
+MATH_REPORT_PAGE_LIMIT = int(os.getenv('MATH_REPORT_PAGE_LIMIT', '0'))  # 0: all pages
+
+_building = {}  # report key -> Future of the running analysis
+_building_lock = threading.Lock()
+
+def detector_version():
+    code = detect_math_content.__code__
+    fingerprint = hashlib.sha256(code.co_code + repr(code.co_consts).encode('utf-8')).hexdigest()[:12]
+    return f"{MATH_ANALYSIS_VERSION}-{fingerprint}"
+
+def _report_paths(key):
+    base = os.path.join(MATH_REPORTS_FOLDER, key)
+    return f"{base}.ndjson", f"{base}.json"
+
+def build_report(file_path, key):
+    """Analyze every page and store the report (runs in the background pool)."""
+    pages_path, summary_path = _report_paths(key)
+    os.makedirs(MATH_REPORTS_FOLDER, exist_ok=True)
+    offsets = []
+    math_pages = []
+    line_results = {}
+    tmp_path = f"{pages_path}.{os.getpid()}.tmp"
+    with fitz.open(file_path) as doc, open(tmp_path, 'wb') as f:
+        for page_num in range(len(doc)):
+            result = analyze_page_math_content(doc[page_num], page_num, line_results)
+            if result["likely_has_math"]:
+                math_pages.append(result["page_number"])
+            offsets.append(f.tell())
+            f.write(json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+        offsets.append(f.tell())
+    os.replace(tmp_path, pages_path)
+
+    # The summary goes last: a reader that finds it also finds the complete pages file
+    summary = {
+        "detector_version": key.rsplit('.', 1)[-1],
+        "total_pages": len(offsets) - 1,
+        "math_page_count": len(math_pages),
+        "math_pages": math_pages,
+        "offsets": offsets
+    }
+    tmp_path = f"{summary_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, separators=(',', ':'))
+    os.replace(tmp_path, summary_path)
+    print(f"Math report for {file_path}: {len(math_pages)} of {summary['total_pages']} pages likely have math")
+    return summary
+
+def _load_summary(summary_path):
+    try:
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def get_report(file_path):
+    """(key, summary) of the document's report, analyzing it first if needed."""
+    key = f"{file_digest(file_path)}.{detector_version()}"
+    summary = _load_summary(_report_paths(key)[1])
+    if summary:
+        return key, summary
+
+    with _building_lock:
+        future = _building.get(key)
+        owner = future is None
+        if owner:
+            future = scheduler.submit('ingest', build_report, file_path, key)
+            _building[key] = future
+    try:
+        return key, future.result()
+    finally:
+        if owner:
+            with _building_lock:
+                _building.pop(key, None)
+
+def page_range(summary, start=1, limit=None):
+    """Clamp a request for `limit` pages from `start` (1-based) to the report; returns (first, end)."""
+    total = summary["total_pages"]
+    first = min(max(1, start), total + 1)
+    if limit is None or limit <= 0:
+        limit = MATH_REPORT_PAGE_LIMIT or total
+    return first, min(total + 1, first + limit)
+
+def read_pages_raw(key, summary, first, end):
+    """NDJSON lines of pages first..end-1, as stored."""
+    offsets = summary["offsets"]
+    if first >= end:
+        return b''
+    with open(_report_paths(key)[0], 'rb') as f:
+        f.seek(offsets[first - 1])
+        return f.read(offsets[end - 1] - offsets[first - 1])
+
+def iter_pages_raw(key, summary, first, end, chunk_pages=16):
+    """NDJSON of pages first..end-1 in chunks of a few pages, for streaming."""
+    for chunk_start in range(first, end, chunk_pages):
+        yield read_pages_raw(key, summary, chunk_start, min(end, chunk_start + chunk_pages))
+
+def read_pages(key, summary, first, end):
+    return [json.loads(line) for line in read_pages_raw(key, summary, first, end).splitlines()]
+
+def summary_fields(summary):
+    """The summary as served (without the offsets index)."""
+    return {k: v for k, v in summary.items() if k != "offsets"}
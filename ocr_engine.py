@@ -0,0 +1,172 @@
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future
+
+from work_scheduler import BACKGROUND_WORKERS, scheduler
+
+# "auto" uses Tesseract when it is installed, "stub" is a deterministic stand-in for tests,
+# "none" disables OCR entirely
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto').lower()
+
+# OCR runs in the work scheduler's background pool (inline inside an ingestion job)
+OCR_WORKERS = BACKGROUND_WORKERS
+
+# Images smaller than this (shortest side, in pixels) or with a smaller area are treated as
+# decorative - bullets, icons, separators - and never sent to OCR
+OCR_MIN_IMAGE_SIDE = int(os.getenv('OCR_MIN_IMAGE_SIDE', '32'))
+OCR_MIN_IMAGE_AREA = int(os.getenv('OCR_MIN_IMAGE_AREA', str(80 * 80)))
+
+# OCR results are cached on disk by image content hash so re-ingesting a deck is free
+OCR_CACHE_FOLDER = os.path.join('slides', '.ocr_cache')
+
+_backend = None
+_backend_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+_stats = {
+    "ocr_runs": 0,
+    "cache_hits": 0,
+    "coalesced": 0,
+    "skipped_small": 0,
+    "errors": 0
+}
+
+def _tesseract_ocr(image_bytes):
+    """Worker-process entry point: OCR one image with Tesseract."""
+    import pytesseract
+    from PIL import Image
+
+    return pytesseract.image_to_string(Image.open(io.BytesIO(image_bytes))).strip()
+
+def _stub_ocr(image_bytes):
+    """Deterministic stand-in engine: the 'text' is derived from the image bytes only."""
+    return f"stub text {hashlib.sha256(image_bytes).hexdigest()[:12]}"
+
+def _detect_backend():
+    if OCR_BACKEND == 'none':
+        return None
+    if OCR_BACKEND == 'stub':
+        return 'stub'
+
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return 'tesseract'
+    except Exception as e:
+        if OCR_BACKEND == 'tesseract':
+            print(f"Warning: OCR_BACKEND=tesseract but Tesseract is unavailable: {e}")
+        else:
+            print(f"OCR disabled - Tesseract not available: {e}")
+        return None
+
+def get_ocr_backend():
+    """Name of the OCR backend in use ('tesseract', 'stub' or None), detected once per process."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _detect_backend() or ''
+            if _backend:
+                print(f"OCR backend: {_backend} ({OCR_WORKERS} workers)")
+    return _backend or None
+
+def is_decorative(width, height):
+    """Tiny images (icons, bullets, rules) carry no useful text."""
+    return min(width, height) < OCR_MIN_IMAGE_SIDE or width * height < OCR_MIN_IMAGE_AREA
+
+def _cache_path(digest, backend):
+    return os.path.join(OCR_CACHE_FOLDER, digest[:2], f"{digest}.{backend}.txt")
+
+def _read_cache(digest, backend):
+    try:
+        with open(_cache_path(digest, backend), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _write_cache(digest, backend, text):
+    path = _cache_path(digest, backend)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing OCR cache: {e}")
+
+def _finish_run(digest, backend, future):
+    """Runs when a pool job finishes: persist the result and release the in-flight slot."""
+    with _inflight_lock:
+        _inflight.pop(digest, None)
+    try:
+        _write_cache(digest, backend, future.result())
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"OCR error for image {digest[:12]}: {e}")
+
+def submit_ocr(image_bytes, width, height):
+    """
+    Queue one image for OCR and return a Future resolving to its text,
+    or None when OCR is unavailable or the image is too small to bother.
+    Identical images share one cached or in-flight result.
+    """
+    backend = get_ocr_backend()
+    if not backend:
+        return None
+    if is_decorative(width, height):
+        _stats["skipped_small"] += 1
+        return None
+
+    digest = hashlib.sha256(image_bytes).hexdigest()
+
+    cached = _read_cache(digest, backend)
+    if cached is not None:
+        _stats["cache_hits"] += 1
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    with _inflight_lock:
+        if digest in _inflight:
+            _stats["coalesced"] += 1
+            return _inflight[digest]
+
+        _stats["ocr_runs"] += 1
+        if backend == 'stub':
+            # The stub is cheap and deterministic, so it runs inline rather than in the pool
+            future = Future()
+            future.set_result(_stub_ocr(image_bytes))
+        else:
+            future = scheduler.submit('ocr', _tesseract_ocr, image_bytes)
+        _inflight[digest] = future
+
+    future.add_done_callback(lambda f: _finish_run(digest, backend, f))
+    return future
+
+class OCRBatch:
+    """Collects image records of a page or document and fills in their OCR text in one go."""
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, img_data, image_bytes):
+        future = submit_ocr(image_bytes, img_data.get("width", 0), img_data.get("height", 0))
+        if future is not None:
+            self.pending.append((img_data, future))
+
+    def finish(self):
+        for img_data, future in self.pending:
+            try:
+                ocr_text = future.result()
+            except Exception:
+                continue  # Already reported by _finish_run
+            if ocr_text:
+                img_data["ocr_text"] = ocr_text
+                img_data["alt_text"] = f"Image containing: {ocr_text[:100]}..." if len(ocr_text) > 100 else f"Image containing: {ocr_text}"
+        self.pending = []
+
+def get_ocr_stats():
+    return dict(_stats, backend=get_ocr_backend(), workers=OCR_WORKERS)
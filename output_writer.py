@@ -0,0 +1,177 @@
+"""
+Crash-safe writes of the extraction outputs in slides/ and per-presentation locks.
+
+Every output (_slides.json, _enhanced.json, _summaries.json) is written to a temporary file
+in the same folder, fsynced and renamed over the old one, so a reader (or a restart after a
+crash) sees either the previous file or the complete new one, never a truncated file. JSON is
+written compactly: the outputs are read by programs, and indentation made them a third larger
+and forced the slow pure-Python encoder.
+
+Two locks per presentation, both flock()ed lock files under slides/.cache/locks so they hold
+across gunicorn workers, the background pool and the folder watcher:
+
+- presentation_writer(name): held by whoever (re)builds a presentation, for the whole
+  extraction. Two uploads of the same filename are processed one after the other instead of
+  interleaving their outputs.
+- presentation_lock(name, exclusive): a reader/writer lock held only while output files are
+  renamed into place (exclusive) or read (shared), so a reader sees the outputs of one
+  extraction, not the _slides.json of one and the _enhanced.json of the next.
+
+Waits poll with a non-blocking flock, so under gevent a waiting request does not block its
+worker. Where fcntl is unavailable (Windows) the locks only hold within one process.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from profiler import stage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+OUTPUT_LOCKS_FOLDER = os.getenv('OUTPUT_LOCKS_FOLDER', os.path.join('slides', '.cache', 'locks'))
+
+# fsync outputs before renaming them (off trades crash safety for speed, e.g. on test machines)
+OUTPUT_FSYNC = os.getenv('OUTPUT_FSYNC', '1') != '0'
+
+# Output files named <presentation><suffix> in the slides folder
+OUTPUT_SUFFIXES = ('_slides.json', '_enhanced.json', '_summaries.json')
+
+_LOCK_POLL_MAX = 0.2
+
+_process_locks = {}  # lock file -> threading.Lock, where fcntl is unavailable
+_process_locks_guard = threading.Lock()
+
+def dumps_compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def presentation_name(path):
+    """The presentation an output file belongs to ("Lecture 05" for slides/Lecture 05_enhanced.json)."""
+    name = os.path.basename(path)
+    for suffix in OUTPUT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def _lock_path(name, kind):
+    # Hashed: presentation names may contain characters that are awkward in file names
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(OUTPUT_LOCKS_FOLDER, f"{digest}.{kind}.lock")
+
+@contextmanager
+def _flock(path, exclusive):
+    if fcntl is None:
+        with _process_locks_guard:
+            lock = _process_locks.setdefault(path, threading.Lock())
+        with lock:
+            yield
+        return
+
+    os.makedirs(OUTPUT_LOCKS_FOLDER, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        operation = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB
+        delay = 0.005
+        while True:
+            try:
+                fcntl.flock(fd, operation)
+                break
+            except BlockingIOError:
+                time.sleep(delay)
+                delay = min(delay * 2, _LOCK_POLL_MAX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+def presentation_lock(name, exclusive=False):
+    """Shared (readers) or exclusive (renaming outputs into place) lock of one presentation."""
+    return _flock(_lock_path(name, 'rw'), exclusive)
+
+def presentation_writer(name):
+    """Exclusive lock of one presentation for a whole extraction; does not block readers."""
+    return _flock(_lock_path(name, 'writer'), True)
+
+def _fsync_folder(folder):
+    if not OUTPUT_FSYNC or os.name == 'nt':
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class OutputFile:
+    """
+    A file written under a temporary name next to `path`, which only replaces `path`
+    on commit. Used as a context manager, it is discarded unless committed.
+    """
+
+    def __init__(self, path, mode='w'):
+        self.path = path
+        folder = os.path.dirname(path) or '.'
+        fd, self.tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+        os.chmod(self.tmp_path, 0o644)  # mkstemp creates it private
+        self.file = os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8')
+        self.committed = False
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def sync(self):
+        """Flush the content to disk and close the temporary file."""
+        if not self.file.closed:
+            self.file.flush()
+            if OUTPUT_FSYNC:
+                os.fsync(self.file.fileno())
+            self.file.close()
+
+    def replace(self):
+        os.replace(self.tmp_path, self.path)
+        self.committed = True
+
+    def discard(self):
+        self.file.close()
+        if not self.committed:
+            try:
+                os.remove(self.tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
+        return False
+
+def commit_outputs(name, *outputs):
+    """Move the outputs of one presentation into place together, under its exclusive lock."""
+    with stage("commit_output"):
+        for output in outputs:
+            output.sync()  # the slow part, done before taking the lock
+        with presentation_lock(name, exclusive=True):
+            for output in outputs:
+                output.replace()
+        for folder in {os.path.dirname(output.path) or '.' for output in outputs}:
+            _fsync_folder(folder)
+
+def write_json(path, data, name=None):
+    """Atomically replace path with compact JSON of data; returns the bytes written."""
+    with stage("serialize_output"):
+        encoded = dumps_compact(data).encode('utf-8')
+    with OutputFile(path, 'wb') as output:
+        output.write(encoded)
+        commit_outputs(name or presentation_name(path), output)
+    return len(encoded)
+
+def read_json(path, name=None):
+    """Load an output file under the presentation's shared lock."""
+    with presentation_lock(name or presentation_name(path)):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
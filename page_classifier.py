@@ -0,0 +1,106 @@
+"""
+Cheap per-page classification of PDF pages by how they carry their text:
+
+- digital: a real text layer
+- scanned: (almost) no text layer, the page is mostly covered by images - it needs OCR
+- mixed: a sparse text layer over a page mostly covered by images, e.g. a scan with a typed
+  header or page number - the text layer is kept and the page is OCRed as well
+- empty: neither text nor images
+
+Only text-block and image bounding boxes are looked at, so classifying a page costs far
+less than extracting its text with layout information or rendering it.
+"""
+import os
+
+from lazy_import import lazy_module
+
+fitz = lazy_module('fitz')
+
+# Pages with fewer text-layer characters than this have no usable text layer
+MIN_TEXT_CHARS = int(os.getenv('SCANNED_MIN_TEXT_CHARS', '16'))
+
+# Fraction of the page that images must cover for a page without text to count as scanned
+SCANNED_IMAGE_COVERAGE = float(os.getenv('SCANNED_IMAGE_COVERAGE', '0.8'))
+
+# An image-covered page whose text layer covers less than this fraction of the page
+# (and has fewer than MIXED_MAX_TEXT_CHARS characters) is mixed
+MIXED_TEXT_COVERAGE = float(os.getenv('MIXED_TEXT_COVERAGE', '0.1'))
+MIXED_MAX_TEXT_CHARS = int(os.getenv('MIXED_MAX_TEXT_CHARS', '200'))
+
+PAGE_TYPES = ('digital', 'scanned', 'mixed', 'empty')
+
+def _covered_fraction(rects, page_rect):
+    """Fraction of the page covered by rects (overlaps are counted once per pair at most)."""
+    page_area = abs(page_rect)
+    if not page_area:
+        return 0.0
+    clipped = [rect & page_rect for rect in rects]
+    clipped = [rect for rect in clipped if not rect.is_empty]
+    area = sum(abs(rect) for rect in clipped)
+    # Subtract pairwise overlaps; scans are usually one image or a few strips, so this is exact enough
+    for i, a in enumerate(clipped):
+        for b in clipped[i + 1:]:
+            overlap = a & b
+            if not overlap.is_empty:
+                area -= abs(overlap)
+    return max(0.0, min(1.0, area / page_area))
+
+def classify_page_content(page):
+    """
+    Classify one PyMuPDF page. Returns {"type", "text_chars", "text_coverage", "image_coverage"}.
+    """
+    text_chars = 0
+    text_rects = []
+    for block in page.get_text("blocks"):
+        if block[6] == 0:  # text block
+            chars = len(block[4].strip())
+            if chars:
+                text_chars += chars
+                text_rects.append(fitz.Rect(block[:4]))
+
+    try:
+        image_rects = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+    except Exception as e:
+        print(f"Error getting image positions: {e}")
+        image_rects = []
+
+    text_coverage = _covered_fraction(text_rects, page.rect)
+    image_coverage = _covered_fraction(image_rects, page.rect)
+
+    if text_chars < MIN_TEXT_CHARS:
+        if image_coverage >= SCANNED_IMAGE_COVERAGE:
+            page_type = 'scanned'
+        elif text_chars == 0 and not image_rects:
+            page_type = 'empty'
+        else:
+            page_type = 'digital'  # a figure with a caption or a nearly blank page
+    elif (image_coverage >= SCANNED_IMAGE_COVERAGE and text_coverage < MIXED_TEXT_COVERAGE
+          and text_chars < MIXED_MAX_TEXT_CHARS):
+        page_type = 'mixed'
+    else:
+        page_type = 'digital'
+
+    return {
+        "type": page_type,
+        "text_chars": text_chars,
+        "text_coverage": round(text_coverage, 3),
+        "image_coverage": round(image_coverage, 3)
+    }
+
+def needs_ocr(page_type):
+    return page_type in ('scanned', 'mixed')
+
+def summarize_page_types(slides):
+    """Per-document statistics from slide records carrying "page_type" and "text_source"."""
+    counts = dict.fromkeys(PAGE_TYPES, 0)
+    ocr_pages = []
+    for slide in slides:
+        page_type = slide.get("page_type", "digital")
+        counts[page_type] = counts.get(page_type, 0) + 1
+        if slide.get("text_source", "text_layer") != "text_layer":
+            ocr_pages.append(slide.get("page_number", slide.get("slide_number")))
+    return {
+        "page_types": counts,
+        "ocr_pages": ocr_pages,
+        "needs_ocr_pages": counts["scanned"] + counts["mixed"]
+    }
@@ -1,42 +1,57 @@
-from PyPDF2 import PdfReader
 import os
 import time
-import json
 import base64
 import re
-import fitz  # PyMuPDF for more advanced PDF processing
+import tempfile
+from collections import deque
+from asset_store import save_asset, content_hash
+from ocr_engine import OCRBatch, OCR_WORKERS, submit_ocr
+from page_classifier import classify_page_content, needs_ocr, summarize_page_types
+from lazy_import import lazy_module
+from output_writer import OutputFile, commit_outputs, dumps_compact, write_json
+from profiler import stage
+from math_detector import classify_page
+
+# Imported on first use, see lazy_import
+PyPDF2 = lazy_module('PyPDF2')
+fitz = lazy_module('fitz')  # PyMuPDF for more advanced PDF processing
+
+# PDFs with more pages than this are extracted with the streaming pipeline
+STREAMING_PAGE_THRESHOLD = int(os.getenv('STREAMING_PAGE_THRESHOLD', '100'))
+
+# "fonts" classifies spans from their font metadata (math_detector), "text" is the older
+# regex check over the page and line text
+MATH_DETECTOR = os.getenv('MATH_DETECTOR', 'fonts').lower()
+
+# Resolution scanned pages are rendered at for OCR
+OCR_PAGE_DPI = int(os.getenv('OCR_PAGE_DPI', '200'))
+
+# Pages of the streaming pipeline that may wait for their OCR while later pages are processed
+OCR_PAGE_LOOKAHEAD = int(os.getenv('OCR_PAGE_LOOKAHEAD', str(OCR_WORKERS * 2)))
+
+# "auto" streams only PDFs above the threshold, "always" / "never" force one mode
+PDF_EXTRACTION_MODE = os.getenv('PDF_EXTRACTION_MODE', 'auto').lower()
 
 def extract_text_from_pdf(file_path):
     """Extract text from a PDF file and format it as slides."""
     try:
         # Create a PDF reader object
-        reader = PdfReader(file_path)
+        reader = PyPDF2.PdfReader(file_path)
         slides = []
         
+        # Classify the pages first and queue OCR for those without a usable text layer,
+        # so the OCR pool works while the text layers are read
+        with fitz.open(file_path) as doc:
+            page_infos = [classify_page_content(page) for page in doc]
+            ocr_futures = {i: submit_page_ocr(doc[i]) for i, info in enumerate(page_infos) if needs_ocr(info["type"])}
+        
         # Process each page as a slide
         for idx, page in enumerate(reader.pages, start=1):
-            text = page.extract_text()
-            
-            # Try to extract a title from the first line
-            lines = text.split('\n')
-            title = lines[0] if lines and lines[0].strip() else f"Page {idx}"
-            
-            # The rest is content
-            content = lines[1:] if lines else []
-            
-            slide_data = {
-                "slide_number": idx,
-                "title": title,
-                "content": content,
-                "notes": "",  # PDFs don't have notes like PowerPoint
-                "text": text.strip(),
-                "original_file": os.path.basename(file_path),
-                "page_number": idx,  # For PDF we use page number instead of slide number
-                "has_math_content": False,  # Will be updated during formula detection
-                "page_image": ""  # Will be filled with page image if math content is detected
-            }
-            
-            slides.append(slide_data)
+            info = page_infos[idx - 1] if idx <= len(page_infos) else None
+            text = "" if info and info["type"] == 'scanned' else page.extract_text()
+            slide = build_slide_record(idx, text, file_path, info)
+            apply_ocr_text(slide, ocr_page_text(ocr_futures.get(idx - 1)))
+            slides.append(slide)
         
         # Now capture images of pages with formulas
         slides = capture_page_images_with_formulas(file_path, slides)
@@ -47,6 +62,57 @@ def extract_text_from_pdf(file_path):
         print(f"Error extracting text from PDF: {str(e)}")
         return []
 
+def build_slide_record(idx, text, file_path, page_info=None):
+    """Build the slide dict for one PDF page from its extracted text and classification."""
+    # Try to extract a title from the first line
+    lines = text.split('\n')
+    title = lines[0] if lines and lines[0].strip() else f"Page {idx}"
+    
+    # The rest is content
+    content = lines[1:] if lines else []
+    
+    return {
+        "slide_number": idx,
+        "title": title,
+        "content": content,
+        "notes": "",  # PDFs don't have notes like PowerPoint
+        "text": text.strip(),
+        "original_file": os.path.basename(file_path),
+        "page_number": idx,  # For PDF we use page number instead of slide number
+        "has_math_content": False,  # Will be updated during formula detection
+        "page_image": "",  # Will be filled with page image if math content is detected
+        "page_type": page_info["type"] if page_info else "digital",
+        "text_source": "text_layer"
+    }
+
+def submit_page_ocr(page):
+    """Rasterize a page in grayscale and queue it for OCR; returns a Future, or None without OCR."""
+    pix = page.get_pixmap(dpi=OCR_PAGE_DPI, colorspace=fitz.csGRAY)
+    return submit_ocr(pix.tobytes("png"), pix.width, pix.height)
+
+def ocr_page_text(future):
+    """Text of a page OCR job, or None when there was none or it failed."""
+    if future is None:
+        return None
+    try:
+        return future.result() or None
+    except Exception:
+        return None  # Already reported by the OCR engine
+
+def apply_ocr_text(slide, ocr_text):
+    """Fill in a slide's text from the OCR of its page: replacing a missing text layer, adding to a sparse one."""
+    if not ocr_text:
+        return slide
+    if slide["page_type"] == 'scanned' or not slide["text"]:
+        text, source = ocr_text, "ocr"
+    else:
+        text, source = f"{slide['text']}\n{ocr_text}", "text_layer+ocr"
+    refreshed = build_slide_record(slide["slide_number"], text, slide["original_file"])
+    for key in ("title", "content", "text"):
+        slide[key] = refreshed[key]
+    slide["text_source"] = source
+    return slide
+
 def detect_math_content(text):
     """Detect potential mathematical content in text with special handling for title pages."""
     # First, check if this is just a chapter or contents page
@@ -150,87 +216,129 @@ def detect_math_content(text):
     
     return False
 
+# Indicators reported per page by the math analysis (see math_report)
+MATH_SYMBOL_PATTERN = re.compile(r'[=+\-*/^√∫∑∏πλθ]')
+GREEK_LETTER_PATTERN = re.compile(r'[αβγδεζηθικλμνξοπρστυφχψω]')
+EQUATION_PATTERN = re.compile(r'[a-zA-Z]\s*=\s*[a-zA-Z0-9]')
+BRAGG_FORMULA_PATTERN = re.compile(r'λ\s*=\s*2d\s*Sin', re.IGNORECASE)
+TITLE_PAGE_PATTERN = re.compile(r'^Chapter|^\d+\.\d+\s+[A-Z]')
+
+def analyze_page_math_content(page, page_num, line_results=None):
+    """
+    Math indicators of one PyMuPDF page, for diagnosing the detector.
+    line_results memoizes detect_math_content per line text across the pages of a document
+    (running headers, footers and repeated labels are only checked once).
+    """
+    if line_results is None:
+        line_results = {}
+    page_text = page.get_text()
+    symbol_count = len(MATH_SYMBOL_PATTERN.findall(page_text))
+    greek_count = len(GREEK_LETTER_PATTERN.findall(page_text))
+    equation_count = len(EQUATION_PATTERN.findall(page_text))
+    specific_formulas = bool(BRAGG_FORMULA_PATTERN.search(page_text))
+
+    # The first few lines tell whether it is a title page
+    first_lines = '\n'.join(page_text.split('\n')[:5])
+    is_title_page = bool(TITLE_PAGE_PATTERN.match(first_lines))
+
+    # Lines of the text blocks that look like formulas on their own
+    block_math_count = 0
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            line_text = "".join(span["text"] for span in line["spans"])
+            if line_text not in line_results:
+                line_results[line_text] = detect_math_content(line_text)
+            block_math_count += line_results[line_text]
+
+    return {
+        "page_number": page_num + 1,
+        "math_detected": detect_math_content(page_text),
+        "symbol_count": symbol_count,
+        "greek_letter_count": greek_count,
+        "equation_count": equation_count,
+        "specific_formulas_found": specific_formulas,
+        "is_title_page": is_title_page,
+        "block_math_count": block_math_count,
+        "first_lines": first_lines,
+        "likely_has_math": (symbol_count > 3) or (greek_count > 0) or (equation_count > 0) or specific_formulas or (block_math_count > 1)
+    }
+
 def analyze_math_content_in_pdf(file_path):
     """
     Utility function to analyze PDF pages for mathematical content.
     Helps diagnose false positives and negatives in math content detection.
+    The web app serves persisted reports instead (math_report).
     """
     try:
-        # Open the PDF with PyMuPDF
         doc = fitz.open(file_path)
-        results = []
-        
-        print(f"Analyzing {file_path} for math content...")
-        print(f"Total pages: {len(doc)}")
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            page_text = page.get_text()
-            
-            # Try different detection methods
-            main_detection = detect_math_content(page_text)
-            
-            # Count math symbols
-            math_symbols = r'[=+\-*/^√∫∑∏πλθ]'
-            symbol_count = len(re.findall(math_symbols, page_text))
-            
-            # Look for Greek letters separately
-            greek_letters = r'[αβγδεζηθικλμνξοπρστυφχψω]'
-            greek_count = len(re.findall(greek_letters, page_text))
-            
-            # Look for equation patterns
-            eq_patterns = r'[a-zA-Z]\s*=\s*[a-zA-Z0-9]'
-            equation_count = len(re.findall(eq_patterns, page_text))
-            
-            # Check for specific formula patterns like λ = 2d Sin θ
-            specific_formulas = any(re.search(r'λ\s*=\s*2d\s*Sin', page_text, re.IGNORECASE))
-            
-            # Get the first few lines to check if it's a title page
-            first_lines = '\n'.join(page_text.split('\n')[:5])
-            is_title_page = bool(re.match(r'^Chapter|^\d+\.\d+\s+[A-Z]', first_lines))
-            
-            # Examine blocks for potential formulas
-            blocks = page.get_text("dict")["blocks"]
-            block_math_count = 0
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        line_text = "".join([span["text"] for span in line["spans"]])
-                        if detect_math_content(line_text):
-                            block_math_count += 1
-            
-            # Compile the results
-            page_result = {
-                "page_number": page_num + 1,
-                "math_detected": main_detection,
-                "symbol_count": symbol_count,
-                "greek_letter_count": greek_count,
-                "equation_count": equation_count,
-                "specific_formulas_found": specific_formulas,
-                "is_title_page": is_title_page,
-                "block_math_count": block_math_count,
-                "first_lines": first_lines,
-                "likely_has_math": (symbol_count > 3) or (greek_count > 0) or (equation_count > 0) or specific_formulas or (block_math_count > 1)
-            }
-            
-            results.append(page_result)
-            
-            # Print a summary
-            print(f"\nPage {page_num + 1}:")
-            print(f"  Math detected: {main_detection}")
-            print(f"  Symbol count: {symbol_count}")
-            print(f"  Greek letters: {greek_count}")
-            print(f"  Equations: {equation_count}")
-            print(f"  Block math count: {block_math_count}")
-            print(f"  First lines: {first_lines[:100]}...")
-            print(f"  CONCLUSION: {'MATH CONTENT' if page_result['likely_has_math'] else 'NO MATH CONTENT'}")
-        
+        line_results = {}
+        results = [analyze_page_math_content(doc[page_num], page_num, line_results) for page_num in range(len(doc))]
+        math_pages = sum(1 for result in results if result["likely_has_math"])
+        print(f"Analyzed {file_path}: {math_pages} of {len(results)} pages likely have math")
         return results
-    
+
     except Exception as e:
         print(f"Error analyzing math content: {str(e)}")
         return []
 
+def analyze_page_math(page):
+    """Font-aware analysis of one page (see math_detector), or None with the text detector."""
+    if MATH_DETECTOR == 'text':
+        return None
+    return classify_page(page)
+
+def detect_page_math(page, page_num, analysis=None):
+    """
+    Whether one PyMuPDF page contains math. analysis is a result of analyze_page_math for
+    the page, so callers that also extract formulas classify the page only once.
+    """
+    if MATH_DETECTOR == 'text':
+        return detect_page_math_text(page, page_num)
+    
+    analysis = analysis or classify_page(page)
+    print(f"Page {page_num + 1} math content detection: {len(analysis['formulas'])} formula regions "
+          f"in {analysis['spans']} spans -> {analysis['has_math']}")
+    return analysis["has_math"]
+
+def detect_page_math_text(page, page_num):
+    """Combine the text, visual-symbol and block-level checks for one PyMuPDF page."""
+    page_text = page.get_text()
+    
+    # Enhanced check for mathematical content
+    has_math = detect_math_content(page_text)
+    
+    # Double-check with visual inspection for common math symbols
+    visual_math_check = bool(re.search(r'[=+\-*/^√∫∑∏πλθ]|sin|cos|θ|λ|\d+/\d+', page_text))
+    
+    # Additional check for formulas in blocks
+    blocks = page.get_text("dict")["blocks"]
+    block_math_found = False
+    for block in blocks:
+        if "lines" in block:
+            for line in block["lines"]:
+                line_text = "".join([span["text"] for span in line["spans"]])
+                if detect_math_content(line_text):
+                    block_math_found = True
+                    break
+        if block_math_found:
+            break
+    
+    result = has_math or visual_math_check or block_math_found
+    
+    # Debug output to help diagnose issues
+    print(f"Page {page_num + 1} math content detection:")
+    print(f"  - Basic math detection: {has_math}")
+    print(f"  - Visual symbol check: {visual_math_check}")
+    print(f"  - Block-level check: {block_math_found}")
+    print(f"  - Final decision: {result}")
+    
+    return result
+
+def render_page_png(page):
+    """Render a page at a higher resolution for better quality and return PNG bytes."""
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+    return pix.tobytes("png")
+
 def capture_page_images_with_formulas(file_path, slides):
     """Capture images of pages that contain mathematical formulas with improved detection."""
     try:
@@ -244,46 +352,19 @@ def capture_page_images_with_formulas(file_path, slides):
                 print(f"Warning: Page {page_num + 1} requested but document only has {len(doc)} pages")
                 continue
                 
-            # Get the page text with better formatting preservation
             page = doc[page_num]
-            page_text = page.get_text()
-            
-            # Enhanced check for mathematical content
-            has_math = detect_math_content(page_text)
-            
-            # Double-check with visual inspection for common math symbols
-            visual_math_check = bool(re.search(r'[=+\-*/^√∫∑∏πλθ]|sin|cos|θ|λ|\d+/\d+', page_text))
             
-            # Additional check for formulas in blocks
-            blocks = page.get_text("dict")["blocks"]
-            block_math_found = False
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        line_text = "".join([span["text"] for span in line["spans"]])
-                        if detect_math_content(line_text):
-                            block_math_found = True
-                            break
-                if block_math_found:
-                    break
+            # Scanned pages have no text spans for the math checks to look at
+            if slide.get("page_type") == 'scanned':
+                continue
             
             # Mark the slide as containing math based on combined checks
-            slide["has_math_content"] = has_math or visual_math_check or block_math_found
-            
-            # Debug output to help diagnose issues
-            print(f"Page {page_num + 1} math content detection:")
-            print(f"  - Basic math detection: {has_math}")
-            print(f"  - Visual symbol check: {visual_math_check}")
-            print(f"  - Block-level check: {block_math_found}")
-            print(f"  - Final decision: {slide['has_math_content']}")
+            slide["has_math_content"] = detect_page_math(page, page_num)
             
             # If it has math content, capture an image of the entire page
             if slide["has_math_content"] and page_num < len(doc):
                 try:
-                    # Render the page at a higher resolution for better quality
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    img_data = pix.tobytes("png")
-                    img_b64 = base64.b64encode(img_data).decode('utf-8')
+                    img_b64 = base64.b64encode(render_page_png(page)).decode('utf-8')
                     slide["page_image"] = f"data:image/png;base64,{img_b64}"
                     print(f"Captured image for page {page_num + 1} with math content")
                 except Exception as e:
@@ -294,48 +375,77 @@ def capture_page_images_with_formulas(file_path, slides):
         print(f"Error in capturing page images: {str(e)}")
         return slides
 
-def extract_formulas_from_pdf(file_path):
-    """Extract areas that likely contain mathematical formulas from PDF for visual reference."""
+def _text_formula_lines(page):
+    """(bbox, text, score) of the lines the text detector flags as math."""
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        if "lines" in block:
+            for line in block["lines"]:
+                line_text = "".join([span["text"] for span in line["spans"]])
+                if detect_math_content(line_text):
+                    lines.append((line["bbox"], line_text, None))
+    return lines
+
+def extract_page_formulas(page, page_num, store_assets=False, analysis=None):
+    """
+    Capture the regions of one page that look like formulas.
+    With store_assets the crops go to the asset store instead of being inlined as base64.
+    analysis is a result of analyze_page_math for the page, if the caller already has one.
+    """
+    formula_data = []
+    
+    if MATH_DETECTOR == 'text':
+        regions = _text_formula_lines(page)
+    else:
+        analysis = analysis or classify_page(page)
+        regions = [(f["bbox"], f["text"], f["score"]) for f in analysis["formulas"]]
+    
+    for bbox, text, score in regions:
+        # Capture this area as an image
+        try:
+            rect = fitz.Rect(bbox)
+            # Expand slightly to ensure full formula capture
+            rect.x0 = max(0, rect.x0 - 10)
+            rect.y0 = max(0, rect.y0 - 10)
+            rect.x1 = min(page.rect.width, rect.x1 + 10)
+            rect.y1 = min(page.rect.height, rect.y1 + 10)
+            
+            # Render just this area of the page
+            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), clip=rect)
+            img_data = pix.tobytes("png")
+            
+            formula = {
+                "page": page_num + 1,
+                "text": text,  # Still include the text for context
+                "bbox": list(bbox),  # Convert to list for JSON serialization
+                "type": "potential_formula",
+            }
+            if score is not None:
+                formula["score"] = score
+            if store_assets:
+                formula["image_asset"] = save_asset(img_data, "png")
+            else:
+                img_b64 = base64.b64encode(img_data).decode('utf-8')
+                formula["image"] = f"data:image/png;base64,{img_b64}"
+            
+            formula_data.append(formula)
+        except Exception as e:
+            print(f"Error capturing formula image: {e}")
+    
+    return formula_data
+
+def extract_formulas_from_pdf(file_path, skip_pages=()):
+    """
+    Extract areas that likely contain mathematical formulas from PDF for visual reference.
+    skip_pages are 1-based page numbers without a text layer (scanned pages).
+    """
     try:
         doc = fitz.open(file_path)
         formula_data = []
         
         for page_num, page in enumerate(doc):
-            # Get the page text with detailed layout information
-            text_blocks = page.get_text("dict")["blocks"]
-            
-            # Identify potential formula areas
-            for block in text_blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        line_text = "".join([span["text"] for span in line["spans"]])
-                        
-                        # Check if this line contains math content
-                        if detect_math_content(line_text):
-                            # Capture this area as an image
-                            try:
-                                # Get the bounding box of the line
-                                rect = fitz.Rect(line["bbox"])
-                                # Expand slightly to ensure full formula capture
-                                rect.x0 = max(0, rect.x0 - 10)
-                                rect.y0 = max(0, rect.y0 - 10)
-                                rect.x1 = min(page.rect.width, rect.x1 + 10)
-                                rect.y1 = min(page.rect.height, rect.y1 + 10)
-                                
-                                # Render just this area of the page
-                                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), clip=rect)
-                                img_data = pix.tobytes("png")
-                                img_b64 = base64.b64encode(img_data).decode('utf-8')
-                                
-                                formula_data.append({
-                                    "page": page_num + 1,
-                                    "text": line_text,  # Still include the text for context
-                                    "bbox": list(line["bbox"]),  # Convert to list for JSON serialization
-                                    "type": "potential_formula",
-                                    "image": f"data:image/png;base64,{img_b64}"
-                                })
-                            except Exception as e:
-                                print(f"Error capturing formula image: {e}")
+            if page_num + 1 not in skip_pages:
+                formula_data.extend(extract_page_formulas(page, page_num))
         
         return formula_data
     
@@ -343,78 +453,122 @@ def extract_formulas_from_pdf(file_path):
         print(f"Error extracting formulas from PDF: {str(e)}")
         return []
 
-def extract_images_from_pdf(file_path):
-    """Extract images from PDF and their positions with additional metadata."""
+def _image_position(rect):
+    return {
+        "x1": rect.x0,
+        "y1": rect.y0,
+        "x2": rect.x1,
+        "y2": rect.y1,
+        "width": rect.width,
+        "height": rect.height,
+    }
+
+def image_page_numbers(image):
+    """Pages an extracted image appears on (older extractions have one record per occurrence)."""
+    if image.get("occurrences"):
+        return sorted(set(occurrence["page"] for occurrence in image["occurrences"]))
+    return [image["page"]]
+
+def images_on_page(images, page):
+    """Image records that appear on the given page."""
+    return [img for img in images if page in image_page_numbers(img)]
+
+def extract_page_images(doc, page, page_num, seen_images=None, ocr_batch=None, ocr=True):
+    """
+    Extract the embedded images of one page with additional metadata.
+    seen_images maps xref and content hash to records already extracted from this document:
+    a repeated logo or background only gets another entry in its "occurrences".
+    Image bytes go to the content-addressed asset store, so an image shared with other
+    documents is stored once as well.
+    OCR is queued on ocr_batch when given (the caller finishes it), otherwise it completes per page.
+    ocr=False skips image OCR, for pages that are OCRed as a whole.
+    Returns the records first seen on this page.
+    """
+    seen_images = {} if seen_images is None else seen_images
+    new_images = []
+    page_batch = ocr_batch or OCRBatch()
+    
+    # One pass over the placements of every image on the page
+    placements = {}
     try:
-        doc = fitz.open(file_path)
-        image_data = []
-        
-        for page_num, page in enumerate(doc):
-            # Extract images
-            images = page.get_images(full=True)
+        for info in page.get_image_info(xrefs=True):
+            placements.setdefault(info.get("xref"), []).append(fitz.Rect(info["bbox"]))
+    except Exception as e:
+        print(f"Error getting image positions: {e}")
+    
+    # Extract images
+    images = page.get_images(full=True)
+    placed_xrefs = set()
+    
+    for img_index, img in enumerate(images):
+        xref = img[0]  # image reference
+        if xref in placed_xrefs:
+            continue  # Listed twice on this page; its placements are already recorded
+        placed_xrefs.add(xref)
+        
+        img_data = seen_images.get(("xref", xref))
+        if img_data is None:
+            base_image = doc.extract_image(xref)
+            image_bytes = base_image["image"]
+            image_ext = base_image["ext"]
+            digest = content_hash(image_bytes)
             
-            for img_index, img in enumerate(images):
-                xref = img[0]  # image reference
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # Get more details about the image
-                width = base_image.get("width", 0)
-                height = base_image.get("height", 0)
-                colorspace = base_image.get("colorspace", "unknown")
-                
-                # Try to get the image position on the page
-                image_rect = None
-                try:
-                    for item in page.get_drawings():
-                        if item.get("type") == "image" and item.get("xref") == xref:
-                            image_rect = item.get("rect")
-                            break
-                except Exception as e:
-                    print(f"Error getting image position: {e}")
-                
-                # Encode as base64 for web display
-                image_b64 = base64.b64encode(image_bytes).decode('utf-8')
-                
+            # Same pixels under a different xref (e.g. embedded twice by the authoring tool)
+            img_data = seen_images.get(("hash", digest))
+        
+            if img_data is None:
                 # Create more detailed image data
                 img_data = {
-                    "page": page_num + 1,
+                    "page": page_num + 1,  # First page the image appears on
                     "index": img_index,
-                    "width": width,
-                    "height": height,
+                    "xref": xref,
+                    "content_hash": digest,
+                    "width": base_image.get("width", 0),
+                    "height": base_image.get("height", 0),
                     "format": image_ext,
-                    "colorspace": colorspace,
-                    "data_uri": f"data:image/{image_ext};base64,{image_b64}",
-                    "alt_text": f"Image on page {page_num + 1}"
+                    "colorspace": base_image.get("colorspace", "unknown"),
+                    "asset": save_asset(image_bytes, image_ext),
+                    "alt_text": f"Image on page {page_num + 1}",
+                    "occurrences": []
                 }
+                seen_images[("hash", digest)] = img_data
+                new_images.append(img_data)
                 
-                # Add position data if available
-                if image_rect:
-                    img_data["position"] = {
-                        "x1": image_rect.x0,
-                        "y1": image_rect.y0,
-                        "x2": image_rect.x1,
-                        "y2": image_rect.y1,
-                        "width": image_rect.width,
-                        "height": image_rect.height,
-                    }
-                
-                # Add image description using OCR if possible
-                try:
-                    import pytesseract
-                    from PIL import Image
-                    import io
-                    
-                    pil_image = Image.open(io.BytesIO(image_bytes))
-                    ocr_text = pytesseract.image_to_string(pil_image)
-                    if ocr_text and len(ocr_text.strip()) > 0:
-                        img_data["ocr_text"] = ocr_text.strip()
-                        img_data["alt_text"] = f"Image containing: {ocr_text[:100]}..." if len(ocr_text) > 100 else f"Image containing: {ocr_text}"
-                except Exception as e:
-                    print(f"OCR error for image: {e}")
-                
-                image_data.append(img_data)
+                # Add image description using OCR if possible (cached by content hash, run in the OCR pool)
+                if ocr:
+                    page_batch.add(img_data, image_bytes)
+            
+            seen_images[("xref", xref)] = img_data
+        
+        for rect in placements.get(xref) or [None]:
+            occurrence = {"page": page_num + 1}
+            if rect is not None:
+                occurrence["position"] = _image_position(rect)
+                # The first placement doubles as the image's position for older readers
+                img_data.setdefault("position", occurrence["position"])
+            img_data["occurrences"].append(occurrence)
+    
+    if ocr_batch is None:
+        page_batch.finish()
+    
+    return new_images
+
+def extract_images_from_pdf(file_path, ocr_skip_pages=()):
+    """
+    Extract each unique image of a PDF once, with the pages and positions where it appears.
+    Images first seen on ocr_skip_pages (1-based, pages OCRed as a whole) are not OCRed again.
+    """
+    try:
+        doc = fitz.open(file_path)
+        image_data = []
+        seen_images = {}
+        
+        # Queue OCR for the whole document so the pool works on several pages at once
+        ocr_batch = OCRBatch()
+        for page_num, page in enumerate(doc):
+            image_data.extend(extract_page_images(doc, page, page_num, seen_images, ocr_batch,
+                                                  ocr=page_num + 1 not in ocr_skip_pages))
+        ocr_batch.finish()
                 
         return image_data
                 
@@ -426,7 +580,7 @@ def extract_pdf_metadata(file_path):
     """Extract comprehensive metadata from the PDF."""
     try:
         # Using both PyPDF2 and PyMuPDF for different aspects
-        reader = PdfReader(file_path)
+        reader = PyPDF2.PdfReader(file_path)
         doc = fitz.open(file_path)
         
         metadata = {
@@ -458,13 +612,71 @@ def extract_pdf_metadata(file_path):
             "error": str(e)
         }
 
+def is_title_only_page(slide):
+    """Check if a page marked as math is just a chapter/section title page with no actual math."""
+    title_text = slide.get("title", "").lower()
+    content_text = slide.get("text", "")
+    
+    return (
+        ("chapter" in title_text or "section" in title_text) and
+        len(content_text.split('\n')) < 10 and
+        not any(sym in content_text for sym in "=+-*/^λθ")
+    )
+
+def _format_pdf_date(pdf_date):
+    """Convert a PDF date string like D:20230101120000+01'00' to the format used in metadata."""
+    match = re.match(r'D:(\d{4})(\d{2})(\d{2})(\d{2})?(\d{2})?(\d{2})?', pdf_date or "")
+    if not match:
+        return "Unknown"
+    year, month, day, hour, minute, second = (part or "00" for part in match.groups())
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+def extract_pdf_metadata_streaming(file_path):
+    """
+    Same fields as extract_pdf_metadata, read with PyMuPDF only so that
+    large documents are not fully parsed into PyPDF2's object cache.
+    """
+    try:
+        with fitz.open(file_path) as doc:
+            info = doc.metadata or {}
+            metadata = {
+                "file_name": os.path.basename(file_path),
+                "pages": len(doc),
+                "title": info.get("title") or "No title",
+                "author": info.get("author") or "Unknown",
+                "creation_date": _format_pdf_date(info.get("creationDate")),
+                "modification_date": _format_pdf_date(info.get("modDate")),
+                "page_dimensions": [],
+                "has_toc": len(doc.get_toc()) > 0,
+                "has_links": False,
+                "has_forms": False
+            }
+            
+            for page in doc:
+                metadata["page_dimensions"].append({
+                    "width": page.rect.width,
+                    "height": page.rect.height
+                })
+                metadata["has_links"] = metadata["has_links"] or len(page.get_links()) > 0
+                metadata["has_forms"] = metadata["has_forms"] or page.first_widget is not None
+            
+            return metadata
+    
+    except Exception as e:
+        print(f"Error extracting PDF metadata: {str(e)}")
+        return {
+            "file_name": os.path.basename(file_path),
+            "error": str(e)
+        }
+
 def save_enhanced_pdf_extraction(file_path, filename):
     """Save comprehensive PDF information with improved math formula detection."""
     try:
         print(f"Starting enhanced extraction for {filename}...")
         
         # Extract text data first
-        text_data = extract_text_from_pdf(file_path)
+        with stage("extract_text"):
+            text_data = extract_text_from_pdf(file_path)
         if not text_data:
             print(f"Failed to extract text from {filename}")
             return None
@@ -475,16 +687,23 @@ def save_enhanced_pdf_extraction(file_path, filename):
         math_pages = [slide for slide in text_data if slide.get("has_math_content", False)]
         print(f"Initially detected {len(math_pages)} pages with math content")
         
+        # Scanned pages have no text layer for the formula heuristics, and their OCR is already done
+        scanned_pages = set(slide["slide_number"] for slide in text_data if slide.get("page_type") == 'scanned')
+        ocr_pages = set(slide["slide_number"] for slide in text_data if needs_ocr(slide.get("page_type")))
+        
         # Extract formulas with improved detection
-        formula_data = extract_formulas_from_pdf(file_path)
+        with stage("extract_formulas"):
+            formula_data = extract_formulas_from_pdf(file_path, skip_pages=scanned_pages)
         print(f"Extracted {len(formula_data)} potential formulas")
         
         # Extract images
-        image_data = extract_images_from_pdf(file_path)
+        with stage("extract_images"):
+            image_data = extract_images_from_pdf(file_path, ocr_skip_pages=ocr_pages)
         print(f"Extracted {len(image_data)} images")
         
         # Extract metadata
-        metadata = extract_pdf_metadata(file_path)
+        with stage("extract_metadata"):
+            metadata = extract_pdf_metadata(file_path)
         
         # Verify math content detection based on formula extraction
         # If formulas were found but no pages were marked as having math, fix it
@@ -518,20 +737,9 @@ def save_enhanced_pdf_extraction(file_path, filename):
         # unless they actually contain equations
         for slide in text_data:
             page_num = slide["slide_number"]
-            if slide.get("has_math_content", False):
-                # Check if this is just a title page with no actual math
-                title_text = slide.get("title", "").lower()
-                content_text = slide.get("text", "")
-                
-                is_just_title = (
-                    ("chapter" in title_text or "section" in title_text) and
-                    len(content_text.split('\n')) < 10 and
-                    not any(sym in content_text for sym in "=+-*/^λθ")
-                )
-                
-                if is_just_title:
-                    slide["has_math_content"] = False
-                    print(f"Unmarking page {page_num} as it appears to be just a title page")
+            if slide.get("has_math_content", False) and is_title_only_page(slide):
+                slide["has_math_content"] = False
+                print(f"Unmarking page {page_num} as it appears to be just a title page")
         
         # Re-count pages with math content after corrections
         math_pages = [slide for slide in text_data if slide.get("has_math_content", False)]
@@ -539,6 +747,7 @@ def save_enhanced_pdf_extraction(file_path, filename):
         
         # Update metadata to indicate if mathematical content was found
         metadata["has_mathematical_content"] = len(math_pages) > 0
+        metadata.update(summarize_page_types(text_data))
         
         # Combine into a comprehensive structure
         pdf_data = {
@@ -555,8 +764,7 @@ def save_enhanced_pdf_extraction(file_path, filename):
         
         # Save to JSON file
         json_path = f'slides/{filename}_enhanced.json'
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(pdf_data, f, indent=2)
+        write_json(json_path, pdf_data, filename)
         
         print(f"Enhanced extraction completed and saved to {json_path}")
         return pdf_data
@@ -578,7 +786,195 @@ def save_extracted_pdf_text(slide_data, filename):
     }
     
     # Save to a single JSON file
-    with open(f'slides/{filename}_slides.json', 'w', encoding='utf-8') as f:
-        json.dump(presentation_data, f, indent=2)
+    write_json(f'slides/{filename}_slides.json', presentation_data, filename)
+    
+    return presentation_data
+
+def should_stream_pdf(file_path):
+    """Decide whether a PDF should go through the streaming extraction pipeline."""
+    if PDF_EXTRACTION_MODE == 'always':
+        return True
+    if PDF_EXTRACTION_MODE == 'never':
+        return False
+    
+    try:
+        with fitz.open(file_path) as doc:
+            return len(doc) > STREAMING_PAGE_THRESHOLD
+    except Exception as e:
+        print(f"Error counting PDF pages: {str(e)}")
+        return False
+
+def iter_pdf_pages(file_path):
+    """
+    Generator pipeline over a PDF: yields the slide record, formulas and new images of one page at a time.
+    Images already yielded keep receiving occurrences from later pages.
+    Page renders, formula crops and embedded images are written to the asset store as they are
+    produced, so nothing from earlier pages is kept in memory.
+    Text comes from PyMuPDF rather than PyPDF2, whose reader caches every object it resolves.
+    Pages without a usable text layer are OCRed in the pool; up to OCR_PAGE_LOOKAHEAD records
+    wait for their OCR while later pages are processed, and pages are still yielded in order.
+    """
+    doc = fitz.open(file_path)
+    seen_images = {}
+    pending = deque()
+    
+    try:
+        for page_num, page in enumerate(doc):
+            with stage("classify_page"):
+                page_info = classify_page_content(page)
+            scanned = page_info["type"] == 'scanned'
+            
+            try:
+                text = "" if scanned else page.get_text()
+            except Exception as e:
+                print(f"Error extracting text from page {page_num + 1}: {e}")
+                text = ""
+            
+            slide = build_slide_record(page_num + 1, text, file_path, page_info)
+            formulas = []
+            
+            # Scanned pages have no text spans, so the text heuristics are skipped for them
+            if not scanned:
+                # One classification of the page serves both the page flag and the formula crops
+                with stage("math_detection"):
+                    analysis = analyze_page_math(page)
+                    slide["has_math_content"] = detect_page_math(page, page_num, analysis)
+                
+                # Title pages are unmarked before rendering so no render is wasted on them
+                if slide["has_math_content"] and is_title_only_page(slide):
+                    slide["has_math_content"] = False
+                    print(f"Unmarking page {page_num + 1} as it appears to be just a title page")
+                
+                if slide["has_math_content"]:
+                    try:
+                        with stage("render_page"):
+                            slide["page_image_asset"] = save_asset(render_page_png(page), "png")
+                    except Exception as e:
+                        print(f"Error capturing page image: {e}")
+                
+                with stage("extract_formulas"):
+                    formulas = extract_page_formulas(page, page_num, store_assets=True, analysis=analysis)
+            
+            ocr_future = submit_page_ocr(page) if needs_ocr(page_info["type"]) else None
+            with stage("extract_images"):
+                images = extract_page_images(doc, page, page_num, seen_images, ocr=ocr_future is None)
+            pending.append(({"slide": slide, "formulas": formulas, "images": images}, ocr_future))
+            
+            # Hand out finished records in page order; block only when the window is full
+            while pending and (len(pending) > OCR_PAGE_LOOKAHEAD or pending[0][1] is None or pending[0][1].done()):
+                record, future = pending.popleft()
+                with stage("ocr"):
+                    ocr_text = ocr_page_text(future)
+                apply_ocr_text(record["slide"], ocr_text)
+                yield record
+            
+            # MuPDF keeps decoded fonts and images in its object store; trim it so
+            # native memory stays flat over long documents
+            if (page_num + 1) % 10 == 0:
+                fitz.TOOLS.store_shrink(100)
+        
+        while pending:
+            record, future = pending.popleft()
+            with stage("ocr"):
+                ocr_text = ocr_page_text(future)
+            apply_ocr_text(record["slide"], ocr_text)
+            yield record
+    finally:
+        doc.close()
+
+def _copy_spill_file(spill, out):
+    """Copy a spill file of one JSON document per line into an open JSON array."""
+    spill.seek(0)
+    for i, line in enumerate(spill):
+        if i:
+            out.write(",")
+        out.write(line.rstrip('\n'))
+
+def save_streaming_pdf_extraction(file_path, filename):
+    """
+    Memory-bounded variant of save_enhanced_pdf_extraction for very large PDFs.
+    Writes both _slides.json and _enhanced.json while pages are processed and
+    returns a small summary instead of the extracted data.
+    """
+    slides_path = f'slides/{filename}_slides.json'
+    enhanced_path = f'slides/{filename}_enhanced.json'
     
-    return presentation_data
\ No newline at end of file
+    try:
+        print(f"Starting streaming extraction for {filename}...")
+        extraction_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        header = f'{{"filename":{dumps_compact(filename)},"extraction_time":{dumps_compact(extraction_time)},"slides":['
+        
+        total_pages = 0
+        formula_count = 0
+        math_pages = []
+        page_kinds = []  # just the fields summarize_page_types needs, one small dict per page
+        
+        # Formulas belong to a separate array of the output, so they are spilled to a temporary
+        # file and stitched in after the slides. Unique image records stay in memory (their bytes
+        # are already in the asset store) because later pages can add occurrences to them.
+        images = []
+        # Both outputs are written under temporary names and replace the old ones together
+        with OutputFile(slides_path) as slides_out, \
+             OutputFile(enhanced_path) as enhanced_out, \
+             tempfile.TemporaryFile('w+', encoding='utf-8') as formulas_spill:
+            slides_out.write(header)
+            enhanced_out.write(header)
+            
+            for record in iter_pdf_pages(file_path):
+                slide = record["slide"]
+                slide_json = ("," if total_pages else "") + dumps_compact(slide)
+                slides_out.write(slide_json)
+                enhanced_out.write(slide_json)
+                total_pages += 1
+                
+                if slide["has_math_content"]:
+                    math_pages.append(slide["slide_number"])
+                page_kinds.append({key: slide[key] for key in ("page_number", "page_type", "text_source")})
+                
+                for formula in record["formulas"]:
+                    formulas_spill.write(dumps_compact(formula) + "\n")
+                    formula_count += 1
+                images.extend(record["images"])
+                
+                if total_pages % 50 == 0:
+                    print(f"Streamed {total_pages} pages of {filename}")
+            
+            slides_out.write(f'],"total_slides":{total_pages}}}')
+            
+            enhanced_out.write('],"formulas":[')
+            _copy_spill_file(formulas_spill, enhanced_out)
+            enhanced_out.write('],"images":')
+            enhanced_out.write(dumps_compact(images))
+            
+            metadata = extract_pdf_metadata_streaming(file_path)
+            metadata["has_mathematical_content"] = len(math_pages) > 0
+            metadata["extraction_mode"] = "streaming"
+            metadata.update(summarize_page_types(page_kinds))
+            enhanced_out.write(
+                f',"total_pages":{total_pages},'
+                f'"metadata":{dumps_compact(metadata)},'
+                f'"original_file_path":{dumps_compact(file_path)},'
+                f'"math_content_pages":{dumps_compact(math_pages)}}}'
+            )
+            
+            if total_pages == 0:
+                print(f"Failed to extract text from {filename}")
+                return None
+            
+            commit_outputs(filename, slides_out, enhanced_out)
+        
+        print(f"Streaming extraction of {total_pages} pages completed and saved to {enhanced_path}")
+        return {
+            "filename": filename,
+            "total_pages": total_pages,
+            "formula_count": formula_count,
+            "image_count": len(images),
+            "math_content_pages": math_pages,
+            "json_path": enhanced_path
+        }
+    
+    except Exception as e:
+        print(f"Error in streaming PDF extraction: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None
@@ -0,0 +1,139 @@
+"""
+Server-side page previews for the PDF viewer, rendered with PyMuPDF and cached on disk:
+
+- tiles: TILE_SIZE x TILE_SIZE pieces of a page at one of PREVIEW_SCALES (the viewer's zoom levels)
+- thumbnails: one small image per page
+- sprite sheets: the thumbnails of up to SPRITE_PAGES_PER_SHEET pages in one image
+
+Only the parts of a page that are looked at get rendered, so opening page 1 of a
+1000-page textbook costs the same as opening a 10-page handout.
+Cached files live under a directory keyed by the source file's path and version;
+re-uploading a document therefore never serves stale previews.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+
+from lazy_import import lazy_module
+
+fitz = lazy_module('fitz')
+
+PREVIEW_CACHE_FOLDER = os.getenv('PREVIEW_CACHE_FOLDER', os.path.join('slides', '.previews'))
+
+TILE_SIZE = int(os.getenv('PREVIEW_TILE_SIZE', '512'))
+PREVIEW_SCALES = [0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 3.0]
+
+THUMB_WIDTH = 160
+THUMB_HEIGHT = 120
+SPRITE_COLUMNS = 10
+SPRITE_PAGES_PER_SHEET = 100
+
+# PyMuPDF documents must not be used from several threads at once
+_render_lock = threading.Lock()
+
+def _file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def cache_dir(pdf_path):
+    key = hashlib.sha1(f"{os.path.abspath(pdf_path)}|{_file_version(pdf_path)}".encode('utf-8')).hexdigest()
+    return os.path.join(PREVIEW_CACHE_FOLDER, key[:2], key)
+
+def _cached(pdf_path, name, render):
+    """Path of a cached preview file, rendering it with render(doc) -> bytes on a miss."""
+    path = os.path.join(cache_dir(pdf_path), name)
+    if os.path.exists(path):
+        return path
+
+    with _render_lock:
+        if os.path.exists(path):
+            return path
+        with fitz.open(pdf_path) as doc:
+            data = render(doc)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+def nearest_scale(scale):
+    return min(PREVIEW_SCALES, key=lambda s: abs(s - scale))
+
+def document_info(pdf_path):
+    """Page count, page sizes in points and the tile/sprite layout the viewer needs."""
+    def render(doc):
+        info = {
+            "page_count": len(doc),
+            "pages": [[round(page.rect.width, 2), round(page.rect.height, 2)] for page in doc],
+            "tile_size": TILE_SIZE,
+            "scales": PREVIEW_SCALES,
+            "thumbnail": {
+                "width": THUMB_WIDTH,
+                "height": THUMB_HEIGHT,
+                "columns": SPRITE_COLUMNS,
+                "pages_per_sheet": SPRITE_PAGES_PER_SHEET
+            }
+        }
+        return json.dumps(info).encode('utf-8')
+
+    with open(_cached(pdf_path, 'info.json', render), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _check_page(doc, page):
+    if not 1 <= page <= len(doc):
+        raise ValueError(f"Page {page} out of range (1-{len(doc)})")
+    return doc[page - 1]
+
+def tile_path(pdf_path, page, scale, col, row):
+    """One TILE_SIZE square of a page rendered at scale (snapped to PREVIEW_SCALES)."""
+    scale = nearest_scale(scale)
+
+    def render(doc):
+        pdf_page = _check_page(doc, page)
+        width = math.ceil(pdf_page.rect.width * scale)
+        height = math.ceil(pdf_page.rect.height * scale)
+        x0, y0 = col * TILE_SIZE, row * TILE_SIZE
+        if col < 0 or row < 0 or x0 >= width or y0 >= height:
+            raise ValueError(f"Tile {col},{row} is outside page {page} at scale {scale}")
+        x1, y1 = min(x0 + TILE_SIZE, width), min(y0 + TILE_SIZE, height)
+        left, top = pdf_page.rect.x0, pdf_page.rect.y0
+        clip = fitz.Rect(left + x0 / scale, top + y0 / scale, left + x1 / scale, top + y1 / scale)
+        pix = pdf_page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip, alpha=False)
+        return pix.tobytes("png")
+
+    return _cached(pdf_path, f"tile-{page}-{scale:g}-{col}-{row}.png", render)
+
+def _thumbnail_pixmap(pdf_page):
+    zoom = min(THUMB_WIDTH / pdf_page.rect.width, THUMB_HEIGHT / pdf_page.rect.height)
+    return pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+def thumbnail_path(pdf_path, page):
+    def render(doc):
+        return _thumbnail_pixmap(_check_page(doc, page)).tobytes("png")
+
+    return _cached(pdf_path, f"thumb-{page}.png", render)
+
+def sprite_path(pdf_path, sheet):
+    """Sprite sheet with the thumbnails of pages sheet*SPRITE_PAGES_PER_SHEET + 1 onwards, row by row."""
+    def render(doc):
+        first = sheet * SPRITE_PAGES_PER_SHEET
+        if sheet < 0 or first >= len(doc):
+            raise ValueError(f"Sprite sheet {sheet} out of range")
+        count = min(SPRITE_PAGES_PER_SHEET, len(doc) - first)
+        rows = math.ceil(count / SPRITE_COLUMNS)
+        width = min(count, SPRITE_COLUMNS) * THUMB_WIDTH
+        sprite = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, rows * THUMB_HEIGHT), False)
+        sprite.clear_with(255)
+        for i in range(count):
+            thumb = _thumbnail_pixmap(doc[first + i])
+            # Centre each thumbnail in its cell
+            x = (i % SPRITE_COLUMNS) * THUMB_WIDTH + (THUMB_WIDTH - thumb.width) // 2
+            y = (i // SPRITE_COLUMNS) * THUMB_HEIGHT + (THUMB_HEIGHT - thumb.height) // 2
+            thumb.set_origin(x, y)
+            sprite.copy(thumb, thumb.irect)
+        return sprite.tobytes("png")
+
+    return _cached(pdf_path, f"sprite-{sheet}.png", render)
@@ -0,0 +1,493 @@
+"""
+Built-in sampling profiler, for finding out why /upload or /ask is slow in production.
+
+Two ways to collect samples, both producing collapsed stacks ("frame;frame;frame count", the
+input format of flamegraph.pl and speedscope) or an SVG flame graph:
+
+- Per request: a request sent with `X-Profile: 1` (or `?profile=1`) is sampled every
+  PROFILER_REQUEST_INTERVAL seconds while it runs. Background jobs it hands to the ingest pool
+  (the extraction of an upload) are profiled in their pool process under the same profile.
+  The response carries an X-Profile-Id header; the profile is at /admin/profiler/requests/<id>.
+- Always-on: a sampler thread in every worker and pool process samples the threads serving
+  requests or running background jobs every PROFILER_INTERVAL seconds. It is switched on and
+  off at runtime through POST /admin/profiler (all processes follow within PROFILER_POLL
+  seconds); the merged samples are at /admin/profiler/samples.
+
+Hot paths are annotated with `with stage("name"):`. Stages appear in the stacks as "[name]"
+under the function that opened them, and their wall time is summed per profile. While nothing
+is being profiled, stage() returns a shared no-op context manager and no thread samples.
+
+Samples are wall-clock: a thread waiting on the model shows up as waiting. A sample that comes
+late (the sampler could not get the GIL during a long C call) is weighted by its delay.
+Under gevent the sampler only sees OS threads, not individual greenlets.
+"""
+import html
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from shared_cache import shared_cache
+
+# Initial state of the always-on sampler; switched at runtime through /admin/profiler
+PROFILER = os.getenv('PROFILER', '0') == '1'
+
+# Seconds between samples of the always-on sampler and of a profiled request
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.01'))
+PROFILER_REQUEST_INTERVAL = float(os.getenv('PROFILER_REQUEST_INTERVAL', '0.002'))
+
+# When set, profiling a request and the /admin/profiler endpoints require this token
+# (X-Profile-Token header, or the profile_token query parameter)
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN', '')
+
+PROFILES_FOLDER = os.getenv('PROFILES_FOLDER', os.path.join('slides', '.cache', 'profiles'))
+
+# Request profiles kept on disk (oldest are deleted first)
+PROFILER_KEEP_REQUESTS = int(os.getenv('PROFILER_KEEP_REQUESTS', '50'))
+
+# Seconds between checks of the runtime switch, and between writes of the sampler's stacks
+PROFILER_POLL = 2.0
+PROFILER_FLUSH = 10.0
+
+PROFILER_MAX_DEPTH = 128
+
+_sampling = False  # the always-on sampler of this process is running
+_profiled = {}  # thread ident -> RequestProfile sampling it
+_stages = {}  # thread ident -> [(frame, stage name)] of the stages open in that thread
+_busy = set()  # idents of threads serving a request or running a background job
+_profiler_threads = set()  # the samplers themselves, never sampled
+_stage_seconds = Counter()  # wall time per stage while the always-on sampler runs
+_labels = {}  # code object -> frame label
+_lock = threading.Lock()
+
+_NO_STAGE = nullcontext()
+
+def active():
+    """Whether anything in this process is being profiled."""
+    return _sampling or bool(_profiled)
+
+class _Stage:
+    __slots__ = ('name', 'frame', 'ident', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.frame = sys._getframe(1)
+        self.ident = threading.get_ident()
+        self.started = time.perf_counter()
+        _stages.setdefault(self.ident, []).append((self.frame, self.name))
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        open_stages = _stages.get(self.ident)
+        if open_stages:
+            open_stages.pop()
+            if not open_stages:
+                _stages.pop(self.ident, None)
+        self.frame = None
+        profile = _profiled.get(self.ident)
+        if profile is not None or _sampling:
+            with _lock:
+                if profile is not None:
+                    profile.stage_seconds[self.name] += seconds
+                if _sampling:
+                    _stage_seconds[self.name] += seconds
+        return False
+
+def stage(name):
+    """Annotate a hot path: `with stage("build_prompt"): ...`. A no-op while nothing is profiled."""
+    if not (_sampling or _profiled):
+        return _NO_STAGE
+    return _Stage(name)
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+def collapse_stack(frame, open_stages=None):
+    """Collapsed stack of a frame, root first, with open stages as "[name]" under the frame that opened them."""
+    marks = {}
+    for stage_frame, name in open_stages or ():
+        marks.setdefault(id(stage_frame), []).append(name)
+    names = []
+    while frame is not None and len(names) < PROFILER_MAX_DEPTH:
+        for name in reversed(marks.get(id(frame), ())):
+            names.append(f"[{name}]")
+        names.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+def mark_busy():
+    """The calling thread is serving a request (sampled by the always-on sampler)."""
+    _busy.add(threading.get_ident())
+
+def mark_idle():
+    ident = threading.get_ident()
+    _busy.discard(ident)
+    _stages.pop(ident, None)
+
+def authorized(headers, args):
+    return not PROFILER_TOKEN or PROFILER_TOKEN in (headers.get('X-Profile-Token'), args.get('profile_token'))
+
+def requested(headers, args):
+    """Whether a request asks to be profiled (and may)."""
+    flag = headers.get('X-Profile') or args.get('profile')
+    return flag not in (None, '', '0', 'false') and authorized(headers, args)
+
+def _sample_threads(counts, idents, last, interval):
+    """Add one sample of each thread, weighted by how late the sample is; returns the sample time."""
+    now = time.perf_counter()
+    weight = max(1, round((now - last) / interval))
+    frames = sys._current_frames()
+    for ident in idents:
+        frame = frames.get(ident)
+        if frame is not None and ident not in _profiler_threads:
+            counts[collapse_stack(frame, _stages.get(ident))] += weight
+    return now
+
+def _save_json(path, data):
+    os.makedirs(PROFILES_FOLDER, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+class RequestProfile:
+    """Samples one thread (a request, or a background job of one) until stopped."""
+
+    def __init__(self, profile_id=None):
+        self.id = profile_id or uuid.uuid4().hex[:16]
+        self.ident = threading.get_ident()
+        self.idents = {self.ident}  # plus helper threads working for the request, see worker_thread
+        self.counts = Counter()
+        self.stage_seconds = Counter()
+        self._done = threading.Event()
+        self._thread = None
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def start(self):
+        _profiled[self.ident] = self
+        self._thread = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        _profiler_threads.add(threading.get_ident())
+        try:
+            last = time.perf_counter()
+            while not self._done.wait(PROFILER_REQUEST_INTERVAL):
+                last = _sample_threads(self.counts, list(self.idents), last, PROFILER_REQUEST_INTERVAL)
+        finally:
+            _profiler_threads.discard(threading.get_ident())
+
+    def stop(self):
+        for ident in list(self.idents):
+            if _profiled.get(ident) is self:
+                del _profiled[ident]
+        self._done.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def save_part(self):
+        """Store the samples of a background job for the request that submitted it."""
+        root = f"[pool process {os.getpid()}]"
+        _save_json(os.path.join(PROFILES_FOLDER, f"request-{self.id}.part-{uuid.uuid4().hex[:8]}.json"), {
+            "counts": {f"{root};{stack}": n for stack, n in self.counts.items()},
+            "stages": dict(self.stage_seconds)
+        })
+
+    def finish(self, **info):
+        """Stop, merge the samples of the request's background jobs and store the profile."""
+        self.stop()
+        counts = Counter(self.counts)
+        stages = Counter(self.stage_seconds)
+        prefix = f"request-{self.id}.part-"
+        os.makedirs(PROFILES_FOLDER, exist_ok=True)
+        for name in os.listdir(PROFILES_FOLDER):
+            if name.startswith(prefix) and name.endswith('.json'):
+                part = _load_json(os.path.join(PROFILES_FOLDER, name)) or {}
+                counts.update(part.get("counts", {}))
+                stages.update(part.get("stages", {}))
+                os.remove(os.path.join(PROFILES_FOLDER, name))
+
+        _save_json(os.path.join(PROFILES_FOLDER, f"request-{self.id}.json"), {
+            "id": self.id,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "pid": os.getpid(),
+            "seconds": round(self.seconds, 4),
+            "samples": sum(counts.values()),
+            "interval": PROFILER_REQUEST_INTERVAL,
+            "stages": {name: round(seconds, 4) for name, seconds in stages.most_common()},
+            **info,
+            "counts": dict(counts)
+        })
+        _prune_request_profiles()
+        print(f"Profiled {info.get('method', '')} {info.get('path', '')} in {self.seconds:.3f}s: "
+              f"{sum(counts.values())} samples, profile {self.id}")
+        return self
+
+def _request_profile_paths():
+    """Stored request profiles, newest first."""
+    try:
+        names = [n for n in os.listdir(PROFILES_FOLDER) if n.startswith('request-') and '.part-' not in n
+                 and n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(PROFILES_FOLDER, n) for n in names]
+    return sorted(paths, key=lambda p: os.stat(p).st_mtime, reverse=True)
+
+def _prune_request_profiles():
+    for path in _request_profile_paths()[PROFILER_KEEP_REQUESTS:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def list_request_profiles():
+    """Summaries of the stored request profiles, newest first."""
+    profiles = []
+    for path in _request_profile_paths():
+        profile = _load_json(path)
+        if profile:
+            profile.pop("counts", None)
+            profiles.append(profile)
+    return profiles
+
+def load_request_profile(profile_id):
+    if not profile_id.isalnum():
+        return None
+    return _load_json(os.path.join(PROFILES_FOLDER, f"request-{profile_id}.json"))
+
+def current_profile():
+    """The RequestProfile sampling the calling thread, if any."""
+    return _profiled.get(threading.get_ident())
+
+@contextmanager
+def worker_thread(profile=None):
+    """Mark a helper thread working for a request: sampled, and part of the request's profile if given."""
+    ident = threading.get_ident()
+    _busy.add(ident)
+    if profile is not None:
+        profile.idents.add(ident)
+        _profiled[ident] = profile
+    try:
+        yield
+    finally:
+        _busy.discard(ident)
+        _stages.pop(ident, None)
+        if profile is not None:
+            profile.idents.discard(ident)
+            if _profiled.get(ident) is profile:
+                del _profiled[ident]
+
+def run_profiled_job(profile_id, fn, *args, **kwargs):
+    """Run a background job in a pool process, sampled (and profiled for its request, if any)."""
+    sampler.start()
+    profile = RequestProfile(profile_id).start() if profile_id else None
+    mark_busy()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        mark_idle()
+        if profile is not None:
+            profile.stop().save_part()
+
+def profiled_job(fn, args):
+    """(fn, args) for a job submitted to the pool while this process is profiling."""
+    profile = _profiled.get(threading.get_ident())
+    return run_profiled_job, (profile.id if profile else None, fn) + tuple(args)
+
+class Sampler:
+    """The always-on sampler of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._thread = None
+        self._pid = None
+        self._reset_at = 0.0
+        self._stats = {"samples": 0, "sample_seconds": 0.0}
+
+    def start(self):
+        """Start the sampler thread of this process (once; again after a fork)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._counts = Counter()
+            self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+            self._thread.start()
+
+    def _read_switch(self):
+        global _sampling
+        setting = shared_cache.get("profiler", "sampler") or {}
+        if setting.get("reset_at", 0.0) > self._reset_at:
+            self._reset_at = setting["reset_at"]
+            with self._lock:
+                self._counts.clear()
+            with _lock:
+                _stage_seconds.clear()
+        _sampling = setting.get("enabled", PROFILER)
+        return float(setting.get("interval") or PROFILER_INTERVAL)
+
+    def _run(self):
+        _profiler_threads.add(threading.get_ident())
+        next_flush = time.time() + PROFILER_FLUSH
+        unflushed = False
+        while True:
+            try:
+                interval = self._read_switch()
+            except Exception as e:
+                print(f"Profiler could not read its switch: {e}")
+                interval = PROFILER_INTERVAL
+            poll_until = time.time() + PROFILER_POLL
+            last = time.perf_counter()
+            while _sampling and time.time() < poll_until:
+                time.sleep(interval)
+                last = self.sample(last, interval)
+                unflushed = True
+            if not _sampling:
+                time.sleep(PROFILER_POLL)
+            if unflushed and (time.time() >= next_flush or not _sampling):
+                self.flush()
+                unflushed = False
+                next_flush = time.time() + PROFILER_FLUSH
+
+    def sample(self, last, interval):
+        """Take one sample of every busy thread; returns the sample time."""
+        with self._lock:
+            now = _sample_threads(self._counts, list(_busy), last, interval)
+            self._stats["samples"] += 1
+            self._stats["sample_seconds"] += time.perf_counter() - now
+        return now
+
+    def flush(self):
+        """Write this process's stacks for /admin/profiler/samples."""
+        with self._lock:
+            counts = dict(self._counts)
+        with _lock:
+            stages = dict(_stage_seconds)
+        _save_json(os.path.join(PROFILES_FOLDER, f"sampler-{os.getpid()}.json"), {
+            "pid": os.getpid(), "updated": time.time(), "counts": counts, "stages": stages
+        })
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(
+            stats,
+            enabled=_sampling,
+            sample_seconds=round(stats["sample_seconds"], 3),
+            avg_sample_us=round(stats["sample_seconds"] * 1e6 / stats["samples"], 1) if stats["samples"] else 0.0,
+            profiled_requests=len(_profiled)
+        )
+
+sampler = Sampler()
+
+def set_sampling(enabled, interval=None):
+    """Switch the always-on sampler of every process (they follow within PROFILER_POLL seconds)."""
+    setting = shared_cache.get("profiler", "sampler") or {}
+    setting["enabled"] = bool(enabled)
+    if interval:
+        setting["interval"] = float(interval)
+    shared_cache.set("profiler", "sampler", setting)
+    return setting
+
+def reset_samples():
+    """Drop the always-on samples of every process."""
+    setting = shared_cache.get("profiler", "sampler") or {"enabled": PROFILER}
+    setting["reset_at"] = time.time()
+    shared_cache.set("profiler", "sampler", setting)
+    for name in os.listdir(PROFILES_FOLDER) if os.path.isdir(PROFILES_FOLDER) else []:
+        if name.startswith('sampler-'):
+            os.remove(os.path.join(PROFILES_FOLDER, name))
+
+def merged_samples():
+    """(counts, stage seconds, processes) of the always-on samples of all processes."""
+    if _sampling:
+        sampler.flush()
+    counts = Counter()
+    stages = Counter()
+    processes = 0
+    for name in os.listdir(PROFILES_FOLDER) if os.path.isdir(PROFILES_FOLDER) else []:
+        if name.startswith('sampler-') and name.endswith('.json'):
+            data = _load_json(os.path.join(PROFILES_FOLDER, name))
+            if data:
+                counts.update(data["counts"])
+                stages.update(data["stages"])
+                processes += 1
+    return counts, stages, processes
+
+def collapsed_text(counts):
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items()))
+
+def _frame_color(name):
+    if name.startswith('['):
+        return "rgb(90,160,230)"  # stage annotations
+    hue = zlib.crc32(name.encode('utf-8'))
+    return f"rgb({205 + hue % 50},{80 + (hue >> 8) % 130},{(hue >> 16) % 55})"
+
+def flamegraph_svg(counts, title="Flame graph", width=1200, row_height=16):
+    """A self-contained SVG flame graph of collapsed stacks (hover a frame for its samples)."""
+    root = {"value": 0, "children": {}}
+    for stack, n in counts.items():
+        node = root
+        node["value"] += n
+        for name in stack.split(';'):
+            node = node["children"].setdefault(name, {"value": 0, "children": {}})
+            node["value"] += n
+    total = root["value"] or 1
+
+    rects = []  # (x, depth, width, name, samples)
+    pending = [(root, 0.0, -1)]
+    while pending:
+        node, x, depth = pending.pop()
+        for name, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.3:
+                rects.append((x, depth + 1, w, name, child["value"]))
+                pending.append((child, x, depth + 1))
+            x += w
+    depth = max((r[1] for r in rects), default=0) + 1
+    height = (depth + 2) * row_height
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row_height - 4}">{html.escape(title)} ({total} samples)</text>'
+    ]
+    for x, d, w, name, samples in rects:
+        y = height - (d + 1) * row_height
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label}: {samples} samples ({samples * 100 / total:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="{_frame_color(name)}"/>'
+        )
+        chars = int(w / 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + ".."
+            parts.append(f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{html.escape(text)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return "\n".join(parts)
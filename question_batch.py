@@ -0,0 +1,160 @@
+"""
+Batches of questions about one presentation (exam review sets, FAQs), answered concurrently.
+
+    python question_batch.py "Lecture 05-Arrays" questions.json
+    python question_batch.py "Lecture 05-Arrays" questions.jsonl --concurrency 16 --output answers.jsonl
+    python question_batch.py "Lecture 05-Arrays" questions.json --url http://localhost:8000
+
+The question file is a JSON list (or {"items": [...]}) or JSON lines, each item being
+{"question": ..., "slide_number": ...} (slide_number optional: whole-deck question).
+Results are written as JSON lines in completion order, followed by a summary line.
+Without --url the batch runs in-process, so with MODEL_BACKEND=fake it needs no network.
+The same runner serves POST /ask-batch.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import profiler
+
+# Model calls of one batch in flight at once (they also share the MODEL_CONCURRENCY slots)
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+
+# Admission cost of one /ask-batch request (a single /ask costs 1)
+BATCH_REQUEST_COST = float(os.getenv('BATCH_REQUEST_COST', '5'))
+
+def validate_batch_items(items):
+    """The items of a batch request, or ValueError saying what is wrong with them."""
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} items per batch")
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("question"), str) or not item["question"].strip():
+            raise ValueError(f"Item {index} needs a question")
+        slide_number = item.get("slide_number")
+        if slide_number is not None and (isinstance(slide_number, bool) or not isinstance(slide_number, int)):
+            raise ValueError(f"Item {index}: slide_number must be an integer")
+    return items
+
+def _timed(answer, item, profile):
+    started = time.perf_counter()
+    try:
+        with profiler.worker_thread(profile):
+            text, cached = answer(item)
+        error = text[len("Error:"):].strip() if text.startswith("Error:") else None
+        return text, cached, error, time.perf_counter() - started
+    except Exception as e:
+        return None, False, str(e), time.perf_counter() - started
+
+def run_batch(items, answer, concurrency=BATCH_CONCURRENCY):
+    """
+    Run answer(item) -> (answer text, cached) for every item with up to `concurrency` in flight.
+    Yields one result per item as it completes, then {"summary": ...}.
+    """
+    started = time.perf_counter()
+    latencies = []
+    failed = cached_count = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items))))
+    profile = profiler.current_profile()
+    try:
+        futures = {pool.submit(_timed, answer, item, profile): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            index = futures[future]
+            text, cached, error, seconds = future.result()
+            latencies.append(seconds)
+            result = {
+                "index": index,
+                "question": items[index]["question"],
+                "slide_number": items[index].get("slide_number"),
+                "latency_ms": round(seconds * 1000, 1)
+            }
+            if error is not None:
+                failed += 1
+                result["error"] = error
+            else:
+                cached_count += cached
+                result.update(answer=text, cached=cached)
+            yield result
+    finally:
+        # A client that went away does not keep the rest of the batch running
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    latencies.sort()
+    yield {"summary": {
+        "items": len(items),
+        "answered": len(items) - failed,
+        "failed": failed,
+        "cached": cached_count,
+        "concurrency": concurrency,
+        "seconds": round(time.perf_counter() - started, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1)
+    }}
+
+def load_items(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return validate_batch_items(data.get("items") if isinstance(data, dict) else data)
+
+def run_local(filename, items, concurrency):
+    from app import load_question_deck, answer_from_deck
+
+    deck = load_question_deck(filename)
+    if deck is None:
+        raise SystemExit(f"Presentation '{filename}' not found in slides/")
+
+    def answer(item):
+        return answer_from_deck(deck, item["question"], item.get("slide_number"),
+                                item.get("include_visual_elements", True))
+    return run_batch(items, answer, concurrency)
+
+def run_remote(url, filename, items, concurrency):
+    import urllib.request
+
+    payload = json.dumps({"filename": filename, "items": items, "concurrency": concurrency}).encode('utf-8')
+    req = urllib.request.Request(f"{url.rstrip('/')}/ask-batch", data=payload,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filename', help='Presentation name as in slides/ (without _slides.json)')
+    parser.add_argument('questions', help='JSON or JSON lines file of {"question", "slide_number"} items')
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument('--output', help='Write results here instead of stdout')
+    parser.add_argument('--url', help='Send the batch to a running server instead of answering in-process')
+    args = parser.parse_args()
+
+    items = load_items(args.questions)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    # The app's progress messages go to stderr, keeping stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            results = (run_remote(args.url, args.filename, items, args.concurrency) if args.url
+                       else run_local(args.filename, items, args.concurrency))
+            for result in results:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                if "summary" in result:
+                    print(f"Batch done: {result['summary']}")
+                elif "error" in result:
+                    print(f"Item {result['index']} failed: {result['error']}")
+        finally:
+            if args.output:
+                out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+HTTP response layer: content negotiation, compression and validators.
+
+- Dynamic responses (JSON, HTML, text) above COMPRESS_MIN_BYTES are compressed per request,
+  Brotli when the client accepts it and the brotli package is installed, otherwise gzip.
+- Files that never change once written (uploaded originals, static scripts, assets) are
+  compressed once - at ingest or at startup - and the stored variant is sent as is. Variants
+  that would not save PRECOMPRESS_MIN_SAVING are not kept.
+- Every GET 200 gets a strong ETag derived from a content hash, and a matching If-None-Match
+  is answered with 304. Encoded variants carry the hash plus the encoding, and any of them
+  validates the content.
+- Content-addressed URLs (assets, fingerprinted static files) are cacheable for a year;
+  everything else has to be revalidated.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request, send_file
+
+from shared_cache import shared_cache
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', '1') != '0'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+# Per-request compression favours speed, stored variants favour size
+BROTLI_DYNAMIC_QUALITY = 5
+GZIP_DYNAMIC_LEVEL = 6
+BROTLI_STATIC_QUALITY = 9
+GZIP_STATIC_LEVEL = 9
+
+# Stored variants must be at least this much smaller than the original to be kept
+PRECOMPRESS_MIN_SAVING = float(os.getenv('PRECOMPRESS_MIN_SAVING', '0.05'))
+COMPRESSED_FOLDER = os.path.join('slides', '.cache', 'compressed')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson',
+                      'application/pdf', 'image/svg+xml')
+
+ENCODING_SUFFIXES = {'br': 'br', 'gzip': 'gz'}
+
+_digests = OrderedDict()  # path -> (version, sha256), for the files served through send_cached_file
+_digests_lock = threading.Lock()
+MAX_DIGESTS = 4096
+
+_stats_lock = threading.Lock()
+_stats = {
+    "compressed": 0,
+    "precompressed_hits": 0,
+    "not_modified": 0,
+    "identity_bytes": 0,
+    "sent_bytes": 0
+}
+
+def _count(**amounts):
+    with _stats_lock:
+        for key, amount in amounts.items():
+            _stats[key] += amount
+
+def available_encodings():
+    return ('br', 'gzip') if brotli else ('gzip',)
+
+def negotiate_encoding(accept_encoding):
+    """Best encoding the client accepts ('br', 'gzip') or None."""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress(data, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_STATIC_QUALITY if static else BROTLI_DYNAMIC_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_STATIC_LEVEL if static else GZIP_DYNAMIC_LEVEL, mtime=0)
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+def etag_for(digest, encoding=None):
+    return f"{digest[:32]}-{encoding}" if encoding else digest[:32]
+
+def _matches(digest):
+    """Whether the request's If-None-Match names this content in any encoding."""
+    if not request.if_none_match:
+        return False
+    if request.if_none_match.star_tag:
+        return True
+    return any(request.if_none_match.contains(etag_for(digest, encoding))
+               for encoding in (None,) + tuple(ENCODING_SUFFIXES))
+
+def _version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def remember_digest(path, digest):
+    """Record the sha256 of a file whose hash is already known (e.g. computed during upload)."""
+    shared_cache.set("content_hashes", os.path.abspath(path), {"version": _version(path), "sha256": digest})
+
+def file_digest(path):
+    """sha256 of a file, computed once per file version and shared between workers."""
+    key = os.path.abspath(path)
+    version = _version(path)
+    with _digests_lock:
+        entry = _digests.get(key)
+        if entry and entry[0] == version:
+            _digests.move_to_end(key)
+            return entry[1]
+
+    record = shared_cache.get("content_hashes", key)
+    if record and record["version"] == version:
+        digest = record["sha256"]
+    else:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        shared_cache.set("content_hashes", key, {"version": version, "sha256": digest})
+
+    with _digests_lock:
+        _digests[key] = (version, digest)
+        _digests.move_to_end(key)
+        while len(_digests) > MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return digest
+
+def _variant_path(digest, encoding):
+    return os.path.join(COMPRESSED_FOLDER, digest[:2], f"{digest}.{ENCODING_SUFFIXES[encoding]}")
+
+def _skip_marker(digest):
+    return os.path.join(COMPRESSED_FOLDER, digest[:2], f"{digest}.none")
+
+def precompress_file(path, digest=None):
+    """
+    Store compressed variants of an immutable file, keyed by its content hash.
+    Returns {encoding: variant size}; empty when compressing would not pay off.
+    """
+    if not is_compressible(mimetypes.guess_type(path)[0]):
+        return {}
+    digest = digest or file_digest(path)
+    if os.path.exists(_skip_marker(digest)):
+        return {}
+    os.makedirs(os.path.join(COMPRESSED_FOLDER, digest[:2]), exist_ok=True)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    sizes = {}
+    for encoding in available_encodings():
+        variant = _variant_path(digest, encoding)
+        if os.path.exists(variant):
+            sizes[encoding] = os.path.getsize(variant)
+            continue
+        compressed = compress(data, encoding, static=True)
+        if len(compressed) > len(data) * (1 - PRECOMPRESS_MIN_SAVING):
+            continue
+        tmp_path = f"{variant}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, variant)
+        sizes[encoding] = len(compressed)
+
+    if not sizes:
+        open(_skip_marker(digest), 'wb').close()
+    return sizes
+
+def precompress_folder(folder):
+    """Precompress the files of a folder (e.g. static/ at startup); returns how many have variants."""
+    count = 0
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and precompress_file(path):
+            count += 1
+    return count
+
+def _cache_headers(response, max_age, immutable, compressible):
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    elif max_age:
+        response.headers['Cache-Control'] = f"public, max-age={max_age}"
+    else:
+        response.headers['Cache-Control'] = "no-cache"
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+def send_cached_file(path, mimetype=None, max_age=0, immutable=False, digest=None):
+    """
+    send_file with a content-hash ETag, 304 on a matching If-None-Match, a stored compressed
+    variant when the client accepts one (and asked for the whole file), and Cache-Control.
+    Content-addressed files pass their digest instead of having it looked up.
+    """
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    compressible = RESPONSE_COMPRESSION and is_compressible(mimetype)
+    digest = digest or file_digest(path)
+
+    if _matches(digest):
+        response = send_file(os.path.abspath(path), mimetype=mimetype, etag=etag_for(digest), conditional=False)
+        response.status_code = 304
+        response.direct_passthrough = False
+        response.set_data(b'')
+        _count(not_modified=1)
+        return _cache_headers(response, max_age, immutable, compressible)
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if compressible and not request.range else None
+    variant = _variant_path(digest, encoding) if encoding else None
+    if variant and os.path.exists(variant):
+        response = send_file(os.path.abspath(variant), mimetype=mimetype, etag=etag_for(digest, encoding),
+                             conditional=False)
+        response.headers['Content-Encoding'] = encoding
+        _count(precompressed_hits=1, identity_bytes=os.path.getsize(path), sent_bytes=os.path.getsize(variant))
+    else:
+        response = send_file(os.path.abspath(path), mimetype=mimetype, etag=etag_for(digest), conditional=True)
+        size = os.path.getsize(path)
+        _count(identity_bytes=size, sent_bytes=size)
+    return _cache_headers(response, max_age, immutable, compressible)
+
+def finalize_response(response):
+    """after_request hook: validators and compression for responses built in memory."""
+    if response.direct_passthrough or response.is_streamed or response.status_code not in (200, 201):
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+    if request.method == 'GET' and response.status_code == 200 and not response.headers.get('ETag'):
+        digest = hashlib.sha256(data).hexdigest()
+        if _matches(digest):
+            _count(not_modified=1, identity_bytes=len(data))
+            response.set_data(b'')
+            response.status_code = 304
+            response.headers['ETag'] = f'"{etag_for(digest)}"'
+            return response
+        response.headers['ETag'] = f'"{etag_for(digest)}"'
+        response.headers.setdefault('Cache-Control', 'no-cache')
+    else:
+        digest = None
+
+    encoding = None
+    if RESPONSE_COMPRESSION and len(data) >= COMPRESS_MIN_BYTES and is_compressible(response.mimetype):
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding:
+        compressed = compress(data, encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if digest:
+            response.headers['ETag'] = f'"{etag_for(digest, encoding)}"'
+        _count(compressed=1, identity_bytes=len(data), sent_bytes=len(compressed))
+    else:
+        _count(identity_bytes=len(data), sent_bytes=len(data))
+    return response
+
+def get_response_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved_percent"] = round(100 * (1 - stats["sent_bytes"] / stats["identity_bytes"]), 1) if stats["identity_bytes"] else 0.0
+    return dict(stats, enabled=RESPONSE_COMPRESSION, encodings=list(available_encodings()))
@@ -0,0 +1,108 @@
+"""
+Production entry point for the slide assistant.
+
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+
+Runs the Flask app under gunicorn with the application preloaded in the master process:
+modules are imported and the presentation cache is warmed once, then inherited by every
+forked worker. Answer and visual-element caches live in the shared SQLite store, so all
+workers see each other's entries.
+
+Graceful reload: `kill -HUP <master pid>` replaces the workers. They fork from the warm
+master again, and the shared cache on disk is untouched.
+
+Async mode (`--async`, i.e. the gevent worker class): each request runs in a greenlet, so a
+request waiting seconds on Gemini or Stability holds no OS thread. One process can keep
+hundreds of questions in flight; outbound calls are bounded by MODEL_CONCURRENCY.
+
+On Windows, where gunicorn is unavailable, the app falls back to waitress (threads only).
+"""
+import argparse
+import os
+import sys
+
+def default_workers():
+    return int(os.getenv('WEB_WORKERS', str((os.cpu_count() or 1) * 2 + 1)))
+
+# The app defers PyMuPDF, PyPDF2 and python-pptx until first use. With a preloading master
+# they are imported once up front instead, so forked workers share them.
+PRELOAD_HEAVY_MODULES = os.getenv('PRELOAD_HEAVY_MODULES', '1') != '0'
+
+def load_app():
+    """Import the app and warm its caches; runs once in the master when preloading."""
+    import app as slide_app
+
+    if PRELOAD_HEAVY_MODULES:
+        from lazy_import import preload
+        preload('fitz', 'PyPDF2', 'pptx', 'requests', 'numpy')
+    slide_app.warm_presentation_cache()
+    slide_app.slide_vectors.refresh(force=True)
+    from response_layer import precompress_folder
+    print(f"Precompressed {precompress_folder(slide_app.STATIC_FOLDER)} static files")
+    slide_app.shared_cache.purge_expired()
+    return slide_app.app
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class SlideAssistantServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_app()
+
+    SlideAssistantServer({
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": args.worker_class,
+        "worker_connections": args.worker_connections,
+        "preload_app": True,
+        # Multimodal Gemini calls can take a while; don't let the arbiter kill busy workers
+        "timeout": args.timeout,
+        "graceful_timeout": args.timeout,
+        "accesslog": "-" if args.access_log else None,
+    }).run()
+
+def run_waitress(args):
+    from waitress import serve
+
+    host, _, port = args.bind.rpartition(':')
+    print(f"gunicorn is not available on {sys.platform}; serving with waitress ({args.threads} threads)")
+    serve(load_app(), host=host or '0.0.0.0', port=int(port), threads=args.threads)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=os.getenv('WEB_BIND', '127.0.0.1:8000'))
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '4')))
+    parser.add_argument('--worker-class', default=os.getenv('WEB_WORKER_CLASS', 'gthread'))
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Use the gevent worker class (same as --worker-class gevent)')
+    parser.add_argument('--worker-connections', type=int, default=int(os.getenv('WEB_WORKER_CONNECTIONS', '1000')),
+                        help='Concurrent requests per worker in async mode')
+    parser.add_argument('--timeout', type=int, default=int(os.getenv('WEB_TIMEOUT', '120')))
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+    if args.use_async:
+        args.worker_class = 'gevent'
+
+    if args.worker_class == 'gevent':
+        # Patch before the app is preloaded, so sockets, locks and the HTTP clients it
+        # creates are all cooperative
+        from gevent import monkey
+        monkey.patch_all()
+
+    if sys.platform == 'win32':
+        run_waitress(args)
+    else:
+        run_gunicorn(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# One SQLite file shared by every worker process of the server. It lives on disk,
+# so its contents also survive a graceful reload of the workers.
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join('slides', '.cache', 'shared_cache.db'))
+
+class SharedCache:
+    """
+    Small namespaced key/value store on SQLite in WAL mode.
+    Safe to use from many threads and from processes forked after it was created:
+    connections are opened lazily per (process, thread).
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key):
+        """Return the cached JSON value, or None when missing or expired."""
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read error: {e}")
+            return None
+
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store a JSON-serializable value, optionally expiring after ttl seconds."""
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, separators=(',', ':')), expires_at)
+            )
+        except sqlite3.Error as e:
+            print(f"Shared cache write error: {e}")
+
+    def claim(self, namespace, key, value=True, ttl=60):
+        """Set key only if it is missing or expired; True when this caller got it (a cross-process lock)."""
+        now = time.time()
+        try:
+            cursor = self._connection().execute(
+                "INSERT INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                " WHERE cache.expires_at IS NOT NULL AND cache.expires_at < ?",
+                (namespace, key, json.dumps(value, separators=(',', ':')), now + ttl, now)
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            print(f"Shared cache claim error: {e}")
+            return False
+
+    def delete(self, namespace, key):
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            print(f"Shared cache delete error: {e}")
+
+    def values(self, namespace):
+        """All unexpired values of a namespace."""
+        try:
+            rows = self._connection().execute(
+                "SELECT value FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (namespace, time.time())
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Shared cache read error: {e}")
+            return []
+        return [json.loads(row[0]) for row in rows]
+
+    def items(self, namespace):
+        """Iterate over the unexpired (key, value) pairs of a namespace without loading them all."""
+        try:
+            cursor = self._connection().execute(
+                "SELECT key, value FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (namespace, time.time())
+            )
+            for key, value in cursor:
+                yield key, json.loads(value)
+        except sqlite3.Error as e:
+            print(f"Shared cache read error: {e}")
+
+    def delete_namespace(self, namespace):
+        try:
+            self._connection().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            print(f"Shared cache delete error: {e}")
+
+    def take_tokens(self, buckets, cost=1.0, max_wait=0.0):
+        """
+        Reserve cost tokens from every (key, rate per second, burst) token bucket in one transaction.
+        Buckets may go into debt: the reservation then means waiting until it is paid off.
+        Returns (admitted, wait_seconds, limiting_key). When admitted, the caller waits wait_seconds
+        before proceeding; otherwise nothing was taken and wait_seconds is how long until the
+        reservation would fit within max_wait. Storage errors admit the request.
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                states = []
+                for key, rate, burst in buckets:
+                    row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                    tokens -= cost
+                    states.append((key, tokens, -tokens / rate if tokens < 0 else 0.0))
+                
+                limiting_key, _, wait = max(states, key=lambda state: state[2])
+                if wait > max_wait:
+                    conn.execute("ROLLBACK")
+                    return False, wait - max_wait, limiting_key
+                
+                conn.executemany(
+                    "INSERT OR REPLACE INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    [(key, tokens, now) for key, tokens, _ in states]
+                )
+                conn.execute("COMMIT")
+                return True, wait, limiting_key
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"Shared cache token bucket error: {e}")
+            return True, 0.0, None
+
+    def purge_expired(self):
+        try:
+            self._connection().execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            )
+            # Buckets idle for an hour are full again and can simply be forgotten
+            self._connection().execute("DELETE FROM token_buckets WHERE updated < ?", (time.time() - 3600,))
+        except sqlite3.Error as e:
+            print(f"Shared cache purge error: {e}")
+
+    def stats(self):
+        """Entry counts per namespace plus this process's hit/miss counters."""
+        try:
+            rows = self._connection().execute(
+                "SELECT namespace, COUNT(*) FROM cache GROUP BY namespace"
+            ).fetchall()
+        except sqlite3.Error:
+            rows = []
+        return {
+            "path": self.path,
+            "entries": {namespace: count for namespace, count in rows},
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+shared_cache = SharedCache()
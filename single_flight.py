@@ -0,0 +1,61 @@
+import threading
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the leader) runs the
+    function, everyone arriving while it runs waits for and shares its result - or its error.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "wait_timeouts": 0,
+            "errors_fanned_out": 0
+        }
+
+    def do(self, key, fn, timeout=None):
+        """Run fn() once per key at a time; followers give up after timeout seconds."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["leaders"] += 1
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    if call.error is not None:
+                        self.stats["errors_fanned_out"] += call.waiters
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self.stats["wait_timeouts"] += 1
+            raise TimeoutError(f"Timed out after {timeout}s waiting for an identical in-flight request")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,306 @@
+"""
+Near-duplicate slides across the course library, found with shingling and MinHash/LSH.
+
+Every slide's text is cut into word 3-shingles and summarised by a MinHash signature.
+Signatures are split into LSH bands, so a new slide is only compared with the slides that
+share a band bucket with it: indexing a deck costs the same however large the library is.
+Candidates whose estimated Jaccard similarity reaches DUPLICATE_THRESHOLD are linked, and
+linked slides form a cluster whose first slide (by presentation name and slide number)
+is the canonical one; the others are back-references to it.
+
+Like the library index, the state is persisted next to the shared cache and kept current
+incrementally from the *_slides.json files.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+UPLOAD_FOLDER = 'slides'
+SLIDE_DEDUP_PATH = os.getenv('SLIDE_DEDUP_PATH', os.path.join('slides', '.cache', 'slide_dedup.json'))
+
+# Directory rescans for changed decks happen at most this often (seconds)
+DEDUP_REFRESH_INTERVAL = float(os.getenv('DEDUP_REFRESH_INTERVAL', '5'))
+
+# Estimated Jaccard similarity of two slides' shingles above which they are duplicates
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.8'))
+
+SHINGLE_SIZE = 3
+
+# 16 bands of 4 rows: pairs above ~0.5 similarity become candidates with high probability
+LSH_BANDS = 16
+LSH_ROWS = 4
+NUM_PERM = LSH_BANDS * LSH_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1234)  # fixed seed: signatures must stay comparable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# Footer lines such as "Slide <number> of 36" are on every slide of a deck and say nothing about it
+_BOILERPLATE = re.compile(r'^\s*(slide|page)\s*(<number>|\d+)(\s*of\s*\d+)?\s*$', re.IGNORECASE | re.MULTILINE)
+
+def shingles(text):
+    """Word 3-shingles of a slide's text; a very short slide is a single shingle."""
+    tokens = re.findall(r'[a-z0-9]+', _BOILERPLATE.sub(' ', text or '').lower())
+    if not tokens:
+        return set()
+    if len(tokens) < SHINGLE_SIZE:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(shingle_set):
+    """MinHash signature (NUM_PERM values) of a non-empty set of shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+              for s in shingle_set]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+def band_keys(signature):
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        keys.append(f"{band}:" + hashlib.blake2b(repr(rows).encode('ascii'), digest_size=8).hexdigest())
+    return keys
+
+def slide_ref(filename, slide_number):
+    return f"{filename}#{slide_number}"
+
+def parse_ref(ref):
+    filename, number = ref.rsplit('#', 1)
+    return filename, int(number)
+
+def _file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+class SlideDedupIndex:
+    def __init__(self, folder=UPLOAD_FOLDER, path=SLIDE_DEDUP_PATH):
+        self.folder = folder
+        self.path = path
+        self.documents = {}  # filename -> {"version", "slides": {slide_number: signature}}
+        self.buckets = {}    # band key -> [slide refs]
+        self.links = {}      # slide ref -> [refs of its near-duplicates]
+        self._lock = threading.RLock()
+        self._last_refresh = 0
+        self._loaded = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("num_perm") != NUM_PERM or data.get("threshold") != DUPLICATE_THRESHOLD:
+                raise ValueError("built with other parameters")
+            self.documents = data["documents"]
+            self.buckets = data["buckets"]
+            self.links = data["links"]
+        except (OSError, ValueError, KeyError):
+            self.documents, self.buckets, self.links = {}, {}, {}
+        self._loaded = True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "num_perm": NUM_PERM,
+                "threshold": DUPLICATE_THRESHOLD,
+                "documents": self.documents,
+                "buckets": self.buckets,
+                "links": self.links
+            }, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def _remove(self, filename):
+        doc = self.documents.pop(filename, None)
+        if not doc:
+            return
+        for number, signature in doc["slides"].items():
+            ref = slide_ref(filename, number)
+            for key in band_keys(signature):
+                members = self.buckets.get(key)
+                if members and ref in members:
+                    members.remove(ref)
+                    if not members:
+                        del self.buckets[key]
+            for other in self.links.pop(ref, []):
+                others = self.links.get(other)
+                if others and ref in others:
+                    others.remove(ref)
+                    if not others:
+                        del self.links[other]
+
+    def _signature(self, ref):
+        filename, number = parse_ref(ref)
+        return self.documents[filename]["slides"][str(number)]
+
+    def _add(self, filename, version, slides):
+        doc = {"version": version, "slides": {}}
+        self.documents[filename] = doc
+        for slide in slides:
+            shingle_set = shingles(slide.get("text", ""))
+            if not shingle_set:
+                continue  # empty slides are not duplicates of anything
+            number = str(slide["slide_number"])
+            ref = slide_ref(filename, number)
+            signature = minhash(shingle_set)
+            doc["slides"][number] = signature
+
+            keys = band_keys(signature)
+            candidates = set()
+            for key in keys:
+                candidates.update(self.buckets.get(key, ()))
+            for other in candidates:
+                if other != ref and similarity(signature, self._signature(other)) >= DUPLICATE_THRESHOLD:
+                    self.links.setdefault(ref, []).append(other)
+                    self.links.setdefault(other, []).append(ref)
+            for key in keys:
+                self.buckets.setdefault(key, []).append(ref)
+
+    def update_presentation(self, filename):
+        """(Re)index one presentation from its _slides.json, or drop it if the file is gone."""
+        path = os.path.join(self.folder, f'{filename}_slides.json')
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._remove(filename)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._add(filename, _file_version(path), json.load(f).get("slides", []))
+            self._save()
+
+    def refresh(self, force=False):
+        """Pick up new, changed and deleted presentations; returns the number of decks reindexed."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if not force and time.time() - self._last_refresh < DEDUP_REFRESH_INTERVAL:
+                return 0
+            self._last_refresh = time.time()
+
+            current = {}
+            for name in os.listdir(self.folder):
+                if name.endswith('_slides.json'):
+                    current[name[:-len('_slides.json')]] = _file_version(os.path.join(self.folder, name))
+
+            changed = [f for f, version in current.items()
+                       if self.documents.get(f, {}).get("version") != version]
+            removed = [f for f in self.documents if f not in current]
+
+            for filename in removed:
+                self._remove(filename)
+            for filename in sorted(changed):
+                self._remove(filename)
+                try:
+                    with open(os.path.join(self.folder, f'{filename}_slides.json'), 'r', encoding='utf-8') as f:
+                        self._add(filename, current[filename], json.load(f).get("slides", []))
+                except (OSError, ValueError) as e:
+                    print(f"Could not index {filename} for duplicates: {e}")
+
+            if changed or removed:
+                self._save()
+                print(f"Slide dedup index: reindexed {len(changed)} presentations, removed {len(removed)}")
+            return len(changed)
+
+    def _cluster(self, ref):
+        """Every slide linked to ref directly or through other duplicates, sorted canonical first."""
+        seen = {ref}
+        stack = [ref]
+        while stack:
+            for other in self.links.get(stack.pop(), ()):
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return sorted(seen, key=parse_ref)
+
+    def cluster(self, filename, slide_number):
+        """(filename, slide_number) of the slide and all its near-duplicates, canonical first."""
+        self.refresh()
+        with self._lock:
+            return [parse_ref(ref) for ref in self._cluster(slide_ref(filename, slide_number))]
+
+    def canonical(self, filename, slide_number):
+        """(filename, slide_number) of the canonical slide for this one (itself when it has no duplicates)."""
+        return self.cluster(filename, slide_number)[0]
+
+    def version(self, filename):
+        with self._lock:
+            return self.documents.get(filename, {}).get("version")
+
+    def repeated_slides(self, filename):
+        """{slide_number: earlier slide_number} for slides that repeat an earlier slide of the same deck."""
+        self.refresh()
+        repeats = {}
+        with self._lock:
+            for number in sorted(self.documents.get(filename, {}).get("slides", {}), key=int):
+                ref = slide_ref(filename, number)
+                if ref not in self.links:
+                    continue
+                same_deck = [parse_ref(r)[1] for r in self._cluster(ref) if parse_ref(r)[0] == filename]
+                if same_deck[0] != int(number):
+                    repeats[int(number)] = same_deck[0]
+        return repeats
+
+    def collapse(self, hits):
+        """
+        Keep the best hit of every duplicate cluster (hits are ranked best first); each kept hit
+        gets "duplicates": the other slides of its cluster, whether they were hits or not.
+        """
+        self.refresh()
+        kept = []
+        seen = set()
+        with self._lock:
+            for hit in hits:
+                cluster = self._cluster(slide_ref(hit["filename"], hit["slide_number"]))
+                if cluster[0] in seen:
+                    continue
+                seen.add(cluster[0])
+                hit = dict(hit)
+                hit["duplicates"] = [
+                    {"filename": f, "slide_number": n}
+                    for f, n in map(parse_ref, cluster)
+                    if (f, n) != (hit["filename"], int(hit["slide_number"]))
+                ]
+                kept.append(hit)
+        return kept
+
+    def _clusters(self, filename=None):
+        result = []
+        done = set()
+        for ref in sorted(self.links, key=parse_ref):
+            if ref in done:
+                continue
+            cluster = self._cluster(ref)
+            done.update(cluster)
+            if filename and not any(parse_ref(r)[0] == filename for r in cluster):
+                continue
+            canonical, *duplicates = map(parse_ref, cluster)
+            result.append({
+                "canonical": {"filename": canonical[0], "slide_number": canonical[1]},
+                "duplicates": [{"filename": f, "slide_number": n} for f, n in duplicates]
+            })
+        return result
+
+    def clusters(self, filename=None):
+        """All clusters of two or more slides (optionally only those touching one presentation)."""
+        self.refresh()
+        with self._lock:
+            return self._clusters(filename)
+
+    def stats(self):
+        with self._lock:
+            clusters = self._clusters()
+            return {
+                "presentations": len(self.documents),
+                "slides": sum(len(doc["slides"]) for doc in self.documents.values()),
+                "duplicate_clusters": len(clusters),
+                "redundant_slides": sum(len(c["duplicates"]) for c in clusters),
+                "lsh_buckets": len(self.buckets)
+            }
+
+slide_dedup = SlideDedupIndex()
@@ -0,0 +1,284 @@
+"""
+Hashed term-frequency vectors of every slide in the library, for "related slides" and for
+picking extra context when a question is about one slide.
+
+Each presentation's slides are turned into a matrix (one row per slide) at ingest: the library
+index's terms are hashed into VECTOR_DIM signed buckets with sublinear term frequency. Rows are
+mostly zeros, so the matrices are stored compressed (float16 per presentation).
+The per-presentation matrices are stacked into a library matrix, IDF-weighted and normalised,
+and the top RELATED_TOP_K neighbours of every slide are computed with blocked matrix products.
+Looking up related slides afterwards is a dictionary access.
+
+Like the other library indexes, everything is persisted under slides/.cache and kept current
+incrementally from the *_slides.json files: only changed presentations are re-tokenized.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+
+from lazy_import import lazy_module
+from library_index import index_terms
+
+np = lazy_module('numpy')
+
+UPLOAD_FOLDER = 'slides'
+VECTORS_FOLDER = os.getenv('VECTORS_FOLDER', os.path.join('slides', '.cache', 'vectors'))
+
+# Directory rescans for changed decks happen at most this often (seconds)
+VECTORS_REFRESH_INTERVAL = float(os.getenv('VECTORS_REFRESH_INTERVAL', '5'))
+
+VECTOR_DIM = 2048
+RELATED_TOP_K = int(os.getenv('RELATED_TOP_K', '10'))
+
+# Neighbours below this cosine similarity are unrelated; above the maximum they are copies of
+# the slide (reported as duplicates by slide_dedup, not as related slides)
+RELATED_MIN_SIMILARITY = float(os.getenv('RELATED_MIN_SIMILARITY', '0.1'))
+RELATED_MAX_SIMILARITY = 0.98
+
+# Rows per matrix product when computing neighbours (bounds the similarity block in memory)
+NEIGHBOUR_BLOCK_ROWS = 512
+
+def term_bucket(term):
+    """Bucket index and sign of a term (the sign halves the bias of hash collisions)."""
+    h = zlib.crc32(term.encode('utf-8'))
+    return h % VECTOR_DIM, 1.0 if h & 0x80000000 else -1.0
+
+def vectorize(slides):
+    """float32 matrix with one hashed, sublinear term-frequency row per slide."""
+    matrix = np.zeros((len(slides), VECTOR_DIM), dtype=np.float32)
+    for row, slide in enumerate(slides):
+        counts = {}
+        for term in index_terms(slide.get("text", "")):
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            bucket, sign = term_bucket(term)
+            matrix[row, bucket] += sign * (1.0 + np.log(tf))
+    return matrix
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+class SlideVectors:
+    def __init__(self, folder=UPLOAD_FOLDER, path=VECTORS_FOLDER):
+        self.folder = folder
+        self.path = path
+        self.documents = {}  # filename -> {"version", "slides": [slide numbers], "titles": [...]}
+        self.matrix = None   # IDF-weighted, normalised library matrix
+        self.neighbours = None
+        self.scores = None
+        self._rows = {}      # (filename, slide_number) -> library row
+        self._offsets = {}   # filename -> (first row, row count)
+        self._refs = []      # library row -> (filename, slide_number)
+        self._lock = threading.RLock()
+        self._last_refresh = 0
+        self._loaded = False
+        self.build_seconds = None
+
+    def _deck_path(self, filename):
+        return os.path.join(self.path, 'decks', f'{filename}.npz')
+
+    def _manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def _library_path(self):
+        return os.path.join(self.path, 'library.npz')
+
+    def _index_rows(self):
+        self._rows, self._offsets, self._refs = {}, {}, []
+        for filename in sorted(self.documents):
+            numbers = self.documents[filename]["slides"]
+            self._offsets[filename] = (len(self._refs), len(numbers))
+            for number in numbers:
+                self._rows[(filename, number)] = len(self._refs)
+                self._refs.append((filename, number))
+
+    def _load(self):
+        """Load the persisted library; returns False when there is none (or it is unreadable)."""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("dim") != VECTOR_DIM or manifest.get("top_k") != RELATED_TOP_K:
+                raise ValueError("built with other parameters")
+            with np.load(self._library_path()) as library:
+                matrix, neighbours, scores = library["matrix"], library["neighbours"], library["scores"]
+            documents = manifest["documents"]
+        except (OSError, ValueError, KeyError):
+            self._loaded = True
+            return False
+        self.documents, self.matrix, self.neighbours, self.scores = documents, matrix, neighbours, scores
+        self._index_rows()
+        self._loaded = True
+        return True
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self._library_path()}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, matrix=self.matrix, neighbours=self.neighbours, scores=self.scores)
+        os.replace(tmp_path, self._library_path())
+        # The manifest goes last: a reader that sees it also finds the matching library
+        tmp_path = f"{self._manifest_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"dim": VECTOR_DIM, "top_k": RELATED_TOP_K, "documents": self.documents},
+                      f, separators=(',', ':'))
+        os.replace(tmp_path, self._manifest_path())
+
+    def _vectorize_deck(self, filename, version):
+        """Vectorize one presentation from its _slides.json and store its matrix."""
+        with open(os.path.join(self.folder, f'{filename}_slides.json'), 'r', encoding='utf-8') as f:
+            slides = json.load(f).get("slides", [])
+        os.makedirs(os.path.join(self.path, 'decks'), exist_ok=True)
+        tmp_path = f"{self._deck_path(filename)}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, tf=vectorize(slides).astype(np.float16))
+        os.replace(tmp_path, self._deck_path(filename))
+        self.documents[filename] = {
+            "version": version,
+            "slides": [int(slide["slide_number"]) for slide in slides],
+            "titles": [slide.get("title", "") for slide in slides]
+        }
+
+    def _rebuild(self):
+        """Stack the presentation matrices, weight them and compute every slide's neighbours."""
+        started = time.perf_counter()
+        self._index_rows()
+        parts = []
+        for filename in sorted(self.documents):
+            with np.load(self._deck_path(filename)) as deck:
+                parts.append(deck["tf"].astype(np.float32))
+        raw = np.vstack(parts) if parts else np.zeros((0, VECTOR_DIM), dtype=np.float32)
+
+        df = np.count_nonzero(raw, axis=0)
+        idf = (np.log((len(raw) + 1) / (df + 1)) + 1).astype(np.float32)
+        matrix = _normalize(raw * idf).astype(np.float32)
+
+        k = min(RELATED_TOP_K, max(0, len(matrix) - 1))
+        neighbours = np.zeros((len(matrix), k), dtype=np.int32)
+        scores = np.zeros((len(matrix), k), dtype=np.float32)
+        if k:
+            for start in range(0, len(matrix), NEIGHBOUR_BLOCK_ROWS):
+                block = matrix[start:start + NEIGHBOUR_BLOCK_ROWS] @ matrix.T
+                rows = np.arange(len(block))
+                block[rows, start + rows] = -1.0  # a slide is not related to itself
+                block[block >= RELATED_MAX_SIMILARITY] = -1.0
+                top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(block, top, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                neighbours[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+                scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+
+        self.matrix, self.neighbours, self.scores = matrix, neighbours, scores
+        self._save()
+        self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def _current_versions(self):
+        current = {}
+        for name in os.listdir(self.folder):
+            if name.endswith('_slides.json'):
+                current[name[:-len('_slides.json')]] = _file_version(os.path.join(self.folder, name))
+        return current
+
+    def _stale(self, current):
+        return (set(current) != set(self.documents)
+                or any(self.documents[f]["version"] != version for f, version in current.items()))
+
+    def update_presentation(self, filename):
+        """(Re)vectorize one presentation, or drop it if its _slides.json is gone."""
+        path = os.path.join(self.folder, f'{filename}_slides.json')
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if os.path.exists(path):
+                self._vectorize_deck(filename, _file_version(path))
+            else:
+                self.documents.pop(filename, None)
+            self._rebuild()
+
+    def refresh(self, force=False):
+        """Pick up new, changed and deleted presentations; returns the number of decks revectorized."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if not force and time.time() - self._last_refresh < VECTORS_REFRESH_INTERVAL:
+                return 0
+            self._last_refresh = time.time()
+
+            current = self._current_versions()
+            if not self._stale(current):
+                return 0
+            # Another worker process may already have rebuilt the library
+            if self._load() and not self._stale(current):
+                return 0
+
+            changed = [f for f, version in current.items()
+                       if self.documents.get(f, {}).get("version") != version
+                       or not os.path.exists(self._deck_path(f))]
+            for filename in [f for f in self.documents if f not in current]:
+                del self.documents[filename]
+            for filename in changed:
+                try:
+                    self._vectorize_deck(filename, current[filename])
+                except (OSError, ValueError, KeyError) as e:
+                    self.documents.pop(filename, None)
+                    print(f"Could not vectorize {filename}: {e}")
+            self._rebuild()
+            print(f"Slide vectors: revectorized {len(changed)} presentations in {self.build_seconds}s")
+            return len(changed)
+
+    def _hit(self, row, score):
+        filename, number = self._refs[row]
+        index = row - self._offsets[filename][0]
+        return {
+            "filename": filename,
+            "slide_number": number,
+            "title": self.documents[filename]["titles"][index],
+            "score": round(float(score), 3)
+        }
+
+    def related(self, filename, slide_number, limit=5):
+        """Slides of the whole library most similar to this one, best first (precomputed)."""
+        self.refresh()
+        with self._lock:
+            row = self._rows.get((filename, int(slide_number)))
+            if row is None:
+                return []
+            hits = []
+            for other, score in zip(self.neighbours[row], self.scores[row]):
+                if len(hits) >= limit or score < RELATED_MIN_SIMILARITY:
+                    break
+                hits.append(self._hit(other, score))
+            return hits
+
+    def context_slides(self, filename, slide_number, limit=2):
+        """Slide numbers of the same presentation most similar to this one, best first."""
+        self.refresh()
+        with self._lock:
+            row = self._rows.get((filename, int(slide_number)))
+            if row is None or not limit:
+                return []
+            first, count = self._offsets[filename]
+            scores = self.matrix[first:first + count] @ self.matrix[row]
+            scores[row - first] = -1.0
+            picks = []
+            for index in np.argsort(-scores)[:limit]:
+                if RELATED_MIN_SIMILARITY <= scores[index] < RELATED_MAX_SIMILARITY:
+                    picks.append(self._refs[first + index][1])
+            return picks
+
+    def stats(self):
+        with self._lock:
+            return {
+                "presentations": len(self.documents),
+                "slides": len(self._refs),
+                "dim": VECTOR_DIM,
+                "top_k": RELATED_TOP_K,
+                "build_seconds": self.build_seconds
+            }
+
+slide_vectors = SlideVectors()
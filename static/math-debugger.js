@@ -14,20 +14,16 @@ function debugMathDetection(filename) {
     // Show the debug container
     debugContainer.style.display = 'block';
     
-    // Call the backend to analyze math content
-    fetch(`/analyze-math/${filename}`)
+    // The summary comes first (the server analyzes the PDF once); page details stream in after it
+    const url = `/analyze-math/${encodeURIComponent(filename)}`;
+    fetch(`${url}?summary=1`)
         .then(response => response.json())
-        .then(data => {
-            if (data.error) {
-                debugContainer.innerHTML = `
-                    <h3>Math Content Detection Analysis</h3>
-                    <p class="error">Error: ${data.error}</p>
-                `;
-                return;
+        .then(summary => {
+            if (summary.error) {
+                throw new Error(summary.error);
             }
-            
-            // Display the results
-            displayMathAnalysisResults(data, debugContainer);
+            displayMathAnalysisSummary(summary, debugContainer);
+            return streamMathAnalysisPages(url, debugContainer.querySelector('.page-analysis-list'));
         })
         .catch(error => {
             debugContainer.innerHTML = `
@@ -37,6 +33,44 @@ function debugMathDetection(filename) {
         });
 }
 
+async function streamMathAnalysisPages(url, list) {
+    // NDJSON: a summary line, then one line per page, rendered as they arrive
+    const response = await fetch(`${url}?format=ndjson`);
+    if (!response.ok) {
+        throw new Error(`Analysis failed (${response.status})`);
+    }
+    let buffer = '';
+    let headerSeen = false;
+    const renderLines = (lines) => {
+        let html = '';
+        lines.forEach(line => {
+            if (!line.trim()) return;
+            if (!headerSeen) {
+                headerSeen = true;
+                return;
+            }
+            html += pageAnalysisHTML(JSON.parse(line));
+        });
+        list.insertAdjacentHTML('beforeend', html);
+    };
+
+    if (!response.body) {
+        renderLines((await response.text()).split('\n'));
+        return;
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        renderLines(lines);
+    }
+    renderLines([buffer + decoder.decode()]);
+}
+
 function createDebugContainer() {
     // Create a container for the debug information
     const container = document.createElement('div');
@@ -168,62 +202,60 @@ function addDebugStyles() {
     }
 }
 
-function displayMathAnalysisResults(data, container) {
-    const totalPages = data.total_pages;
-    const mathPages = data.analysis.filter(page => page.likely_has_math).length;
+function escapeDebugText(text) {
+    const div = document.createElement('div');
+    div.textContent = text || '';
+    return div.innerHTML;
+}
+
+function displayMathAnalysisSummary(summary, container) {
+    const totalPages = summary.total_pages;
+    const mathPages = summary.math_page_count;
+    const filename = escapeDebugText(summary.filename).replace(/'/g, "\\'");
     
-    let html = `
+    container.innerHTML = `
         <h3>Math Content Detection Analysis</h3>
         <div class="math-analysis-summary">
-            <p><strong>Filename:</strong> ${data.filename}</p>
+            <p><strong>Filename:</strong> ${escapeDebugText(summary.filename)}</p>
             <p><strong>Total Pages:</strong> ${totalPages}</p>
-            <p><strong>Pages with Math Content:</strong> ${mathPages} (${Math.round(mathPages/totalPages*100)}%)</p>
-            <button class="refresh-btn" onclick="debugMathDetection('${data.filename}')">Refresh Analysis</button>
+            <p><strong>Pages with Math Content:</strong> ${mathPages} (${totalPages ? Math.round(mathPages/totalPages*100) : 0}%)</p>
+            <p><strong>Math Pages:</strong> ${summary.math_pages.join(', ') || 'none'}</p>
+            <button class="refresh-btn" onclick="debugMathDetection('${filename}')">Refresh Analysis</button>
         </div>
         <h4>Page Details:</h4>
+        <div class="page-analysis-list"></div>
     `;
-    
-    // Add page-by-page analysis
-    data.analysis.forEach(page => {
-        const hasMath = page.likely_has_math;
-        
-        html += `
-            <div class="page-analysis ${hasMath ? 'has-math' : 'no-math'}">
-                <h4>Page ${page.page_number}</h4>
-                <p><strong>First lines:</strong> ${page.first_lines}</p>
-                <div class="math-indicators">
-                    <span class="indicator ${page.math_detected ? 'positive' : 'negative'}">
-                        Algorithm Detection: ${page.math_detected ? 'YES' : 'NO'}
-                    </span>
-                    <span class="indicator ${page.symbol_count > 3 ? 'positive' : 'negative'}">
-                        Math Symbols: ${page.symbol_count}
-                    </span>
-                    <span class="indicator ${page.greek_letter_count > 0 ? 'positive' : 'negative'}">
-                        Greek Letters: ${page.greek_letter_count}
-                    </span>
-                    <span class="indicator ${page.equation_count > 0 ? 'positive' : 'negative'}">
-                        Equations: ${page.equation_count}
-                    </span>
-                    <span class="indicator ${page.block_math_count > 0 ? 'positive' : 'negative'}">
-                        Block Math: ${page.block_math_count}
-                    </span>
-                    <span class="indicator ${page.is_title_page ? 'negative' : ''}">
-                        Title Page: ${page.is_title_page ? 'YES' : 'NO'}
-                    </span>
-                </div>
-                <p><strong>Conclusion:</strong> ${hasMath ? 'Contains mathematical content' : 'No mathematical content detected'}</p>
+}
+
+function pageAnalysisHTML(page) {
+    const hasMath = page.likely_has_math;
+    return `
+        <div class="page-analysis ${hasMath ? 'has-math' : 'no-math'}">
+            <h4>Page ${page.page_number}</h4>
+            <p><strong>First lines:</strong> ${escapeDebugText(page.first_lines)}</p>
+            <div class="math-indicators">
+                <span class="indicator ${page.math_detected ? 'positive' : 'negative'}">
+                    Algorithm Detection: ${page.math_detected ? 'YES' : 'NO'}
+                </span>
+                <span class="indicator ${page.symbol_count > 3 ? 'positive' : 'negative'}">
+                    Math Symbols: ${page.symbol_count}
+                </span>
+                <span class="indicator ${page.greek_letter_count > 0 ? 'positive' : 'negative'}">
+                    Greek Letters: ${page.greek_letter_count}
+                </span>
+                <span class="indicator ${page.equation_count > 0 ? 'positive' : 'negative'}">
+                    Equations: ${page.equation_count}
+                </span>
+                <span class="indicator ${page.block_math_count > 0 ? 'positive' : 'negative'}">
+                    Block Math: ${page.block_math_count}
+                </span>
+                <span class="indicator ${page.is_title_page ? 'negative' : ''}">
+                    Title Page: ${page.is_title_page ? 'YES' : 'NO'}
+                </span>
             </div>
-        `;
-    });
-    
-    // Add navigation and additional tools
-    html += `
-        <div class="debug-tools">
-            <button class="refresh-btn" onclick="debugMathDetection('${data.filename}')">Refresh Analysis</button>
+            <p><strong>Conclusion:</strong> ${hasMath ? 'Contains mathematical content' : 'No mathematical content detected'}</p>
         </div>
     `;
-    
-    container.innerHTML = html;
 }
 
 // Add a function to easily add the debug button to the UI
@@ -17,6 +17,9 @@ class PDFViewer {
     this.currentFilePath = null;
     this.currentRenderTask = null;
     this.isLoading = false;  // Add loading state tracking
+    this.previewInfo = null;  // Server-side preview layout (see /preview/<file>/info)
+    this.previewBase = null;
+    this.renderToken = 0;
     
     // Add the canvas to the container
     this.container.appendChild(this.canvas);
@@ -98,6 +101,8 @@ class PDFViewer {
       
       // Clear any previous renders
       this.cancelCurrentRender();
+      this.pdfDoc = null;
+      this.previewInfo = null;
       
       // Loading message
       this.container.innerHTML = '<div class="loading-pdf">Loading PDF...</div>';
@@ -110,23 +115,10 @@ class PDFViewer {
       // Recreate controls
       this.createControls();
       
-      // Load the PDF document
-      this.log("Starting PDF loading task");
-      const loadingTask = pdfjsLib.getDocument(url);
-      
-      // Add a progress callback
-      loadingTask.onProgress = (progressData) => {
-        if (progressData.total > 0 && this.isLoading) {
-          const percent = (progressData.loaded / progressData.total * 100).toFixed(0);
-          const loadingDiv = this.container.querySelector('.loading-pdf');
-          if (loadingDiv) {
-            loadingDiv.textContent = `Loading PDF... ${percent}%`;
-          }
-        }
-      };
-      
-      this.pdfDoc = await loadingTask.promise;
-      this.log(`PDF loaded successfully. Total pages: ${this.pdfDoc.numPages}`);
+      // Prefer server-rendered tiles: page 1 appears without downloading the whole PDF
+      if (!(await this.loadPreviewInfo(url))) {
+        await this.loadPdfJsDocument(url);
+      }
       
       // Clear the loading message
       this.clearLoadingIndicator();
@@ -135,7 +127,7 @@ class PDFViewer {
       this.pageNum = 1;
       
       // Update page info
-      this.pageInfo.textContent = `Page: ${this.pageNum} / ${this.pdfDoc.numPages}`;
+      this.pageInfo.textContent = `Page: ${this.pageNum} / ${this.getTotalPages()}`;
       
       // Render the first page
       await this.renderPage(this.pageNum);
@@ -148,9 +140,130 @@ class PDFViewer {
       this.container.innerHTML = `<div class="pdf-error">Error loading PDF: ${error.message}</div>`;
       return false;
     }
-  } 
+  }
+  
+  async loadPreviewInfo(url) {
+    const match = url.match(/^\/original-file\/(.+)$/);
+    if (!match) return false;
+    
+    const base = `/preview/${match[1]}`;
+    try {
+      const res = await fetch(`${base}/info`);
+      if (!res.ok) return false;
+      this.previewInfo = await res.json();
+      this.previewBase = base;
+      this.log(`Using server previews. Total pages: ${this.previewInfo.page_count}`);
+      this.createThumbnailStrip();
+      return true;
+    } catch (error) {
+      this.log('Preview info unavailable, falling back to PDF.js', error);
+      return false;
+    }
+  }
+  
+  async loadPdfJsDocument(url) {
+    // Let PDF.js fetch byte ranges on demand instead of the whole file up front
+    this.log("Starting PDF loading task");
+    const loadingTask = pdfjsLib.getDocument({ url: url, disableAutoFetch: true, rangeChunkSize: 262144 });
+    
+    // Add a progress callback
+    loadingTask.onProgress = (progressData) => {
+      if (progressData.total > 0 && this.isLoading) {
+        const percent = (progressData.loaded / progressData.total * 100).toFixed(0);
+        const loadingDiv = this.container.querySelector('.loading-pdf');
+        if (loadingDiv) {
+          loadingDiv.textContent = `Loading PDF... ${percent}%`;
+        }
+      }
+    };
+    
+    this.pdfDoc = await loadingTask.promise;
+    this.log(`PDF loaded successfully. Total pages: ${this.pdfDoc.numPages}`);
+    return this.pdfDoc;
+  }
+  
+  createThumbnailStrip() {
+    const layout = this.previewInfo.thumbnail;
+    const strip = document.createElement('div');
+    strip.className = 'pdf-thumbnails';
+    
+    for (let page = 1; page <= this.previewInfo.page_count; page++) {
+      const index = page - 1;
+      const sheet = Math.floor(index / layout.pages_per_sheet);
+      const cell = index % layout.pages_per_sheet;
+      const x = (cell % layout.columns) * layout.width;
+      const y = Math.floor(cell / layout.columns) * layout.height;
+      
+      const thumb = document.createElement('div');
+      thumb.className = 'pdf-thumb';
+      thumb.title = `Page ${page}`;
+      thumb.style.width = `${layout.width}px`;
+      thumb.style.height = `${layout.height}px`;
+      thumb.style.backgroundImage = `url("${this.previewBase}/sprite/${sheet}")`;
+      thumb.style.backgroundPosition = `-${x}px -${y}px`;
+      thumb.onclick = () => this.goToPage(page);
+      strip.appendChild(thumb);
+    }
+    
+    this.thumbnailStrip = strip;
+    this.container.insertBefore(strip, this.canvas);
+  }
+  
+  highlightThumbnail(num) {
+    if (!this.thumbnailStrip) return;
+    const thumbs = this.thumbnailStrip.children;
+    for (let i = 0; i < thumbs.length; i++) {
+      thumbs[i].classList.toggle('active', i === num - 1);
+    }
+    const active = thumbs[num - 1];
+    if (active) active.scrollIntoView({ block: 'nearest', inline: 'center' });
+  }
+  
+  tileUrl(num, scale, col, row) {
+    return `${this.previewBase}/${num}/tile?scale=${scale}&col=${col}&row=${row}`;
+  }
+  
+  async renderTiles(num) {
+    const token = ++this.renderToken;
+    const [pageWidth, pageHeight] = this.previewInfo.pages[num - 1];
+    const scale = this.previewInfo.scales.reduce((best, s) =>
+      Math.abs(s - this.scale) < Math.abs(best - this.scale) ? s : best);
+    const tileSize = this.previewInfo.tile_size;
+    const width = Math.ceil(pageWidth * scale);
+    const height = Math.ceil(pageHeight * scale);
+    
+    this.canvas.width = width;
+    this.canvas.height = height;
+    this.ctx.fillStyle = '#ffffff';
+    this.ctx.fillRect(0, 0, width, height);
+    
+    const loads = [];
+    for (let row = 0; row * tileSize < height; row++) {
+      for (let col = 0; col * tileSize < width; col++) {
+        loads.push(new Promise((resolve, reject) => {
+          const img = new Image();
+          img.onload = () => {
+            // Drop tiles of a page we have already navigated away from
+            if (token === this.renderToken) {
+              this.ctx.drawImage(img, col * tileSize, row * tileSize);
+            }
+            resolve();
+          };
+          img.onerror = () => reject(new Error(`Tile ${col},${row} of page ${num} failed to load`));
+          img.src = this.tileUrl(num, scale, col, row);
+        }));
+      }
+    }
+    await Promise.all(loads);
+    
+    // Warm the browser cache with the first tile of the next page
+    if (token === this.renderToken && num < this.previewInfo.page_count) {
+      new Image().src = this.tileUrl(num + 1, scale, 0, 0);
+    }
+  }
   
   cancelCurrentRender() {
+    this.renderToken++;
     if (this.currentRenderTask) {
       this.log("Cancelling current render task");
       try {
@@ -164,7 +277,7 @@ class PDFViewer {
   }
 
   async renderPage(num) {
-    if (!this.pdfDoc) {
+    if (!this.pdfDoc && !this.previewInfo) {
       this.log("Cannot render page - no PDF document loaded");
       return;
     }
@@ -178,33 +291,39 @@ class PDFViewer {
       
       this.log(`Rendering page ${num}`);
       
-      // Fetch the page
-      const page = await this.pdfDoc.getPage(num);
-      this.log(`Page ${num} fetched successfully`);
+      if (this.previewInfo) {
+        await this.renderTiles(num);
+        this.log(`Page ${num} rendered from tiles`);
+      } else {
+        // Fetch the page
+        const page = await this.pdfDoc.getPage(num);
+        this.log(`Page ${num} fetched successfully`);
       
-      // Prepare canvas using PDF page dimensions
-      const viewport = page.getViewport({ scale: this.scale });
-      this.canvas.height = viewport.height;
-      this.canvas.width = viewport.width;
+        // Prepare canvas using PDF page dimensions
+        const viewport = page.getViewport({ scale: this.scale });
+        this.canvas.height = viewport.height;
+        this.canvas.width = viewport.width;
       
-      // Render PDF page into canvas context
-      const renderContext = {
-        canvasContext: this.ctx,
-        viewport: viewport
-      };
+        // Render PDF page into canvas context
+        const renderContext = {
+          canvasContext: this.ctx,
+          viewport: viewport
+        };
       
-      this.log("Starting render task");
-      const renderTask = page.render(renderContext);
-      this.currentRenderTask = renderTask;
+        this.log("Starting render task");
+        const renderTask = page.render(renderContext);
+        this.currentRenderTask = renderTask;
       
-      await renderTask.promise;
-      this.log(`Page ${num} rendered successfully`);
+        await renderTask.promise;
+        this.log(`Page ${num} rendered successfully`);
+      }
       
       this.currentRenderTask = null;
       this.pageRendering = false;
       
       // Update page counter
-      this.pageInfo.textContent = `Page: ${this.pageNum} / ${this.pdfDoc.numPages}`;
+      this.pageInfo.textContent = `Page: ${this.pageNum} / ${this.getTotalPages()}`;
+      this.highlightThumbnail(this.pageNum);
       
       // Process pending page if any
       if (this.pageNumPending !== null) {
@@ -245,14 +364,14 @@ class PDFViewer {
   }
   
   onPrevPage() {
-    if (!this.pdfDoc || this.pageNum <= 1) return;
+    if (!this.getTotalPages() || this.pageNum <= 1) return;
     this.pageNum--;
     this.log(`Navigating to previous page: ${this.pageNum}`);
     this.queueRenderPage(this.pageNum);
   }
   
   onNextPage() {
-    if (!this.pdfDoc || this.pageNum >= this.pdfDoc.numPages) return;
+    if (!this.getTotalPages() || this.pageNum >= this.getTotalPages()) return;
     this.pageNum++;
     this.log(`Navigating to next page: ${this.pageNum}`);
     this.queueRenderPage(this.pageNum);
@@ -273,14 +392,17 @@ class PDFViewer {
   }
   
   getTotalPages() {
+    if (this.previewInfo) return this.previewInfo.page_count;
     return this.pdfDoc ? this.pdfDoc.numPages : 0;
   }
   
   // Add a method to get page text content (for AI processing)
   async getPageTextContent(pageNum) {
-    if (!this.pdfDoc) return null;
+    if (!this.pdfDoc && !this.currentFilePath) return null;
     
     try {
+      // In tile mode the PDF itself is only opened (by range requests) when text is needed
+      if (!this.pdfDoc) await this.loadPdfJsDocument(this.currentFilePath);
       const page = await this.pdfDoc.getPage(pageNum);
       const textContent = await page.getTextContent();
       
@@ -295,9 +417,9 @@ class PDFViewer {
   
   // Method to jump to a specific page
   goToPage(pageNum) {
-    if (!this.pdfDoc) return;
+    if (!this.getTotalPages()) return;
     
-    const targetPage = Math.max(1, Math.min(pageNum, this.pdfDoc.numPages));
+    const targetPage = Math.max(1, Math.min(pageNum, this.getTotalPages()));
     if (targetPage !== this.pageNum) {
       this.log(`Jumping to page ${targetPage}`);
       this.pageNum = targetPage;
@@ -0,0 +1,177 @@
+"""
+Storage for uploaded presentations.
+
+An upload is streamed to original_files/ exactly once while its sha256 is computed. The copy
+kept in slides/ for backward compatibility is a hardlink to the same bytes (a plain copy
+only where the filesystem cannot link). Uploads are recorded by content hash in the shared
+cache, so uploading identical bytes again links to the stored file and reuses the existing
+extraction instead of extracting the document a second time.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from output_writer import presentation_lock, write_json
+from shared_cache import shared_cache
+
+UPLOAD_FOLDER = 'slides'
+ORIGINAL_FILES_FOLDER = 'original_files'
+
+CHUNK_SIZE = 1024 * 1024
+
+# Extraction outputs that can be reused for an identical upload
+EXTRACTION_SUFFIXES = ('_slides.json', '_enhanced.json')
+
+# Everything written to the slides folder for a presentation
+OUTPUT_SUFFIXES = EXTRACTION_SUFFIXES + ('_summaries.json',)
+
+def file_version(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def write_stream(stream, path, chunk_size=CHUNK_SIZE):
+    """Copy a file-like object to path in fixed-size chunks; returns (sha256, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """sha256 of a file on disk, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(src, dst):
+    """Make dst refer to the bytes of src: a hardlink where possible, otherwise a copy."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return 'existing'
+    tmp_path = f"{dst}.{os.getpid()}.link"
+    try:
+        os.link(src, tmp_path)
+        method = 'hardlink'
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+        method = 'copy'
+    os.replace(tmp_path, dst)
+    return method
+
+def _lookup(digest):
+    """Upload record for a content hash, if the stored original is still unchanged."""
+    record = shared_cache.get("uploads", digest)
+    if not record:
+        return None
+    try:
+        if file_version(record["path"]) != record["version"]:
+            return None
+    except OSError:
+        return None
+    return record
+
+def store_upload(stream, filename, folder=ORIGINAL_FILES_FOLDER):
+    """
+    Stream an uploaded file into folder. Returns {"path", "sha256", "size", "duplicate_of"},
+    where duplicate_of is the stored file that already had the same content (or None).
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    tmp_path = f"{path}.{os.getpid()}.upload"
+    try:
+        digest, size = write_stream(stream, tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return commit_upload(tmp_path, filename, digest, size, folder)
+
+def commit_upload(tmp_path, filename, digest, size, folder=ORIGINAL_FILES_FOLDER):
+    """
+    Move a fully written upload into folder under filename, or link to an already stored
+    file with the same content. Returns the same dict as store_upload.
+    """
+    path = os.path.join(folder, filename)
+    existing = _lookup(digest)
+    if existing and os.path.exists(path) and os.path.samefile(existing["path"], path):
+        # Same bytes under the same name: keep the stored file (and its mtime) as it is
+        os.remove(tmp_path)
+    elif existing:
+        os.remove(tmp_path)
+        link_or_copy(existing["path"], path)
+    else:
+        os.replace(tmp_path, path)
+
+    shared_cache.set("uploads", digest, {
+        "path": path,
+        "version": file_version(path),
+        "basename": existing.get("basename") if existing else None
+    })
+    return {"path": path, "sha256": digest, "size": size, "duplicate_of": existing["path"] if existing else None}
+
+def register_original(path, digest):
+    """
+    Record a file that was placed in the originals folder directly rather than uploaded.
+    Returns the same dict as store_upload.
+    """
+    existing = _lookup(digest)
+    shared_cache.set("uploads", digest, {
+        "path": path,
+        "version": file_version(path),
+        "basename": existing.get("basename") if existing else None
+    })
+    duplicate_of = existing["path"] if existing and existing["path"] != path else None
+    return {"path": path, "sha256": digest, "size": os.path.getsize(path), "duplicate_of": duplicate_of}
+
+def reusable_extraction(digest):
+    """Basename of a presentation already extracted from these exact bytes, if its output still exists."""
+    record = _lookup(digest)
+    if not record or not record.get("basename"):
+        return None
+    if not os.path.exists(os.path.join(UPLOAD_FOLDER, f'{record["basename"]}_slides.json')):
+        return None
+    return record["basename"]
+
+def record_extraction(digest, basename):
+    """Remember that the upload with this hash has been extracted as basename."""
+    record = shared_cache.get("uploads", digest)
+    if record:
+        record["basename"] = basename
+        shared_cache.set("uploads", digest, record)
+
+def clone_extraction(source_basename, basename):
+    """Reuse the extraction of identical content stored under another name."""
+    if source_basename == basename:
+        return
+    for suffix in EXTRACTION_SUFFIXES:
+        source = os.path.join(UPLOAD_FOLDER, f'{source_basename}{suffix}')
+        if not os.path.exists(source):
+            continue
+        with presentation_lock(source_basename):
+            with open(source, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        data["filename"] = basename
+        write_json(os.path.join(UPLOAD_FOLDER, f'{basename}{suffix}'), data, basename)
+
+def remove_extraction(basename, filename):
+    """Delete the outputs of a presentation whose source file is gone; returns the removed paths."""
+    paths = [os.path.join(UPLOAD_FOLDER, f'{basename}{suffix}') for suffix in OUTPUT_SUFFIXES]
+    paths.append(os.path.join(UPLOAD_FOLDER, filename))  # the link kept in the slides folder
+    removed = []
+    with presentation_lock(basename, exclusive=True):
+        for path in paths:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+    return removed
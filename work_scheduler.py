@@ -0,0 +1,241 @@
+"""
+Central scheduler for CPU-heavy work, with priority classes:
+
+- interactive: work a user is waiting on (questions, searches, previews). It runs at once in
+  the calling thread; while any interactive request is in flight, background jobs get at most
+  BUSY_BACKGROUND_SLOTS of the pool
+- ingest: extraction of uploaded and reprocessed presentations (PDF/PPTX parsing, .ppt
+  conversion, page renders and the OCR they need)
+- ocr: OCR of images outside an ingestion job
+
+Background jobs (ingest, then ocr) wait in a priority queue and run in a process pool of
+BACKGROUND_WORKERS processes, one fewer than the cores, so a request thread always has a core
+and the GIL of the web worker is never held by extraction. Pool processes run with a raised
+nice value, so the kernel preempts a running extraction whenever a request needs the CPU.
+
+Inside a pool process there is no second pool: jobs submitted by a running job (the OCR of an
+ingestion) run inline, the pool size being the whole parallelism budget for background work.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import profiler
+
+# Set to 0 to run all work inline in the calling thread, as before the scheduler existed
+WORK_SCHEDULER = os.getenv('WORK_SCHEDULER', '1') != '0'
+
+# Priority classes, most urgent first
+PRIORITY_CLASSES = ('interactive', 'ingest', 'ocr')
+_PRIORITY = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', str(max(1, (os.cpu_count() or 2) - 1))))
+BACKGROUND_NICENESS = int(os.getenv('BACKGROUND_NICENESS', '10'))
+
+# Background jobs allowed to run while interactive requests are in flight
+BUSY_BACKGROUND_SLOTS = int(os.getenv('BUSY_BACKGROUND_SLOTS', '1'))
+
+_in_worker = False  # True inside a pool process
+_local = threading.local()
+
+def _init_worker():
+    """Pool process initializer: mark the process and lower its CPU priority."""
+    global _in_worker
+    _in_worker = True
+    if hasattr(os, 'nice') and BACKGROUND_NICENESS:
+        try:
+            os.nice(BACKGROUND_NICENESS)
+        except OSError as e:
+            print(f"Could not lower background worker priority: {e}")
+
+def _run_inline(fn, args, kwargs):
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def _new_class_stats():
+    return {
+        "submitted": 0,
+        "completed": 0,
+        "failed": 0,
+        "queued": 0,
+        "running": 0,
+        "max_queued": 0,
+        "wait_seconds": 0.0,
+        "max_wait_seconds": 0.0,
+        "run_seconds": 0.0
+    }
+
+class WorkScheduler:
+    def __init__(self, workers=BACKGROUND_WORKERS):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._queue = []  # (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._running = 0
+        self._interactive = 0
+        self._stats = {name: _new_class_stats() for name in PRIORITY_CLASSES}
+        self._interactive_requests = 0
+        self._max_interactive = 0
+        self._last_interactive = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._pool
+
+    def in_interactive_request(self):
+        return getattr(_local, 'interactive', 0) > 0
+
+    def begin_interactive(self):
+        """Mark the calling thread as serving an interactive request."""
+        _local.interactive = getattr(_local, 'interactive', 0) + 1
+        with self._lock:
+            self._interactive += 1
+            self._interactive_requests += 1
+            self._max_interactive = max(self._max_interactive, self._interactive)
+
+    def end_interactive(self):
+        _local.interactive = max(0, getattr(_local, 'interactive', 0) - 1)
+        with self._lock:
+            self._interactive -= 1
+            self._last_interactive = time.time()
+        self._dispatch()
+
+    def idle_seconds(self):
+        """Seconds since the last interactive request of this process finished; 0 while one is in flight."""
+        with self._lock:
+            if self._interactive > 0:
+                return 0.0
+            return time.time() - self._last_interactive
+
+    def submit(self, job_class, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) and return a Future. fn and its arguments must be
+        picklable for background classes. Work submitted while serving an interactive request
+        is interactive, whatever its class: it runs at once in the calling thread.
+        """
+        if job_class not in _PRIORITY:
+            raise ValueError(f"Unknown job class: {job_class}")
+        if _in_worker or not WORK_SCHEDULER:
+            return _run_inline(fn, args, kwargs)
+        if job_class == 'interactive' or self.in_interactive_request():
+            return self._run_interactive(fn, args, kwargs)
+        if profiler.active():
+            # Sampled in the pool process too, as part of the submitting request's profile if any
+            fn, args = profiler.profiled_job(fn, args)
+
+        job = {
+            "class": job_class,
+            "fn": fn,
+            "args": args,
+            "kwargs": kwargs,
+            "future": Future(),
+            "submitted": time.perf_counter()
+        }
+        with self._lock:
+            stats = self._stats[job_class]
+            stats["submitted"] += 1
+            stats["queued"] += 1
+            stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+            heapq.heappush(self._queue, (_PRIORITY[job_class], next(self._sequence), job))
+        self._dispatch()
+        return job["future"]
+
+    def run(self, job_class, fn, *args, **kwargs):
+        """Submit and wait for the result."""
+        return self.submit(job_class, fn, *args, **kwargs).result()
+
+    def _run_interactive(self, fn, args, kwargs):
+        stats = self._stats["interactive"]
+        with self._lock:
+            stats["submitted"] += 1
+        started = time.perf_counter()
+        future = _run_inline(fn, args, kwargs)
+        with self._lock:
+            stats["run_seconds"] += time.perf_counter() - started
+            stats["failed" if future.exception() is not None else "completed"] += 1
+        return future
+
+    def _dispatch(self):
+        """Start queued jobs while the pool has room, most urgent class first."""
+        started = []
+        failed = []
+        with self._lock:
+            while self._queue and self._running < self.workers:
+                if self._interactive > 0 and self._running >= BUSY_BACKGROUND_SLOTS:
+                    break  # held back until the interactive requests are done
+                _, _, job = heapq.heappop(self._queue)
+                stats = self._stats[job["class"]]
+                stats["queued"] -= 1
+                if not job["future"].set_running_or_notify_cancel():
+                    continue
+
+                wait = time.perf_counter() - job["submitted"]
+                stats["wait_seconds"] += wait
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+                stats["running"] += 1
+                self._running += 1
+                job["started"] = time.perf_counter()
+                try:
+                    started.append((job, self._get_pool().submit(job["fn"], *job["args"], **job["kwargs"])))
+                except Exception as e:
+                    self._record_finish(job, failed=True)
+                    failed.append((job, e))
+
+        # Futures are resolved outside the lock: their callbacks may submit more work
+        for job, e in failed:
+            job["future"].set_exception(e)
+        for job, pool_future in started:
+            pool_future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _record_finish(self, job, failed):
+        """Update the counters of a finished job (the scheduler lock is held)."""
+        stats = self._stats[job["class"]]
+        stats["running"] -= 1
+        stats["run_seconds"] += time.perf_counter() - job["started"]
+        stats["failed" if failed else "completed"] += 1
+        self._running -= 1
+
+    def _on_done(self, job, pool_future):
+        exception = pool_future.exception()
+        with self._lock:
+            self._record_finish(job, failed=exception is not None)
+        if exception is not None:
+            job["future"].set_exception(exception)
+        else:
+            job["future"].set_result(pool_future.result())
+        self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            classes = {}
+            for name, stats in self._stats.items():
+                started = stats["completed"] + stats["failed"] + stats["running"]
+                classes[name] = dict(
+                    stats,
+                    wait_seconds=round(stats["wait_seconds"], 3),
+                    max_wait_seconds=round(stats["max_wait_seconds"], 3),
+                    run_seconds=round(stats["run_seconds"], 3),
+                    avg_wait_ms=round(stats["wait_seconds"] * 1000 / started, 1) if started else 0.0
+                )
+            classes["interactive"]["requests"] = self._interactive_requests
+            classes["interactive"]["in_flight"] = self._interactive
+            classes["interactive"]["max_in_flight"] = self._max_interactive
+            return {
+                "enabled": WORK_SCHEDULER,
+                "workers": self.workers,
+                "busy_background_slots": BUSY_BACKGROUND_SLOTS,
+                "niceness": BACKGROUND_NICENESS,
+                "running": self._running,
+                "classes": classes
+            }
+
+scheduler = WorkScheduler()